@@ -0,0 +1,182 @@
+import time
+import asyncio
+import threading
+from latency_stats import percentile, format_seconds
+
+DEFAULT_INITIAL_CONCURRENCY = 4
+DEFAULT_MIN_CONCURRENCY = 1
+DEFAULT_MAX_CONCURRENCY = 64
+
+# Back off when the median latency of a window exceeds the best window median by this factor
+DEFAULT_LATENCY_THRESHOLD = 2.0
+
+DEFAULT_DECREASE_FACTOR = 0.5
+
+
+class AIMDController:
+    """
+    Additive-increase/multiplicative-decrease limit on the number of in-flight requests.
+
+    Requests are grouped into windows of `limit` completions (one round trip at the current
+    concurrency). After a clean window the limit grows by one; after a window with throttled
+    requests or with a median latency above latency_threshold times the best window median
+    seen so far, it is multiplied by decrease_factor. Requests started before the last decrease
+    are left out of the windows, so one congestion event only halves the limit once.
+
+    Use it like a semaphore, from threads (with controller:) or from async code in one
+    event loop (async with controller:). Each window is logged with the chosen concurrency
+    and the achieved RPS.
+    """
+
+    def __init__(self, initial=DEFAULT_INITIAL_CONCURRENCY, minimum=DEFAULT_MIN_CONCURRENCY,
+                 maximum=DEFAULT_MAX_CONCURRENCY, latency_threshold=DEFAULT_LATENCY_THRESHOLD,
+                 decrease_factor=DEFAULT_DECREASE_FACTOR, throttle_counter=None, verbose=True):
+        """
+        Args:
+            initial (int): Starting concurrency
+            minimum (int): Lowest concurrency
+            maximum (int): Highest concurrency
+            latency_threshold (float): Latency inflation factor that counts as congestion
+            decrease_factor (float): Factor applied to the limit on congestion
+            throttle_counter (callable): Returns the cumulative number of throttled (429) responses,
+                e.g. lambda: rate_limiter_for(model).stats["throttled"]
+            verbose (bool): Whether to print every window
+        """
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_threshold = latency_threshold
+        self.decrease_factor = decrease_factor
+        self.throttle_counter = throttle_counter
+        self.verbose = verbose
+
+        self.in_flight = 0
+        self.completed = 0
+        self.baseline_latency = None
+        self.history = []
+        self._last_decrease = 0
+
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._async_condition = None
+        self._start_time = time.monotonic()
+        self._start_local = threading.local()
+        self._async_starts = {}
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_latencies = []
+        self._window_errors = 0
+        self._window_start = time.monotonic()
+        self._window_throttled_start = self.throttle_counter() if self.throttle_counter else 0
+
+    def _record(self, started, failed):
+        """Record a finished request and adjust the limit at the end of a window (lock held)"""
+        self.in_flight -= 1
+        self.completed += 1
+        if started < self._last_decrease:
+            return
+
+        self._window_latencies.append(time.monotonic() - started)
+        if failed:
+            self._window_errors += 1
+
+        if len(self._window_latencies) < self.limit:
+            return
+
+        now = time.monotonic()
+        duration = max(now - self._window_start, 1e-9)
+        median = percentile(self._window_latencies, 50)
+        throttled = (self.throttle_counter() - self._window_throttled_start) if self.throttle_counter else 0
+
+        if self.baseline_latency is None or median < self.baseline_latency:
+            self.baseline_latency = median
+
+        inflated = median > self.baseline_latency * self.latency_threshold
+        previous_limit = self.limit
+        if throttled > 0 or self._window_errors > 0 or inflated:
+            self.limit = max(self.minimum, int(self.limit * self.decrease_factor))
+            self._last_decrease = now
+            action = "decrease"
+        else:
+            self.limit = min(self.maximum, self.limit + 1)
+            action = "increase"
+
+        entry = {
+            "elapsed": now - self._start_time,
+            "concurrency": previous_limit,
+            "next_concurrency": self.limit,
+            "rps": len(self._window_latencies) / duration,
+            "p50_latency": median,
+            "throttled": throttled,
+            "errors": self._window_errors,
+            "action": action
+        }
+        self.history.append(entry)
+        if self.verbose:
+            print(f"[AIMD] t={entry['elapsed']:.1f}s concurrency {previous_limit} -> {self.limit} "
+                  f"({action}), {entry['rps']:.2f} RPS, p50 {format_seconds(median)}, "
+                  f"{throttled} throttled, {self._window_errors} errors")
+
+        self._reset_window()
+
+    # Thread interface
+
+    def __enter__(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+        self._start_local.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with self._condition:
+            self._record(self._start_local.start, exc_type is not None)
+            self._condition.notify_all()
+        return False
+
+    # Async interface (for one event loop)
+
+    async def __aenter__(self):
+        if self._async_condition is None:
+            self._async_condition = asyncio.Condition()
+        async with self._async_condition:
+            await self._async_condition.wait_for(lambda: self.in_flight < self.limit)
+            with self._lock:
+                self.in_flight += 1
+        self._async_starts[asyncio.current_task()] = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        started = self._async_starts.pop(asyncio.current_task())
+        with self._lock:
+            self._record(started, exc_type is not None)
+        async with self._async_condition:
+            self._async_condition.notify_all()
+        return False
+
+    def summary(self):
+        """
+        Summarize the run.
+
+        Returns:
+            dict: Completed requests, overall RPS, final and mean concurrency, and the per-window history
+        """
+        elapsed = time.monotonic() - self._start_time
+        concurrencies = [entry["concurrency"] for entry in self.history]
+        return {
+            "completed": self.completed,
+            "elapsed": elapsed,
+            "rps": self.completed / elapsed if elapsed > 0 else 0,
+            "final_concurrency": self.limit,
+            "mean_concurrency": sum(concurrencies) / len(concurrencies) if concurrencies else self.limit,
+            "history": self.history
+        }
+
+    def print_summary(self):
+        """Print the achieved RPS and the chosen concurrency levels"""
+        summary = self.summary()
+        print(f"AIMD: {summary['completed']} requests in {summary['elapsed']:.1f}s "
+              f"({summary['rps']:.2f} RPS), mean concurrency {summary['mean_concurrency']:.1f}, "
+              f"final concurrency {summary['final_concurrency']}")
@@ -0,0 +1,193 @@
+import json
+import time
+from response_cache import ResponseCache
+
+# Endpoint every request in the batch input file is sent to
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# Batch statuses after which polling stops
+TERMINAL_STATUSES = ["completed", "failed", "expired", "cancelled"]
+
+
+def request_custom_id(request):
+    """
+    Get the custom_id of a request in a batch: its response cache key.
+
+    The ID depends only on the request body, so the results of a resumed batch are joined to the
+    requests they answer even if the requests to send changed since it was submitted.
+    """
+    return ResponseCache.make_key(request)
+
+
+def build_batch_input(requests, input_file):
+    """
+    Write chat completion requests to a Batch API input JSONL file.
+
+    Each line gets the request_custom_id of its request, so the results can be joined back
+    to the requests; identical requests are sent once.
+
+    Args:
+        requests (list): List of chat completion request bodies (model, messages, sampling params)
+        input_file (str): Path of the JSONL file to write
+
+    Returns:
+        str: Path of the written file
+    """
+    written = set()
+    with open(input_file, 'w') as f:
+        for request in requests:
+            custom_id = request_custom_id(request)
+            if custom_id in written:
+                continue
+            written.add(custom_id)
+            line = {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": request
+            }
+            f.write(json.dumps(line) + '\n')
+
+    return input_file
+
+
+def submit_batch(client, input_file, metadata=None):
+    """
+    Upload a batch input file and create a batch for it.
+
+    Args:
+        client (openai.OpenAI): OpenAI client (or a client pointed at a local stand-in)
+        input_file (str): Path of the Batch API input JSONL file
+        metadata (dict): Optional metadata to attach to the batch
+
+    Returns:
+        str: The batch ID
+    """
+    with open(input_file, "rb") as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+
+    print(f"Batch input file uploaded: {uploaded.id}")
+
+    batch_params = {
+        "input_file_id": uploaded.id,
+        "endpoint": BATCH_ENDPOINT,
+        "completion_window": "24h"
+    }
+    if metadata:
+        batch_params["metadata"] = metadata
+
+    batch = client.batches.create(**batch_params)
+
+    print(f"Batch created: {batch.id} (status: {batch.status})")
+    return batch.id
+
+
+def wait_for_batch(client, batch_id, poll_interval=30, timeout=None):
+    """
+    Poll a batch until it reaches a terminal status.
+
+    Args:
+        client (openai.OpenAI): OpenAI client
+        batch_id (str): The batch ID
+        poll_interval (float): Seconds to wait between status checks
+        timeout (float): Optional maximum number of seconds to wait
+
+    Returns:
+        Batch: The batch object in its last observed status
+    """
+    start_time = time.time()
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts:
+            print(f"Batch status: {batch.status} ({counts.completed}/{counts.total} completed, {counts.failed} failed)")
+        else:
+            print(f"Batch status: {batch.status}")
+
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+
+        if timeout is not None and time.time() - start_time > timeout:
+            print(f"Timed out after {timeout}s waiting for batch {batch_id}")
+            return batch
+
+        time.sleep(poll_interval)
+
+
+def response_content(body):
+    """Get the response text of a chat completion response body"""
+    return body["choices"][0]["message"]["content"]
+
+
+def download_batch_results(client, batch, requests, parse_body=response_content):
+    """
+    Download the output and error files of a batch and join them to the requests by custom_id.
+
+    Args:
+        client (openai.OpenAI): OpenAI client
+        batch (Batch): A batch in a terminal status
+        requests (list): Chat completion request bodies to get the results of
+        parse_body (callable): Turns a chat completion response body (dict) into the returned value
+
+    Returns:
+        list: Parsed response (by default the response text) for each request in order; failed
+            requests and requests the batch has no result for get an "Error: ..." string, like
+            send_prompt_to_gpt returns
+    """
+    results = {}
+
+    for file_id in [batch.error_file_id, batch.output_file_id]:
+        if not file_id:
+            continue
+
+        content = client.files.content(file_id).text
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+
+            result = json.loads(line)
+            response = result.get("response") or {}
+
+            if result.get("error"):
+                results[result["custom_id"]] = f"Error: {result['error'].get('message', result['error'])}"
+            elif response.get("status_code") != 200:
+                results[result["custom_id"]] = f"Error: status code {response.get('status_code')}"
+            else:
+                results[result["custom_id"]] = parse_body(response["body"])
+
+    custom_ids = [request_custom_id(request) for request in requests]
+    unmatched = len(set(results) - set(custom_ids))
+    if unmatched:
+        # The batch was submitted for other requests (e.g. resumed with other settings); their results are dropped
+        print(f"Ignored {unmatched} results of batch {batch.id} that answer none of the requests")
+    return [results.get(custom_id, f"Error: no result in batch {batch.id}") for custom_id in custom_ids]
+
+
+def run_batch(client, requests, input_file, poll_interval=30, batch_id=None, parse_body=response_content):
+    """
+    Run chat completion requests through the Batch API and return their responses.
+
+    Args:
+        client (openai.OpenAI): OpenAI client
+        requests (list): List of chat completion request bodies
+        input_file (str): Path of the batch input JSONL file to write
+        poll_interval (float): Seconds to wait between status checks
+        batch_id (str): ID of an already submitted batch to resume polling; requests it was not
+            submitted for get an "Error: ..." result
+        parse_body (callable): Turns a chat completion response body (dict) into the returned value
+
+    Returns:
+        list: Parsed response (by default the response text) for each request in input order
+    """
+    if batch_id is None:
+        build_batch_input(requests, input_file)
+        print(f"Batch input with {len(requests)} requests written to {input_file}")
+        batch_id = submit_batch(client, input_file)
+    else:
+        print(f"Resuming batch {batch_id}")
+
+    batch = wait_for_batch(client, batch_id, poll_interval=poll_interval)
+    if batch.status != "completed":
+        print(f"Batch did not complete successfully. Status: {batch.status}")
+
+    return download_batch_results(client, batch, requests, parse_body)
@@ -0,0 +1,153 @@
+import json
+import time
+import random
+import string
+import argparse
+
+from intent_extractor import extract_intention, MIN_INTENTION, MAX_INTENTION
+from messages_mappings100 import intention_names
+
+# Expected extractions for known response formats
+CORPUS_FILE = "intent_extractor_corpus.jsonl"
+
+# Response templates the models produce, from the bare number the prompt asks for to verbose answers
+RESPONSE_TEMPLATES = [
+    "{number}",
+    "{number}\n",
+    "INTENTION: #{number} - {name}\nThe guest is asking about this service.",
+    "#{number} - {name}",
+    "The primary intention is #{number} ({name}).",
+    "{number} - {name}",
+]
+
+
+def load_corpus(corpus_file=CORPUS_FILE):
+    """Load the (response, expected) cases from the corpus file"""
+    with open(corpus_file, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check_corpus(corpus_file=CORPUS_FILE):
+    """
+    Check the extractor against every case of the corpus.
+
+    Returns:
+        int: Number of failed cases
+    """
+    cases = load_corpus(corpus_file)
+    failures = 0
+    for case in cases:
+        extracted = extract_intention(case["response"])
+        if extracted != case["expected"]:
+            failures += 1
+            print(f"FAIL: {case['response']!r} -> {extracted!r}, expected {case['expected']!r}")
+
+    print(f"Corpus: {len(cases) - failures}/{len(cases)} cases passed")
+    return failures
+
+
+def random_response(rng, cases):
+    """Generate a random response by mutating a corpus case or building one from random pieces"""
+    choice = rng.random()
+    if choice < 0.4:
+        # Mutate a known response: insert, delete or replace characters
+        chars = list(rng.choice(cases)["response"])
+        for _ in range(rng.randint(1, 5)):
+            position = rng.randint(0, len(chars))
+            operation = rng.random()
+            if operation < 0.4:
+                chars.insert(position, rng.choice(string.printable + "#-:٠١٢３"))
+            elif chars and operation < 0.7:
+                del chars[min(position, len(chars) - 1)]
+            elif chars:
+                chars[min(position, len(chars) - 1)] = rng.choice(string.digits + "#")
+        return "".join(chars)
+
+    if choice < 0.7:
+        # Numbers far outside of the valid range in known templates
+        number = rng.choice([0, -1, 41, 99, 100, 10 ** rng.randint(3, 30)])
+        return rng.choice(RESPONSE_TEMPLATES).format(number=number, name="Unknown")
+
+    # Random printable noise
+    return "".join(rng.choice(string.printable) for _ in range(rng.randint(0, 200)))
+
+
+def fuzz(iterations, seed=42, corpus_file=CORPUS_FILE):
+    """
+    Run the extractor on random inputs and check that it never raises and never returns an
+    out-of-range number.
+
+    Returns:
+        int: Number of invalid results
+    """
+    rng = random.Random(seed)
+    cases = load_corpus(corpus_file)
+    invalid = 0
+    for _ in range(iterations):
+        response = random_response(rng, cases)
+        try:
+            extracted = extract_intention(response)
+        except Exception as e:
+            invalid += 1
+            print(f"FAIL: {response!r} raised {e!r}")
+            continue
+
+        if extracted is not None and not (MIN_INTENTION <= int(extracted) <= MAX_INTENTION
+                                          and extracted == str(int(extracted))):
+            invalid += 1
+            print(f"FAIL: {response!r} -> {extracted!r} is not a valid intention")
+
+    print(f"Fuzz: {iterations - invalid}/{iterations} random inputs handled correctly")
+    return invalid
+
+
+def benchmark(num_responses, seed=42):
+    """
+    Measure the extraction throughput on synthetic responses, per response format.
+
+    Returns:
+        dict: Template -> responses per second
+    """
+    rng = random.Random(seed)
+    throughput = {}
+    for template in RESPONSE_TEMPLATES:
+        responses = []
+        for _ in range(num_responses):
+            number = rng.randint(MIN_INTENTION, MAX_INTENTION)
+            responses.append(template.format(number=number, name=intention_names[number]))
+
+        start_time = time.perf_counter()
+        for response in responses:
+            extract_intention(response)
+        elapsed = time.perf_counter() - start_time
+
+        throughput[template] = num_responses / elapsed if elapsed > 0 else float("inf")
+        print(f"{throughput[template]:>12,.0f} responses/s  {template!r}")
+
+    return throughput
+
+
+def main():
+    """
+    Main function to parse arguments and run the checks and the benchmark
+    """
+    parser = argparse.ArgumentParser(description='Intent extractor corpus check, fuzzing and throughput benchmark')
+    parser.add_argument('--fuzz', type=int, default=100000, help='Number of random inputs (default: 100000)')
+    parser.add_argument('--responses', type=int, default=100000,
+                        help='Number of responses per format for the benchmark (default: 100000)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+
+    args = parser.parse_args()
+
+    failures = check_corpus()
+    failures += fuzz(args.fuzz, args.seed)
+
+    print("\nThroughput:")
+    benchmark(args.responses, args.seed)
+
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from types import SimpleNamespace
+from datetime import datetime
+
+# The API clients are created when openai_ft and openai_eval are imported, but the benchmark never calls the API
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from create_jsonl import create_jsonl
+from openai_ft import load_test_examples
+from openai_eval import aggregate_results, save_results
+from intent_extractor import extract_intention, MIN_INTENTION, MAX_INTENTION
+import messages_mappings100
+import messages_mappings200
+import messages_mappings200_2
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+RESULTS_DIR = "bench_results"
+
+# Response formats the intention is extracted from: the number-only prompt, the verbose prompt and structured output
+RESPONSE_FORMATS = {
+    "bare": "{number}",
+    "verbose": "INTENTION: #{number} - {name}\nThe guest's message points to this request, as it is the most actionable need mentioned.",
+    "json": "{{\"intention\": \"{number}\"}}",
+}
+
+
+def synthetic_messages(num_records, seed=42):
+    """
+    Build synthetic labelled guest messages by sampling the messages of the mapping files.
+
+    Returns:
+        tuple: (messages, mappings)
+    """
+    rng = random.Random(seed)
+    pool = (messages_mappings100.vague_messages + messages_mappings200.vague_messages
+            + messages_mappings200_2.vague_messages)
+    messages = [f"{rng.choice(pool)} (#{i})" for i in range(num_records)]
+    mappings = [rng.randint(MIN_INTENTION, MAX_INTENTION) for _ in range(num_records)]
+    return messages, mappings
+
+
+def synthetic_responses(num_records, response_format, seed=42):
+    """Build synthetic model responses in one of RESPONSE_FORMATS"""
+    rng = random.Random(seed)
+    template = RESPONSE_FORMATS[response_format]
+    names = messages_mappings100.intention_names
+    responses = []
+    for _ in range(num_records):
+        number = rng.randint(MIN_INTENTION, MAX_INTENTION)
+        responses.append(template.format(number=number, name=names[number]))
+    return responses
+
+
+def synthetic_output_items(num_records, seed=42):
+    """Build synthetic eval output items with the attributes analyze_results reads from the API objects"""
+    messages, mappings = synthetic_messages(num_records, seed)
+    rng = random.Random(seed + 1)
+    items = []
+    for i, (message, mapping) in enumerate(zip(messages, mappings)):
+        # About 80% of the answers are correct
+        answer = mapping if rng.random() < 0.8 else rng.randint(MIN_INTENTION, MAX_INTENTION)
+        items.append(SimpleNamespace(
+            id=f"outputitem-{i}",
+            datasource_item={"input_text": message, "correct_label": str(mapping)},
+            sample=SimpleNamespace(output=[SimpleNamespace(content=str(answer))])
+        ))
+    return items
+
+
+def stages(workdir, seed=42):
+    """
+    Get the benchmarked stages of the pipeline.
+
+    Each stage is (name, setup, run): setup(num_records) builds the input outside of the
+    measurement and run(input) is the measured work.
+
+    Args:
+        workdir (str): Directory for the files the stages write and read
+        seed (int): Random seed of the synthetic data
+
+    Returns:
+        list: The stages
+    """
+    jsonl_file = os.path.join(workdir, "examples.jsonl")
+    results_file = os.path.join(workdir, "eval_results.json")
+
+    def setup_jsonl_file(num_records):
+        messages, mappings = synthetic_messages(num_records, seed)
+        create_jsonl(jsonl_file, messages, mappings)
+        return jsonl_file
+
+    def setup_aggregated(num_records):
+        return aggregate_results("run-benchmark", synthetic_output_items(num_records, seed))
+
+    pipeline = [
+        ("create_jsonl",
+         lambda n: synthetic_messages(n, seed),
+         lambda data: create_jsonl(jsonl_file, *data)),
+        ("ft_load_examples",
+         setup_jsonl_file,
+         load_test_examples),
+    ]
+    for response_format in RESPONSE_FORMATS:
+        pipeline.append((f"extract_{response_format}",
+                         lambda n, response_format=response_format: synthetic_responses(n, response_format, seed),
+                         lambda responses: [extract_intention(response) for response in responses]))
+    pipeline += [
+        ("eval_aggregate",
+         lambda n: synthetic_output_items(n, seed),
+         lambda items: aggregate_results("run-benchmark", items)),
+        ("eval_save",
+         setup_aggregated,
+         lambda results: save_results(results, results_file)),
+    ]
+    return pipeline
+
+
+def measure(setup, run, num_records):
+    """
+    Measure the wall time and the peak memory of one stage.
+
+    The stage runs twice on fresh input: once untraced for the time and once under tracemalloc
+    for the peak memory it allocates on top of its input.
+
+    Returns:
+        dict: seconds, records_per_second and peak_bytes
+    """
+    data = setup(num_records)
+    start_time = time.perf_counter()
+    run(data)
+    elapsed = time.perf_counter() - start_time
+    del data
+
+    data = setup(num_records)
+    tracemalloc.start()
+    run(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+
+    return {
+        "seconds": elapsed,
+        "records_per_second": num_records / elapsed if elapsed > 0 else None,
+        "peak_bytes": peak
+    }
+
+
+def git_commit():
+    """Get the commit hash of the working tree, or None outside of a git checkout"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_bytes(value):
+    """Format a number of bytes for reports"""
+    for unit in ["B", "KB", "MB"]:
+        if abs(value) < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} GB"
+
+
+def print_comparison(results, baseline):
+    """Print the time and peak memory of every measurement relative to a previous run"""
+    previous = {(m["stage"], m["records"]): m for m in baseline["measurements"]}
+    print(f"\nCompared with {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    print(f"{'Stage':<18} {'Records':>9} {'Time':>8} {'Peak memory':>12}")
+    for measurement in results["measurements"]:
+        before = previous.get((measurement["stage"], measurement["records"]))
+        if before is None:
+            continue
+        time_ratio = measurement["seconds"] / before["seconds"] if before["seconds"] else float("nan")
+        memory_ratio = measurement["peak_bytes"] / before["peak_bytes"] if before["peak_bytes"] else float("nan")
+        print(f"{measurement['stage']:<18} {measurement['records']:>9,} {time_ratio:>7.2f}x {memory_ratio:>11.2f}x")
+
+
+def main():
+    """
+    Main function to parse arguments and run the pipeline benchmark
+    """
+    parser = argparse.ArgumentParser(description='Time and peak memory of the CPU-side pipeline on synthetic records')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Numbers of synthetic records (default: 1000 100000 1000000)')
+    parser.add_argument('--stages', type=str, nargs='+', help='Only run these stages (default: all)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--compare', type=str, help='Previous results file to compare with')
+    parser.add_argument('--output', type=str, help=f'Results file (default: {RESULTS_DIR}/pipeline_<commit>_<timestamp>.json)')
+
+    args = parser.parse_args()
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results = {
+        "commit": git_commit(),
+        "timestamp": timestamp,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "measurements": []
+    }
+
+    print(f"{'Stage':<18} {'Records':>9} {'Time':>9} {'Records/s':>12} {'Peak memory':>12}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, setup, run in stages(workdir, args.seed):
+            if args.stages and name not in args.stages:
+                continue
+            for num_records in args.sizes:
+                measurement = measure(setup, run, num_records)
+                results["measurements"].append(dict(stage=name, records=num_records, **measurement))
+                print(f"{name:<18} {num_records:>9,} {measurement['seconds']:>8.3f}s "
+                      f"{measurement['records_per_second'] or float('inf'):>12,.0f} "
+                      f"{format_bytes(measurement['peak_bytes']):>12}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            print_comparison(results, json.load(f))
+
+    results_file = args.output
+    if results_file is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        results_file = os.path.join(RESULTS_DIR, f"pipeline_{results['commit'] or 'nogit'}_{timestamp}.json")
+    with open(results_file, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\nResults saved to {results_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import time
+from intent_extractor import extract_intention
+from intent_distribution import LOGPROB_PARAMS, intent_distribution
+from classification_modes import FREE_MAX_TOKENS
+from self_consistency import majority_vote, sample_texts
+from rate_limiter import create_chat_completion
+from prompt_cache import cached_tokens_of, request_cost
+from create_jsonl import prompt_messages
+
+# The fine-tuned mini model answers first; only messages it is unsure about go to the large model
+DEFAULT_PRIMARY_MODEL = "ft:gpt-4o-mini-2024-07-18:personal:sft400:BUKolthG"
+DEFAULT_FALLBACK_MODEL = "gpt-4.1"
+
+# How the confidence of the primary model is measured:
+#   logprobs  - probability of the answered label from the token log probabilities (one request)
+#   agreement - share of AGREEMENT_SAMPLES samples that agree on the label (one request with n)
+CONFIDENCE_METHODS = ["logprobs", "agreement"]
+AGREEMENT_SAMPLES = 5
+AGREEMENT_TEMPERATURE = 1.0
+
+DEFAULT_THRESHOLD = 0.8
+
+
+def classify_with_confidence(client, message, model, method="logprobs", prompt_style="full"):
+    """
+    Classify a message with one model and measure how confident the model is.
+
+    Args:
+        client (openai.OpenAI): OpenAI client
+        message (str): Guest message
+        model (str): The model to use
+        method (str): One of CONFIDENCE_METHODS
+        prompt_style (str): Instructions sent with the message, see create_jsonl.PROMPT_STYLES
+
+    Returns:
+        dict: model, label (None if no valid label was answered), confidence in 0..1, latency (seconds),
+            cost (USD, None for unknown models), prompt_tokens and completion_tokens
+    """
+    request = {
+        "model": model,
+        "messages": prompt_messages(message, prompt_style),
+        "max_tokens": FREE_MAX_TOKENS
+    }
+    if method == "logprobs":
+        request.update(LOGPROB_PARAMS)
+        request["seed"] = 42
+    elif method == "agreement":
+        request.update(n=AGREEMENT_SAMPLES, temperature=AGREEMENT_TEMPERATURE)
+    else:
+        raise ValueError(f"Unknown confidence method: {method}. Choose from {', '.join(CONFIDENCE_METHODS)}")
+
+    start_time = time.perf_counter()
+    response = create_chat_completion(client, request)
+    latency = time.perf_counter() - start_time
+
+    if method == "logprobs":
+        content = response.choices[0].message.content
+        label = extract_intention(content)
+        logprobs = response.model_dump()["choices"][0].get("logprobs") or {}
+        distribution = intent_distribution(logprobs.get("content"))
+        # Probability of the answered label among all tokens, so mass on non-label tokens lowers it
+        confidence = 0.0
+        if distribution and label is not None:
+            confidence = distribution["probabilities"][int(label) - 1] * distribution["label_mass"]
+    else:
+        vote = majority_vote(sample_texts(response))
+        label, confidence = vote["label"], vote["vote_share"]
+
+    prompt_tokens, cached_tokens = cached_tokens_of(response.usage)
+    completion_tokens = response.usage.completion_tokens if response.usage else 0
+    return {
+        "model": model,
+        "label": label,
+        "confidence": confidence,
+        "latency": latency,
+        "cost": request_cost(model, prompt_tokens, completion_tokens, cached_tokens),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens
+    }
+
+
+def route(client, message, threshold=DEFAULT_THRESHOLD, primary_model=DEFAULT_PRIMARY_MODEL,
+          fallback_model=DEFAULT_FALLBACK_MODEL, method="logprobs", prompt_style="full"):
+    """
+    Classify a message with the primary model and escalate to the fallback model below the confidence threshold.
+
+    Args:
+        client (openai.OpenAI): OpenAI client
+        message (str): Guest message
+        threshold (float): Lowest confidence of the primary model that is answered without escalating
+        primary_model (str): Cheap model asked first
+        fallback_model (str): Large model asked for the hard messages
+        method (str): One of CONFIDENCE_METHODS, for the primary model
+        prompt_style (str): Instructions sent to the primary model (the fallback always gets the full prompt)
+
+    Returns:
+        dict: label, escalated, latency and cost of both stages together, and the primary and fallback results
+    """
+    primary = classify_with_confidence(client, message, primary_model, method, prompt_style)
+    if primary["label"] is not None and primary["confidence"] >= threshold:
+        return dict(blend(primary, None), primary=primary, fallback=None)
+
+    fallback = classify_with_confidence(client, message, fallback_model, "logprobs")
+    return dict(blend(primary, fallback), primary=primary, fallback=fallback)
+
+
+def blend(primary, fallback):
+    """
+    Combine the results of the primary and, if escalated, the fallback model.
+
+    The fallback label wins; if the fallback gave no valid label the primary label is kept.
+    Latency and cost add up, since the fallback is only asked after the primary answered.
+    """
+    if fallback is None:
+        return {"label": primary["label"], "escalated": False, "latency": primary["latency"], "cost": primary["cost"]}
+
+    costs = [primary["cost"], fallback["cost"]]
+    return {
+        "label": fallback["label"] if fallback["label"] is not None else primary["label"],
+        "escalated": True,
+        "latency": primary["latency"] + fallback["latency"],
+        "cost": sum(costs) if None not in costs else None
+    }
@@ -0,0 +1,247 @@
+import time
+import threading
+from collections import deque
+
+# Circuit breaker in front of the calls to one model:
+#   closed    - calls go to the model; the outcome of the last `window` calls is tracked
+#   open      - the error rate or the share of slow calls got too high: calls are not sent and the
+#               caller's fallback answers at once, so an outage does not cost a timeout per guest message
+#   half_open - after open_seconds a few probe calls go to the model; if they all succeed in time the
+#               breaker closes, a failed or slow probe opens it again
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+DEFAULT_WINDOW = 20
+DEFAULT_MIN_CALLS = 5
+DEFAULT_ERROR_RATE = 0.5
+DEFAULT_SLOW_CALL = 5.0
+DEFAULT_SLOW_RATE = 0.5
+DEFAULT_OPEN_SECONDS = 30.0
+DEFAULT_PROBES = 2
+
+# Calls behind a breaker fail fast instead of retrying for a minute, so the breaker sees the failures
+BREAKER_MAX_RETRIES = 1
+BREAKER_CALL_TIMEOUT = 10.0
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is not sent because the circuit is open and no fallback was given"""
+
+
+class CircuitBreaker:
+    """
+    Per-model circuit breaker tracking the error rate and the share of slow calls.
+
+    Use allow_request() before a call and record() with its token after it, or let call() /
+    call_async() do both and answer from a fallback while the circuit is open. Thread-safe; every
+    state transition is kept with its reason and counted in the summary.
+    """
+
+    def __init__(self, name, window=DEFAULT_WINDOW, min_calls=DEFAULT_MIN_CALLS, error_rate=DEFAULT_ERROR_RATE,
+                 slow_call=DEFAULT_SLOW_CALL, slow_rate=DEFAULT_SLOW_RATE, open_seconds=DEFAULT_OPEN_SECONDS,
+                 probes=DEFAULT_PROBES, verbose=True):
+        """
+        Args:
+            name (str): Name of the protected endpoint, usually the model
+            window (int): Number of recent calls the rates are taken over
+            min_calls (int): Calls needed in the window before the breaker can open
+            error_rate (float): Share of failed calls that opens the breaker
+            slow_call (float): Seconds after which a call counts as slow
+            slow_rate (float): Share of slow calls that opens the breaker
+            open_seconds (float): Seconds the breaker stays open before probing
+            probes (int): Successful probe calls needed to close the breaker again
+            verbose (bool): Whether to print every state transition
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.verbose = verbose
+
+        self.state = CLOSED
+        # Counts the state transitions; outcomes of calls allowed under an earlier generation are stale
+        self.generation = 0
+        # (failed, slow) of the most recent calls while closed
+        self.outcomes = deque(maxlen=window)
+        self.opened_at = None
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.open_time = 0.0
+        self.transitions = []
+        self.stats = {"calls": 0, "failures": 0, "slow": 0, "rejected": 0, "probes": 0, "fallbacks": 0,
+                      "opened": 0}
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        """
+        Decide whether a call may go to the endpoint.
+
+        Returns:
+            tuple: Token of the allowed call, (generation, whether it is a probe), to pass to record()
+                or release(); None if the call is rejected
+        """
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN, f"open for {self.open_seconds:g}s, probing")
+            if self.state == CLOSED:
+                self.stats["calls"] += 1
+                return self.generation, False
+            if self.state == HALF_OPEN and self.probes_in_flight < self.probes:
+                self.probes_in_flight += 1
+                self.stats["calls"] += 1
+                self.stats["probes"] += 1
+                return self.generation, True
+            self.stats["rejected"] += 1
+            return None
+
+    def record(self, token, latency, failed=False):
+        """
+        Record the outcome of an allowed call.
+
+        A call allowed in an earlier state (e.g. while closed, finishing after the breaker opened and
+        went half-open) is counted in the stats but does not move the breaker, nor take a probe's place.
+
+        Args:
+            token (tuple): Token returned by allow_request() for the call
+            latency (float): Seconds the call took
+            failed (bool): Whether the call failed
+        """
+        slow = latency >= self.slow_call
+        generation, probe = token
+        with self.lock:
+            self.stats["failures"] += failed
+            self.stats["slow"] += slow
+
+            if generation != self.generation:
+                return
+
+            if probe:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+                if failed or slow:
+                    self._transition(OPEN, "probe failed" if failed else f"probe took {latency:.1f}s")
+                    return
+                self.probe_successes += 1
+                if self.probe_successes >= self.probes:
+                    self._transition(CLOSED, f"{self.probe_successes} probes succeeded")
+                return
+
+            self.outcomes.append((failed, slow))
+            if len(self.outcomes) < self.min_calls:
+                return
+            failures = sum(failed for failed, _ in self.outcomes) / len(self.outcomes)
+            slow_calls = sum(slow for _, slow in self.outcomes) / len(self.outcomes)
+            if failures >= self.error_rate:
+                self._transition(OPEN, f"{failures:.0%} of the last {len(self.outcomes)} calls failed")
+            elif slow_calls >= self.slow_rate:
+                self._transition(OPEN, f"{slow_calls:.0%} of the last {len(self.outcomes)} calls took "
+                                       f"over {self.slow_call:g}s")
+
+    def release(self, token):
+        """Give back the probe slot of an allowed call that ended without an outcome, e.g. was cancelled"""
+        generation, probe = token
+        with self.lock:
+            if probe and generation == self.generation:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+
+    def _transition(self, state, reason):
+        """Move to a new state (the lock is held)"""
+        now = time.monotonic()
+        if self.state == OPEN:
+            self.open_time += now - self.opened_at
+        self.transitions.append({"time": time.time(), "from": self.state, "to": state, "reason": reason})
+        if self.verbose:
+            print(f"Circuit breaker {self.name}: {self.state} -> {state} ({reason})")
+
+        self.state = state
+        self.generation += 1
+        if state == OPEN:
+            self.opened_at = now
+            self.stats["opened"] += 1
+        elif state == HALF_OPEN:
+            self.probes_in_flight = 0
+            self.probe_successes = 0
+        else:
+            self.outcomes.clear()
+
+    def call(self, send, fallback=None):
+        """
+        Call the endpoint through the breaker.
+
+        Args:
+            send (callable): Sends the call and returns its result; an exception counts as a failure
+            fallback (callable): Answers instead while the circuit is open or when the call failed
+
+        Returns:
+            The result of send, or of fallback
+
+        Raises:
+            CircuitOpenError: If the circuit is open and there is no fallback
+        """
+        token = self.allow_request()
+        if token is None:
+            return self._fall_back(fallback)
+        start_time = time.perf_counter()
+        try:
+            result = send()
+        except Exception:
+            self.record(token, time.perf_counter() - start_time, failed=True)
+            if fallback is None:
+                raise
+            return self._fall_back(fallback)
+        except BaseException:
+            self.release(token)
+            raise
+        self.record(token, time.perf_counter() - start_time)
+        return result
+
+    async def call_async(self, send, fallback=None):
+        """Async version of call: send and fallback return awaitables"""
+        token = self.allow_request()
+        if token is None:
+            return await self._fall_back(fallback)
+        start_time = time.perf_counter()
+        try:
+            result = await send()
+        except Exception:
+            self.record(token, time.perf_counter() - start_time, failed=True)
+            if fallback is None:
+                raise
+            return await self._fall_back(fallback)
+        except BaseException:
+            # Cancelled: the call has no outcome, but its probe slot must be given back
+            self.release(token)
+            raise
+        self.record(token, time.perf_counter() - start_time)
+        return result
+
+    def _fall_back(self, fallback):
+        if fallback is None:
+            raise CircuitOpenError(f"Circuit breaker of {self.name} is {self.state}")
+        with self.lock:
+            self.stats["fallbacks"] += 1
+        return fallback()
+
+    def summary(self):
+        """
+        Summarize the breaker.
+
+        Returns:
+            dict: name, current state, counters, seconds spent open and the state transitions
+        """
+        with self.lock:
+            open_time = self.open_time
+            if self.state == OPEN:
+                open_time += time.monotonic() - self.opened_at
+            return dict(self.stats, name=self.name, state=self.state, open_seconds=open_time,
+                        transitions=list(self.transitions))
+
+
+def format_breaker_summary(summary):
+    """Format the state, rejected calls and fallbacks of a breaker for reports"""
+    return (f"Circuit breaker {summary['name']}: {summary['state']}, opened {summary['opened']} times "
+            f"({summary['open_seconds']:.1f}s open), {summary['calls']} calls, {summary['failures']} failed, "
+            f"{summary['slow']} slow, {summary['rejected']} rejected, {summary['fallbacks']} answered by the fallback")
@@ -0,0 +1,119 @@
+from intent_extractor import MIN_INTENTION, MAX_INTENTION
+
+# Classification modes and how they limit the output of the model:
+#   free        - no constraint, the model may explain its answer (max_tokens=1000)
+#   short       - a few output tokens, stopping at the first newline
+#   logit_bias  - a single output token, biased towards the tokens "1".."40"
+#   json_schema - structured output with the intention as an enum of "1".."40"
+CLASSIFICATION_MODES = ["free", "short", "logit_bias", "json_schema"]
+
+FREE_MAX_TOKENS = 1000
+SHORT_MAX_TOKENS = 5
+JSON_SCHEMA_MAX_TOKENS = 20
+
+# Bias added to the label tokens in logit_bias mode (the API accepts -100..100)
+LABEL_TOKEN_BIAS = 100
+
+# Encoding used for models tiktoken does not know yet
+DEFAULT_ENCODING = "o200k_base"
+
+INTENTION_LABELS = [str(number) for number in range(MIN_INTENTION, MAX_INTENTION + 1)]
+
+INTENTION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "intent_classification",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "intention": {"type": "string", "enum": INTENTION_LABELS}
+            },
+            "required": ["intention"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# Label token IDs per encoding name, computed once
+_label_token_cache = {}
+
+
+def base_model_name(model):
+    """
+    Get the base model of a fine-tuned model name.
+
+    Args:
+        model (str): Model name, e.g. "ft:gpt-4o-mini-2024-07-18:personal:sft400:BUKolthG"
+
+    Returns:
+        str: The base model name, e.g. "gpt-4o-mini-2024-07-18"
+    """
+    if model.startswith("ft:"):
+        return model.split(":")[1]
+    return model
+
+
+def label_token_ids(model):
+    """
+    Get the token ID of every intention label "1".."40" for a model.
+
+    Requires tiktoken (pip install tiktoken).
+
+    Args:
+        model (str): Model name (fine-tuned models use the encoding of their base model)
+
+    Returns:
+        dict: Token ID -> intention label
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        raise ImportError("logit_bias mode requires tiktoken: pip install tiktoken")
+
+    try:
+        encoding = tiktoken.encoding_for_model(base_model_name(model))
+    except KeyError:
+        encoding = tiktoken.get_encoding(DEFAULT_ENCODING)
+
+    if encoding.name not in _label_token_cache:
+        token_ids = {}
+        for label in INTENTION_LABELS:
+            tokens = encoding.encode(label)
+            if len(tokens) != 1:
+                raise ValueError(f"Intention label {label} is not a single token in {encoding.name}")
+            token_ids[tokens[0]] = label
+        _label_token_cache[encoding.name] = token_ids
+
+    return _label_token_cache[encoding.name]
+
+
+def classification_params(mode, model):
+    """
+    Get the request parameters that limit the model output for a classification mode.
+
+    Args:
+        mode (str): One of CLASSIFICATION_MODES
+        model (str): The model the request is sent to
+
+    Returns:
+        dict: Parameters to merge into the chat completion request
+    """
+    if mode == "free":
+        return {"max_tokens": FREE_MAX_TOKENS}
+
+    if mode == "short":
+        return {"max_tokens": SHORT_MAX_TOKENS, "stop": ["\n"]}
+
+    if mode == "logit_bias":
+        # Every label is a single token, so one output token is enough
+        token_ids = label_token_ids(model)
+        return {
+            "max_tokens": 1,
+            "logit_bias": {str(token_id): LABEL_TOKEN_BIAS for token_id in token_ids}
+        }
+
+    if mode == "json_schema":
+        return {"max_tokens": JSON_SCHEMA_MAX_TOKENS, "response_format": INTENTION_RESPONSE_FORMAT}
+
+    raise ValueError(f"Unknown classification mode: {mode}. Choose from {', '.join(CLASSIFICATION_MODES)}")
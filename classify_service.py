@@ -0,0 +1,748 @@
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+from http import HTTPStatus
+from collections import deque
+from datetime import datetime
+import httpx
+import openai
+import local_openai_server
+from intent_extractor import extract_intention
+from classification_modes import CLASSIFICATION_MODES, classification_params
+from create_jsonl import PROMPT_STYLES, SYSTEM_PROMPT
+from prompt_cache import get_prompt_prefix
+from rate_limiter import create_chat_completion_async, print_rate_limit_stats
+from message_packing import build_packed_request, parse_packed_labels
+from latency_stats import summarize_latencies, format_seconds
+from lexical_classifier import DEFAULT_MODEL_FILE, LexicalClassifier, load_training_data
+from hedging import DEFAULT_MAX_EXTRA_RATE, HedgePolicy, format_hedging_summary, has_label
+from circuit_breaker import (BREAKER_CALL_TIMEOUT, BREAKER_MAX_RETRIES, DEFAULT_OPEN_SECONDS, DEFAULT_SLOW_CALL,
+                             CircuitBreaker, CircuitOpenError, format_breaker_summary)
+from warmup import DEFAULT_CONNECTIONS, DEFAULT_COLD_AFTER, DEFAULT_PING_INTERVAL, ModelWarmer, format_warmup_summary
+from shadow_traffic import (DEFAULT_QUEUE_SIZE, DEFAULT_SAMPLE_RATE, DEFAULT_SHADOW_CONCURRENCY, ShadowMirror,
+                            format_shadow_summary)
+from cascade_router import DEFAULT_PRIMARY_MODEL
+
+# HTTP service classifying live guest messages:
+#   POST /classify {"message": "..."} -> {"label": "16", "response": "16", "source": "ft:...", "shared": false,
+#                                          "latency": 0.41}
+#   GET  /metrics                     -> request counters, in-flight requests and p50/p99 latency
+#   GET  /health                      -> {"status": "ok"}
+# Identical messages in flight at the same time share one upstream call (single-flight), and one
+# long-lived client keeps a pool of keep-alive connections to the API warm between requests.
+
+openai_api_key = os.environ.get("OPENAI_API_KEY")
+if not openai_api_key:
+    raise ValueError("OPENAI_API_KEY environment variable is not set")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+
+# Connections kept open to the API, and how long an idle one is kept
+DEFAULT_POOL_SIZE = 20
+KEEPALIVE_EXPIRY = 60.0
+UPSTREAM_TIMEOUT = 30.0
+CONNECT_TIMEOUT = 5.0
+
+# The latency percentiles of /metrics are taken over the most recent requests
+LATENCY_WINDOW = 1000
+
+# Micro-batching: distinct messages arriving within the window are packed into one request
+DEFAULT_BATCH_WINDOW_MS = 5.0
+
+MAX_BODY_BYTES = 64 * 1024
+
+
+def create_pooled_client(base_url=None, pool_size=DEFAULT_POOL_SIZE, keepalive_expiry=KEEPALIVE_EXPIRY):
+    """
+    Create the async OpenAI client shared by all requests of the service.
+
+    Its connections are kept alive between requests, so steady traffic does not pay
+    a new TCP and TLS handshake per classification.
+
+    Args:
+        base_url (str): API base URL, None for the OpenAI API
+        pool_size (int): Maximum number of connections, all of them kept alive
+        keepalive_expiry (float): Seconds an idle connection is kept open
+
+    Returns:
+        openai.AsyncOpenAI: The client
+    """
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size,
+                            keepalive_expiry=keepalive_expiry),
+        timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=CONNECT_TIMEOUT)
+    )
+    return openai.AsyncOpenAI(api_key=openai_api_key, base_url=base_url, http_client=http_client)
+
+
+def build_classification_request(message, model, system_message=SYSTEM_PROMPT, mode="short", pad_prefix=False):
+    """
+    Build the chat completion request classifying one guest message in production, as the service sends it.
+
+    This is deliberately not the request of send_prompt_to_gpt in test_intent_4o-mini_200.py: that
+    evaluation script asks for the intention name and reasoning in free mode and adds its response cache,
+    fast path and few-shot examples. Served traffic defaults to the training prompt (SYSTEM_PROMPT) the
+    fine-tuned models learned, and to the short mode, which only needs the label.
+
+    Args:
+        message (str): Guest message
+        model (str): The model to use
+        system_message (str): The system message, or None to send only the guest message
+        mode (str): Classification mode limiting the output
+        pad_prefix (bool): Whether to pad the system message to the prompt cache threshold
+
+    Returns:
+        dict: Keyword arguments for chat.completions.create
+    """
+    if system_message is None:
+        messages = [{"role": "user", "content": message}]
+    else:
+        messages = get_prompt_prefix(system_message, pad=pad_prefix, model=model).messages(message)
+    request = {"model": model, "messages": messages}
+    request.update(classification_params(mode, model))
+    return request
+
+
+class ClassificationService:
+    """Classifies guest messages for concurrent callers with single-flight and optional micro-batching"""
+
+    def __init__(self, client, model=DEFAULT_PRIMARY_MODEL, system_message=SYSTEM_PROMPT, mode="short",
+                 pad_prefix=False, micro_batch=1, batch_window=DEFAULT_BATCH_WINDOW_MS / 1000, pool_size=None,
+                 hedge_policy=None, breaker=None, fallback_model=None, fallback_classifier=None, warmer=None,
+                 shadow=None):
+        """
+        Args:
+            client (openai.AsyncOpenAI): Pooled async client, see create_pooled_client
+            model (str): The model to use
+            system_message (str): The system message, or None to send only the guest message
+            mode (str): Classification mode limiting the output, see classification_modes
+            pad_prefix (bool): Whether to pad the system message to the prompt cache threshold
+            micro_batch (int): Most distinct messages packed into one request (1 disables micro-batching)
+            batch_window (float): Seconds the first message of a micro-batch waits for more messages
+            pool_size (int): Connection pool size of the client, reported in the metrics
+            hedge_policy (HedgePolicy): Duplicates single-message calls slower than a percentile of recent
+                latency, None to never hedge
+            breaker (CircuitBreaker): Circuit breaker of the model, None to always call the model
+            fallback_model (str): Model answering while the breaker is open
+            fallback_classifier (LexicalClassifier): Local classifier answering while the breaker is open,
+                if there is no fallback model
+            warmer (ModelWarmer): Measures the cold and warm latency of the calls to its registered models,
+                and keeps them warm while its run() task is running
+            shadow (ShadowMirror): Mirrors a sample of the classifications to a candidate model in the background
+        """
+        self.client = client
+        self.model = model
+        self.system_message = system_message
+        self.mode = mode
+        self.pad_prefix = pad_prefix
+        self.micro_batch = micro_batch
+        self.batch_window = batch_window
+        self.pool_size = pool_size
+        self.hedge_policy = hedge_policy
+        self.breaker = breaker
+        self.fallback_model = fallback_model
+        self.fallback_classifier = fallback_classifier
+        self.warmer = warmer
+        self.shadow = shadow
+
+        # Upstream call of every message in flight; callers with the same message await the same task
+        self.flights = {}
+        # Messages waiting for the current micro-batch to be sent, and the sends still running
+        self.pending = []
+        self.flush_timer = None
+        self.batch_tasks = set()
+
+        self.started = time.time()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.upstream_in_flight = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.upstream_latencies = deque(maxlen=LATENCY_WINDOW)
+        self.stats = {"requests": 0, "errors": 0, "shared": 0, "upstream_calls": 0, "upstream_errors": 0,
+                      "packed_calls": 0, "packed_messages": 0, "retried_slots": 0}
+
+    def build_request(self, message, model=None):
+        """Build the chat completion request for one guest message to a model (default: the service's model)"""
+        return build_classification_request(message, model or self.model, self.system_message, self.mode,
+                                            self.pad_prefix)
+
+    async def classify(self, message):
+        """
+        Classify a guest message.
+
+        Args:
+            message (str): Guest message
+
+        Returns:
+            dict: label (None if no valid label was answered), response text, source (the model, or
+                "local" for the local classifier), shared (whether the upstream call was shared with an
+                identical concurrent message) and latency (seconds)
+
+        Raises:
+            Exception: The error of the upstream call, after the rate limiter's retries
+        """
+        start_time = time.perf_counter()
+        self.stats["requests"] += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            task = self.flights.get(message)
+            shared = task is not None
+            if shared:
+                self.stats["shared"] += 1
+            else:
+                task = asyncio.ensure_future(self._classify_upstream(message))
+                self.flights[message] = task
+                task.add_done_callback(lambda done: self._land(message, done))
+            # A caller that goes away must not cancel the call the other callers are waiting for
+            result = await asyncio.shield(task)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+        latency = time.perf_counter() - start_time
+        self.latencies.append(latency)
+        # Mirrored once per upstream call, and only answers of the serving model are compared
+        if self.shadow is not None and not shared and result["source"] == self.model and result["label"] is not None:
+            self.shadow.offer(message, result["label"], latency)
+        return dict(result, shared=shared, latency=latency)
+
+    def _land(self, message, task):
+        """Remove a finished upstream call, so later identical messages are classified again"""
+        if self.flights.get(message) is task:
+            del self.flights[message]
+        # Mark the error as retrieved even if every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    async def _classify_upstream(self, message):
+        if self.breaker is None:
+            return await self._classify_primary(message)
+        return await self.breaker.call_async(lambda: self._classify_primary(message),
+                                             lambda: self._classify_fallback(message))
+
+    async def _classify_fallback(self, message):
+        """Classify a message while the breaker of the model is open"""
+        if self.fallback_model is not None:
+            response = await self._upstream(self.build_request(message, self.fallback_model))
+            content = response.choices[0].message.content
+            return {"label": extract_intention(content), "response": content, "source": self.fallback_model}
+        if self.fallback_classifier is not None:
+            label, _ = self.fallback_classifier.predict(message)
+            return {"label": label, "response": label, "source": "local"}
+        raise CircuitOpenError(f"Circuit breaker of {self.model} is open and there is no fallback")
+
+    async def _classify_primary(self, message):
+        if self.micro_batch <= 1:
+            return await self._send_single(message)
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((message, future))
+        if len(self.pending) >= self.micro_batch:
+            self._flush()
+        elif self.flush_timer is None:
+            self.flush_timer = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+        return await future
+
+    def _flush(self):
+        """Send the pending messages as one micro-batch"""
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send_batch(batch))
+            self.batch_tasks.add(task)
+            task.add_done_callback(self.batch_tasks.discard)
+
+    async def _send_batch(self, batch):
+        messages = [message for message, _ in batch]
+        if len(messages) == 1:
+            results = await asyncio.gather(self._send_single(messages[0]), return_exceptions=True)
+        else:
+            results = await self._send_packed(messages)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _send_packed(self, messages):
+        """
+        Classify several messages with one packed request (see message_packing).
+
+        Returns:
+            list: One result dict or exception per message; slots the packed response did not
+                answer validly are retried with one request per message
+        """
+        request = build_packed_request(messages, self.system_message, self.model, self.pad_prefix)
+        try:
+            response = await self._upstream(request)
+            labels = parse_packed_labels(response.choices[0].message.content, len(messages))
+            self.stats["packed_calls"] += 1
+            self.stats["packed_messages"] += len(messages)
+        except Exception:
+            labels = [None] * len(messages)
+
+        results = [{"label": label, "response": label, "source": self.model} if label is not None else None
+                   for label in labels]
+        retried = [i for i, result in enumerate(results) if result is None]
+        self.stats["retried_slots"] += len(retried)
+        singles = await asyncio.gather(*(self._send_single(messages[i]) for i in retried), return_exceptions=True)
+        for i, result in zip(retried, singles):
+            results[i] = result
+        return results
+
+    async def _send_single(self, message):
+        response = await self._upstream(self.build_request(message), hedged=True)
+        content = response.choices[0].message.content
+        return {"label": extract_intention(content), "response": content, "source": self.model}
+
+    async def _upstream(self, request, hedged=False):
+        """
+        Send one chat completion request through the rate limiter and record its latency.
+
+        Args:
+            request (dict): The chat completion request
+            hedged (bool): Whether the upstream call is hedged with the service's hedge policy, if it has one
+        """
+        self.stats["upstream_calls"] += 1
+        self.upstream_in_flight += 1
+        start_time = time.perf_counter()
+        client, max_retries = self.client, None
+        if self.breaker is not None and request["model"] == self.model:
+            # Behind the breaker a failing model is given up on quickly, so the breaker can open
+            client, max_retries = self.client.with_options(timeout=BREAKER_CALL_TIMEOUT), BREAKER_MAX_RETRIES
+        hedge_policy = self.hedge_policy if hedged else None
+
+        def send():
+            return create_chat_completion_async(client, request, max_retries, hedge_policy, has_label)
+
+        try:
+            response = await (self.warmer.call(request["model"], send) if self.warmer else send())
+        except Exception:
+            self.stats["upstream_errors"] += 1
+            raise
+        finally:
+            self.upstream_in_flight -= 1
+        self.upstream_latencies.append(time.perf_counter() - start_time)
+        return response
+
+    def metrics(self):
+        """
+        Get the service metrics.
+
+        Returns:
+            dict: counters, single-flight share, current and peak in-flight requests, and the latency
+                summaries (seconds) of the last LATENCY_WINDOW requests and upstream calls
+        """
+        requests = self.stats["requests"]
+        return dict(
+            self.stats,
+            uptime=time.time() - self.started,
+            model=self.model,
+            mode=self.mode,
+            micro_batch=self.micro_batch,
+            pool_size=self.pool_size,
+            shared_rate=self.stats["shared"] / requests if requests else 0,
+            upstream_calls_per_request=self.stats["upstream_calls"] / requests if requests else None,
+            in_flight=self.in_flight,
+            peak_in_flight=self.peak_in_flight,
+            upstream_in_flight=self.upstream_in_flight,
+            pending_batch=len(self.pending),
+            latency=summarize_latencies(list(self.latencies)),
+            upstream_latency=summarize_latencies(list(self.upstream_latencies)),
+            hedging=self.hedge_policy.summary() if self.hedge_policy else None,
+            circuit_breaker=self.breaker.summary() if self.breaker else None,
+            warmup=self.warmer.summary() if self.warmer else None,
+            shadow=self.shadow.summary() if self.shadow else None
+        )
+
+    async def handle(self, method, path, body):
+        """
+        Answer one HTTP request.
+
+        Returns:
+            tuple: (status code, JSON payload)
+        """
+        if path == "/health" and method == "GET":
+            return 200, {"status": "ok"}
+        if path == "/metrics" and method == "GET":
+            return 200, self.metrics()
+        if path != "/classify":
+            return 404, {"error": f"Unknown path {method} {path}"}
+        if method != "POST":
+            return 405, {"error": "Use POST /classify"}
+
+        try:
+            message = json.loads(body or b"{}").get("message")
+        except (ValueError, AttributeError):
+            message = None
+        if not isinstance(message, str) or not message.strip():
+            return 400, {"error": 'The body must be a JSON object with a non-empty "message"'}
+
+        try:
+            return 200, await self.classify(message)
+        except Exception as e:
+            return 502, {"error": f"Error: {str(e)}"}
+
+    async def handle_connection(self, reader, writer):
+        """Serve the HTTP/1.1 requests of one keep-alive connection"""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except ValueError as e:
+                    writer.write(http_response(400, {"error": str(e)}, keep_alive=False))
+                    break
+                if request is None:
+                    break
+
+                method, path, headers, body = request
+                status, payload = await self.handle(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(http_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def read_request(reader):
+    """
+    Read one HTTP request from a connection.
+
+    Returns:
+        tuple: (method, path, headers with lower-case names, body), or None when the client closed the connection
+
+    Raises:
+        ValueError: If the request is malformed or its body too large
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    parts = request_line.decode("latin-1").split()
+    if len(parts) != 3:
+        raise ValueError("Malformed request line")
+    method, target, _ = parts
+    headers, body = await read_headers_and_body(reader)
+    return method, target.split("?", 1)[0], headers, body
+
+
+async def read_response(reader):
+    """
+    Read one HTTP response from a connection.
+
+    Returns:
+        tuple: (status code, body)
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("The service closed the connection")
+    _, body = await read_headers_and_body(reader, max_bytes=None)
+    return int(status_line.split()[1]), body
+
+
+async def read_headers_and_body(reader, max_bytes=MAX_BODY_BYTES):
+    """Read the headers and the Content-Length body of an HTTP message"""
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = headers.get("content-length", "0")
+    if not length.isdigit() or (max_bytes is not None and int(length) > max_bytes):
+        raise ValueError("Invalid or too large Content-Length")
+    body = await reader.readexactly(int(length)) if int(length) else b""
+    return headers, body
+
+
+def http_request(method, path, host, payload=None):
+    """Encode a JSON HTTP/1.1 request on a keep-alive connection"""
+    data = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    head = (f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {host}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n")
+    return head.encode("latin-1") + data
+
+
+def http_response(status, payload, keep_alive=True):
+    """Encode a JSON HTTP/1.1 response"""
+    data = json.dumps(payload).encode("utf-8")
+    head = (f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + data
+
+
+async def run_load_test(host, port, messages, labels, requests=500, concurrency=50, seed=42):
+    """
+    Send classification requests to a running service and measure them from the client side.
+
+    Every simulated caller keeps one keep-alive connection and sends its next request as soon as
+    the previous one is answered. Messages are drawn at random with replacement, so identical
+    messages are regularly in flight together.
+
+    Args:
+        host (str): Host of the service
+        port (int): Port of the service
+        messages (list): Guest messages to draw from
+        labels (list): Their intention numbers, for the accuracy
+        requests (int): Number of requests
+        concurrency (int): Requests in flight at the same time
+        seed (int): Seed of the message draw
+
+    Returns:
+        dict: requests, errors, accuracy, elapsed seconds, throughput (requests/s), client latency
+            summary and the service metrics after the test
+    """
+    rng = random.Random(seed)
+    draws = iter([rng.randrange(len(messages)) for _ in range(requests)])
+    latencies = []
+    errors = 0
+    correct = 0
+
+    async def caller():
+        nonlocal errors, correct
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for index in draws:
+                start_time = time.perf_counter()
+                writer.write(http_request("POST", "/classify", host, {"message": messages[index]}))
+                status, body = await read_response(reader)
+                if status != 200:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start_time)
+                if json.loads(body)["label"] == str(labels[index]):
+                    correct += 1
+        finally:
+            writer.close()
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(min(concurrency, requests))))
+    elapsed = time.perf_counter() - start_time
+
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(http_request("GET", "/metrics", host))
+    _, body = await read_response(reader)
+    writer.close()
+    service_metrics = json.loads(body)
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "accuracy": correct / len(latencies) if latencies else 0,
+        "elapsed": elapsed,
+        "throughput": requests / elapsed if elapsed else None,
+        "latency": summarize_latencies(latencies),
+        "service": service_metrics
+    }
+
+
+def print_load_report(report):
+    """Print client-side latency and throughput next to the single-flight and upstream counters of the service"""
+    latency = report["latency"]
+    service = report["service"]
+    print(f"\n{report['requests']} requests at concurrency {report['concurrency']} in {report['elapsed']:.1f}s "
+          f"({report['throughput']:.1f} req/s), {report['errors']} errors, accuracy {report['accuracy']:.2%}")
+    print(f"Client latency: p50 {format_seconds(latency['p50'])}, p99 {format_seconds(latency['p99'])}, "
+          f"max {format_seconds(latency['max'])}")
+    print(f"Service: {service['upstream_calls']} upstream calls for {service['requests']} requests "
+          f"({service['shared_rate']:.1%} shared in flight, {service['packed_calls']} packed calls, "
+          f"{service['retried_slots']} retried slots), peak {service['peak_in_flight']} in flight")
+    print(f"Upstream latency: p50 {format_seconds(service['upstream_latency']['p50'])}, "
+          f"p99 {format_seconds(service['upstream_latency']['p99'])}")
+    if service["hedging"]:
+        print(format_hedging_summary(service["hedging"]))
+    if service["circuit_breaker"]:
+        print(format_breaker_summary(service["circuit_breaker"]))
+    for model, summary in (service["warmup"] or {}).items():
+        print(format_warmup_summary(model, summary))
+    if service["shadow"]:
+        print(format_shadow_summary(service["shadow"]))
+
+
+async def run_service(service, host, port, load_test=0, load_concurrency=50, load_files=None, keep_warm=False):
+    """Serve until interrupted, or run a load test against the service and return its report"""
+    keep_alive_task = None
+    if keep_warm:
+        # Warm before taking traffic, so the first guests do not pay the cold start
+        print(f"Warming up {', '.join(service.warmer.models)}...")
+        await service.warmer.warm_up()
+        keep_alive_task = asyncio.ensure_future(service.warmer.run())
+    if service.shadow is not None:
+        service.shadow.start()
+
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    host, port = server.sockets[0].getsockname()[:2]
+    print(f"Classification service for {service.model} listening on http://{host}:{port}")
+    try:
+        if not load_test:
+            async with server:
+                await server.serve_forever()
+            return None
+
+        messages, labels = load_training_data(load_files)
+        print(f"Load test: {load_test} requests over {len(messages)} messages at concurrency {load_concurrency}...")
+        return await run_load_test(host, port, messages, labels, load_test, load_concurrency)
+    finally:
+        if keep_alive_task is not None:
+            keep_alive_task.cancel()
+        if service.shadow is not None:
+            await service.shadow.stop()
+        server.close()
+        await server.wait_closed()
+        await service.client.close()
+
+
+def main():
+    """
+    Main function to parse arguments and run the classification service
+    """
+    parser = argparse.ArgumentParser(description='HTTP service classifying live guest messages')
+    parser.add_argument('--host', type=str, default=DEFAULT_HOST, help=f'Host to bind to (default: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help=f'Port to bind to, 0 picks a free port (default: {DEFAULT_PORT})')
+    parser.add_argument('--model', type=str, default=DEFAULT_PRIMARY_MODEL,
+                        help=f'Model to use (default: {DEFAULT_PRIMARY_MODEL})')
+    parser.add_argument('--mode', type=str, default='short', choices=CLASSIFICATION_MODES,
+                        help='Classification mode limiting the model output (default: short)')
+    parser.add_argument('--prompt-style', type=str, default='full', choices=list(PROMPT_STYLES),
+                        help='Instructions sent with every message; use the style the model was fine-tuned with '
+                             '(default: full)')
+    parser.add_argument('--pad-prefix', action='store_true',
+                        help='Pad the system message to the prompt cache threshold')
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE,
+                        help=f'Keep-alive connections to the API (default: {DEFAULT_POOL_SIZE})')
+    parser.add_argument('--micro-batch', type=int, default=1, metavar='N',
+                        help='Pack up to N distinct concurrent messages into one request (default: 1, off)')
+    parser.add_argument('--batch-window-ms', type=float, default=DEFAULT_BATCH_WINDOW_MS,
+                        help=f'Milliseconds a micro-batch waits for more messages (default: {DEFAULT_BATCH_WINDOW_MS})')
+    parser.add_argument('--hedge', type=float, metavar='PERCENTILE',
+                        help='Send a duplicate of calls slower than this percentile of recent latency and keep the '
+                             'first valid label (e.g. 95)')
+    parser.add_argument('--hedge-budget', type=float, default=DEFAULT_MAX_EXTRA_RATE,
+                        help=f'Most duplicate calls per call with --hedge (default: {DEFAULT_MAX_EXTRA_RATE})')
+    parser.add_argument('--circuit-breaker', action='store_true',
+                        help='Stop calling the model while its error rate or latency is degraded and answer from '
+                             '--fallback-model, else from the local classifier if it was trained')
+    parser.add_argument('--fallback-model', type=str,
+                        help='Model answering while the circuit breaker is open (default: the local classifier)')
+    parser.add_argument('--fallback-classifier', type=str, default=DEFAULT_MODEL_FILE,
+                        help=f'Local classifier trained with lexical_classifier.py --train '
+                             f'(default: {DEFAULT_MODEL_FILE})')
+    parser.add_argument('--breaker-slow-call', type=float, default=DEFAULT_SLOW_CALL,
+                        help=f'Seconds after which a call counts as slow (default: {DEFAULT_SLOW_CALL})')
+    parser.add_argument('--breaker-open-seconds', type=float, default=DEFAULT_OPEN_SECONDS,
+                        help=f'Seconds the breaker stays open before probing the model '
+                             f'(default: {DEFAULT_OPEN_SECONDS})')
+    parser.add_argument('--keep-warm', action='store_true',
+                        help='Warm up the model before taking traffic and send keep-alive calls whenever it was idle '
+                             'for --warm-interval seconds')
+    parser.add_argument('--warm-models', type=str, nargs='+', default=[],
+                        help='Further models to measure and keep warm, e.g. other fine-tuned deployments')
+    parser.add_argument('--warm-interval', type=float, default=DEFAULT_PING_INTERVAL,
+                        help=f'Idle seconds before a keep-alive round with --keep-warm '
+                             f'(default: {DEFAULT_PING_INTERVAL})')
+    parser.add_argument('--warm-connections', type=int, default=DEFAULT_CONNECTIONS,
+                        help=f'Concurrent calls per warm-up or keep-alive round, i.e. connections kept warm '
+                             f'(default: {DEFAULT_CONNECTIONS})')
+    parser.add_argument('--cold-after', type=float, default=DEFAULT_COLD_AFTER,
+                        help=f'Idle seconds after which a call is reported as cold (default: {DEFAULT_COLD_AFTER})')
+    parser.add_argument('--shadow-model', type=str,
+                        help='Candidate model a sample of the classifications is mirrored to in the background, '
+                             'comparing labels and latency with --model')
+    parser.add_argument('--shadow-rate', type=float, default=DEFAULT_SAMPLE_RATE,
+                        help=f'Share of the classifications mirrored (default: {DEFAULT_SAMPLE_RATE})')
+    parser.add_argument('--shadow-concurrency', type=int, default=DEFAULT_SHADOW_CONCURRENCY,
+                        help=f'Shadow calls in flight, on their own connections '
+                             f'(default: {DEFAULT_SHADOW_CONCURRENCY})')
+    parser.add_argument('--shadow-queue', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help=f'Samples waiting for a shadow call; further samples are dropped '
+                             f'(default: {DEFAULT_QUEUE_SIZE})')
+    parser.add_argument('--local', action='store_true',
+                        help='Start the local OpenAI stand-in in the background and classify against it')
+    parser.add_argument('--load-test', type=int, default=0, metavar='REQUESTS',
+                        help='Send this many requests to the service, print the report and exit')
+    parser.add_argument('--load-concurrency', type=int, default=50,
+                        help='Requests in flight during the load test (default: 50)')
+    parser.add_argument('--load-files', type=str, nargs='+', default=['messages_mappings100.py'],
+                        help='Labelled messages the load test draws from (default: messages_mappings100.py)')
+    local_openai_server.add_config_arguments(parser.add_argument_group('local stand-in settings (with --local)'))
+
+    args = parser.parse_args()
+
+    if args.micro_batch > 1 and args.prompt_style != "full":
+        parser.error("--micro-batch needs --prompt-style full, since packed requests extend the full prompt")
+
+    base_url = os.environ.get("OPENAI_BASE_URL")
+    if args.local:
+        _, base_url = local_openai_server.start_in_background(
+            port=0, config=local_openai_server.config_from_args(args))
+        print(f"Local OpenAI stand-in on {base_url}")
+
+    system_message = SYSTEM_PROMPT if args.prompt_style == "full" else PROMPT_STYLES[args.prompt_style]
+    hedge_policy = HedgePolicy(args.hedge, max_extra_rate=args.hedge_budget) if args.hedge is not None else None
+    breaker = None
+    fallback_classifier = None
+    if args.circuit_breaker:
+        breaker = CircuitBreaker(args.model, slow_call=args.breaker_slow_call, open_seconds=args.breaker_open_seconds)
+        if args.fallback_model is None and os.path.exists(args.fallback_classifier):
+            fallback_classifier = LexicalClassifier.load(args.fallback_classifier)
+        fallback = args.fallback_model or ("local classifier" if fallback_classifier else "none")
+        print(f"Circuit breaker on {args.model}, fallback: {fallback}")
+    client = create_pooled_client(base_url, args.pool_size)
+    service = ClassificationService(client, args.model, system_message, args.mode, args.pad_prefix,
+                                    args.micro_batch, args.batch_window_ms / 1000, args.pool_size, hedge_policy,
+                                    breaker, args.fallback_model, fallback_classifier)
+    # The warm-up calls are built like the traffic, so they also warm the prompt prefix of the model
+    service.warmer = ModelWarmer(client, service.build_request, args.warm_interval, args.cold_after,
+                                 connections=args.warm_connections)
+    for model in [args.model] + args.warm_models:
+        service.warmer.register(model)
+    if args.shadow_model:
+        service.shadow = ShadowMirror(create_pooled_client(base_url, args.shadow_concurrency), args.shadow_model,
+                                      service.build_request, args.shadow_rate, args.shadow_concurrency,
+                                      args.shadow_queue)
+        print(f"Mirroring {args.shadow_rate:.0%} of the classifications to {args.shadow_model}")
+
+    try:
+        report = asyncio.run(run_service(service, args.host, args.port, args.load_test, args.load_concurrency,
+                                         args.load_files, args.keep_warm))
+    except KeyboardInterrupt:
+        print("\nShutting down")
+        print(json.dumps(service.metrics(), indent=2))
+        return
+
+    print_load_report(report)
+    print_rate_limit_stats()
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = f"service_load_test_{timestamp}.json"
+    with open(results_file, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\nDetailed results saved to {results_file}")
+
+
+if __name__ == "__main__":
+    main()
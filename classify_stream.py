@@ -0,0 +1,338 @@
+import os
+import sys
+import csv
+import json
+import time
+import asyncio
+import argparse
+import itertools
+import contextlib
+from collections import deque
+import local_openai_server
+from intent_extractor import extract_intention
+from classification_modes import CLASSIFICATION_MODES
+from create_jsonl import PROMPT_STYLES, SYSTEM_PROMPT
+from rate_limiter import create_chat_completion_async, print_rate_limit_stats
+from latency_stats import summarize_latencies, format_seconds
+from classify_service import build_classification_request, create_pooled_client
+from cascade_router import DEFAULT_PRIMARY_MODEL
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Streaming bulk classification, e.g. to backfill the labels of historical chat logs:
+#   zcat chats.jsonl.gz | python classify_stream.py --format jsonl > labels.jsonl
+# Messages are read as they are needed and every result is written as soon as it is known, so memory
+# stays flat however many messages go through: at most --max-pending messages are read but not yet
+# written, and the reader waits (backpressure) until the writer has caught up.
+
+INPUT_FORMATS = ["text", "jsonl", "csv"]
+
+DEFAULT_CONCURRENCY = 20
+
+# Input lines are read in chunks off the event loop
+READ_CHUNK = 256
+
+# Progress is reported on stderr every this many results; latencies of the most recent results are kept
+PROGRESS_EVERY = 10000
+LATENCY_WINDOW = 10000
+
+
+def detect_format(path):
+    """Guess the input format from the file extension; stdin and unknown extensions are read as text"""
+    extension = os.path.splitext(path or "")[1].lower()
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if extension == ".csv":
+        return "csv"
+    return "text"
+
+
+def iter_records(lines, input_format, field="message", id_field=None):
+    """
+    Read guest messages lazily.
+
+    Args:
+        lines (iterable): Lines of the input
+        input_format (str): One of INPUT_FORMATS: a message per line, JSON objects or CSV with a header
+        field (str): JSON key or CSV column of the message; JSONL records of the fine-tuning files
+            (with "messages") use their last user message
+        id_field (str): JSON key or CSV column copied to the result, to join it back to the input
+
+    Returns:
+        iterator: (message, record ID, error) tuples, with error set and message None for unreadable records
+
+    Raises:
+        ValueError: If the CSV header has no column field; the header is read at once
+    """
+    if input_format == "csv":
+        rows = csv.DictReader(lines)
+        if rows.fieldnames is None or field not in rows.fieldnames:
+            raise ValueError(f'The CSV header has no column "{field}"')
+        return iter_csv_records(rows, field, id_field)
+    return iter_line_records(lines, input_format, field, id_field)
+
+
+def iter_csv_records(rows, field, id_field):
+    """Yield the (message, record ID, error) tuples of CSV rows, see iter_records"""
+    for row in rows:
+        message = row.get(field)
+        record_id = row.get(id_field) if id_field else None
+        if not message or not message.strip():
+            yield None, record_id, "empty message"
+        else:
+            yield message, record_id, None
+
+
+def iter_line_records(lines, input_format, field, id_field):
+    """Yield the (message, record ID, error) tuples of text or JSONL lines, see iter_records"""
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+        if input_format == "text":
+            yield line, None, None
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield None, None, "invalid JSON"
+            continue
+        if not isinstance(record, dict):
+            yield None, None, "not a JSON object"
+            continue
+        record_id = record.get(id_field) if id_field else None
+        message = record.get(field)
+        if message is None and isinstance(record.get("messages"), list):
+            user_messages = [m.get("content") for m in record["messages"] if m.get("role") == "user"]
+            message = user_messages[-1] if user_messages else None
+        if not isinstance(message, str) or not message.strip():
+            yield None, record_id, f'no "{field}"'
+        else:
+            yield message, record_id, None
+
+
+def positive_int(value):
+    """Parse a count option that must be at least 1, e.g. --concurrency"""
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"Expected a number of at least 1: {value}")
+    return number
+
+
+def peak_memory_mb():
+    """Peak resident memory of the process in MB, None where the platform does not report it"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+async def classify_stream(async_client, records, output, model, system_message=SYSTEM_PROMPT, mode="short",
+                          concurrency=DEFAULT_CONCURRENCY, max_pending=None, ordered=False):
+    """
+    Classify a stream of guest messages concurrently and write one JSON line per message as results finish.
+
+    Args:
+        async_client (openai.AsyncOpenAI): Async OpenAI client
+        records (iterator): (message, record ID, error) tuples, see iter_records; read off the event loop
+        output (file): Text stream the results are written to
+        model (str): The model to use
+        system_message (str): The system message, or None to send only the guest message
+        mode (str): Classification mode limiting the output
+        concurrency (int): Classifications in flight
+        max_pending (int): Most messages read but not yet written (default: 4 x concurrency)
+        ordered (bool): Whether to write the results in input order; a slow message then holds back
+            the ones after it, up to max_pending
+
+    Returns:
+        dict: counters, elapsed seconds, throughput and the latency summary of the most recent results
+    """
+    loop = asyncio.get_running_loop()
+    max_pending = max_pending or 4 * concurrency
+    # Taken by the reader for every message and given back once its result is written
+    window = asyncio.Semaphore(max_pending)
+    jobs = asyncio.Queue(maxsize=concurrency)
+    results = asyncio.Queue()
+    latencies = deque(maxlen=LATENCY_WINDOW)
+    stats = {"read": 0, "classified": 0, "errors": 0, "invalid_input": 0, "written": 0}
+    start_time = time.perf_counter()
+
+    async def read():
+        while True:
+            chunk = await loop.run_in_executor(None, lambda: list(itertools.islice(records, READ_CHUNK)))
+            if not chunk:
+                break
+            for message, record_id, error in chunk:
+                await window.acquire()
+                await jobs.put((stats["read"], message, record_id, error))
+                stats["read"] += 1
+        for _ in range(concurrency):
+            await jobs.put(None)
+
+    async def work():
+        while True:
+            job = await jobs.get()
+            if job is None:
+                return
+            index, message, record_id, error = job
+            result = {"index": index}
+            if record_id is not None:
+                result["id"] = record_id
+            result.update({"message": message, "label": None, "latency": None, "error": error})
+            if error is not None:
+                stats["invalid_input"] += 1
+            else:
+                request_start = time.perf_counter()
+                try:
+                    request = build_classification_request(message, model, system_message, mode)
+                    response = await create_chat_completion_async(async_client, request)
+                    result["label"] = extract_intention(response.choices[0].message.content)
+                    result["latency"] = time.perf_counter() - request_start
+                    latencies.append(result["latency"])
+                    stats["classified"] += 1
+                except Exception as e:
+                    result["error"] = f"Error: {str(e)}"
+                    stats["errors"] += 1
+            await results.put(result)
+
+    async def write():
+        next_index = 0
+        # Results that finished before an earlier message, in ordered mode (at most max_pending)
+        held = {}
+        while True:
+            result = await results.get()
+            if result is None:
+                break
+            if ordered:
+                held[result["index"]] = result
+                ready = []
+                while next_index in held:
+                    ready.append(held.pop(next_index))
+                    next_index += 1
+            else:
+                ready = [result]
+            for item in ready:
+                output.write(json.dumps(item) + "\n")
+                stats["written"] += 1
+                window.release()
+                if stats["written"] % PROGRESS_EVERY == 0:
+                    elapsed = time.perf_counter() - start_time
+                    print(f"{stats['written']} written in {elapsed:.0f}s ({stats['written'] / elapsed:.0f}/s), "
+                          f"{stats['errors']} errors", file=sys.stderr)
+            if results.empty():
+                output.flush()
+        output.flush()
+
+    async def feed():
+        await asyncio.gather(read(), *(work() for _ in range(concurrency)))
+        await results.put(None)
+
+    # If writing fails (e.g. the output pipe was closed) the reader and workers are cancelled too,
+    # instead of waiting for window slots that are never given back
+    feeder = asyncio.ensure_future(feed())
+    writer = asyncio.ensure_future(write())
+    try:
+        await asyncio.gather(feeder, writer)
+    finally:
+        feeder.cancel()
+        writer.cancel()
+        await async_client.close()
+
+    elapsed = time.perf_counter() - start_time
+    return dict(stats, elapsed=elapsed, throughput=stats["written"] / elapsed if elapsed else 0,
+                latency=summarize_latencies(list(latencies)))
+
+
+def print_summary(summary):
+    """Print the counters, throughput, latency and peak memory of a run on stderr"""
+    latency = summary["latency"]
+    memory = peak_memory_mb()
+    print(f"{summary['written']} results in {summary['elapsed']:.1f}s ({summary['throughput']:.1f}/s): "
+          f"{summary['classified']} classified, {summary['errors']} errors, {summary['invalid_input']} invalid input",
+          file=sys.stderr)
+    print(f"Latency of the last {latency['count']}: p50 {format_seconds(latency['p50'])}, "
+          f"p99 {format_seconds(latency['p99'])}"
+          + (f"; peak memory {memory:.0f}MB" if memory is not None else ""), file=sys.stderr)
+
+
+def main():
+    """
+    Main function to parse arguments and classify a stream of messages from stdin or a file
+    """
+    parser = argparse.ArgumentParser(description='Classify guest messages from stdin or a text/JSONL/CSV file and '
+                                                 'write one JSON result per line to stdout as they finish')
+    parser.add_argument('input', type=str, nargs='?', default='-',
+                        help='Input file, - for stdin (default: -)')
+    parser.add_argument('--format', type=str, choices=INPUT_FORMATS,
+                        help='Input format: a message per line, JSON objects or CSV with a header '
+                             '(default: from the file extension, text for stdin)')
+    parser.add_argument('--field', type=str, default='message',
+                        help='JSON key or CSV column of the message (default: message)')
+    parser.add_argument('--id-field', type=str,
+                        help='JSON key or CSV column copied to the result as "id"')
+    parser.add_argument('--model', type=str, default=DEFAULT_PRIMARY_MODEL,
+                        help=f'Model to use (default: {DEFAULT_PRIMARY_MODEL})')
+    parser.add_argument('--mode', type=str, default='short', choices=CLASSIFICATION_MODES,
+                        help='Classification mode limiting the model output (default: short)')
+    parser.add_argument('--prompt-style', type=str, default='full', choices=list(PROMPT_STYLES),
+                        help='Instructions sent with every message; use the style the model was fine-tuned with '
+                             '(default: full)')
+    parser.add_argument('--concurrency', type=positive_int, default=DEFAULT_CONCURRENCY,
+                        help=f'Classifications in flight (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--max-pending', type=positive_int,
+                        help='Most messages read but not yet written, bounding memory (default: 4 x concurrency)')
+    parser.add_argument('--ordered', action='store_true',
+                        help='Write the results in input order instead of as they finish')
+    parser.add_argument('--local', action='store_true',
+                        help='Start the local OpenAI stand-in in the background and classify against it')
+    local_openai_server.add_config_arguments(parser.add_argument_group('local stand-in settings (with --local)'))
+
+    args = parser.parse_args()
+
+    base_url = os.environ.get("OPENAI_BASE_URL")
+    if args.local:
+        _, base_url = local_openai_server.start_in_background(
+            port=0, config=local_openai_server.config_from_args(args))
+        print(f"Local OpenAI stand-in on {base_url}", file=sys.stderr)
+
+    input_format = args.format or detect_format(None if args.input == '-' else args.input)
+    system_message = SYSTEM_PROMPT if args.prompt_style == "full" else PROMPT_STYLES[args.prompt_style]
+    # Undecodable bytes become U+FFFD instead of ending a long backfill with a UnicodeDecodeError
+    newline = '' if input_format == "csv" else None
+    if args.input == '-':
+        source = sys.stdin
+        source.reconfigure(errors="replace", newline=newline)
+    else:
+        source = open(args.input, 'r', errors="replace", newline=newline)
+    try:
+        try:
+            records = iter_records(source, input_format, args.field, args.id_field)
+        except ValueError as e:
+            parser.error(str(e))
+        summary = asyncio.run(classify_stream(create_pooled_client(base_url, args.concurrency), records, sys.stdout,
+                                              args.model, system_message, args.mode, args.concurrency,
+                                              args.max_pending, args.ordered))
+    except BrokenPipeError:
+        # The reader of the output went away, e.g. | head; stdout is pointed at /dev/null so the
+        # interpreter does not fail again flushing it on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    print_summary(summary)
+    # Rate limiter statistics go to stderr as well, stdout carries only results
+    with contextlib.redirect_stdout(sys.stderr):
+        print_rate_limit_stats()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import json
+import argparse
+from openai import OpenAI
+from datetime import datetime
+from latency_stats import summarize_latencies, format_seconds
+from rate_limiter import print_rate_limit_stats
+from create_jsonl import PROMPT_STYLES
+from cascade_router import (CONFIDENCE_METHODS, DEFAULT_PRIMARY_MODEL, DEFAULT_FALLBACK_MODEL, DEFAULT_THRESHOLD,
+                            classify_with_confidence, blend)
+
+# Initialize the OpenAI client
+api_key = os.environ.get("OPENAI_API_KEY")
+if not api_key:
+    raise ValueError("OPENAI_API_KEY environment variable is not set")
+
+client = OpenAI(api_key=api_key, base_url=os.environ.get("OPENAI_BASE_URL"))
+
+DEFAULT_THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9, 0.95]
+
+
+def load_eval_items(eval_file="evals100.jsonl"):
+    """
+    Load the messages and correct labels of an eval file.
+
+    Returns:
+        list: (message, correct label) tuples
+    """
+    items = []
+    with open(eval_file, "r") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)["item"]
+                items.append((item["input_text"], str(item["correct_label"])))
+    return items
+
+
+def summarize_routing(name, routed, correct_labels):
+    """
+    Summarize routed classifications.
+
+    Args:
+        name (str): Name of the routing, e.g. "threshold 0.80"
+        routed (list): Results of cascade_router.blend, one per message
+        correct_labels (list): Correct labels of the messages
+
+    Returns:
+        dict: accuracy, escalation_rate, latency summary and cost_per_1k (USD per 1000 classifications)
+    """
+    correct = sum(result["label"] == label for result, label in zip(routed, correct_labels))
+    costs = [result["cost"] for result in routed]
+    return {
+        "routing": name,
+        "accuracy": correct / len(routed) if routed else 0,
+        "escalation_rate": sum(result["escalated"] for result in routed) / len(routed) if routed else 0,
+        "latency": summarize_latencies([result["latency"] for result in routed]),
+        "cost_per_1k": sum(costs) / len(costs) * 1000 if costs and None not in costs else None
+    }
+
+
+def print_report(summaries):
+    """Print accuracy, escalation rate, blended latency and cost of every routing"""
+    print(f"\n{'Routing':<22} {'Accuracy':>9} {'Escalated':>10} {'p50':>8} {'p95':>8} {'$/1k cls':>9}")
+    for summary in summaries:
+        cost = summary["cost_per_1k"]
+        print(f"{summary['routing']:<22} {summary['accuracy']:>9.2%} {summary['escalation_rate']:>10.1%} "
+              f"{format_seconds(summary['latency']['p50']):>8} {format_seconds(summary['latency']['p95']):>8} "
+              f"{'$' + format(cost, '.4f') if cost is not None else 'n/a':>9}")
+
+
+def main():
+    """
+    Main function to parse arguments and evaluate the cascade router
+    """
+    parser = argparse.ArgumentParser(description='Evaluate routing from the fine-tuned mini model to a large model '
+                                                 'below a confidence threshold')
+    parser.add_argument('--primary-model', type=str, default=DEFAULT_PRIMARY_MODEL,
+                        help=f'Model asked first (default: {DEFAULT_PRIMARY_MODEL})')
+    parser.add_argument('--fallback-model', type=str, default=DEFAULT_FALLBACK_MODEL,
+                        help=f'Model asked below the threshold (default: {DEFAULT_FALLBACK_MODEL})')
+    parser.add_argument('--confidence', type=str, default='logprobs', choices=CONFIDENCE_METHODS,
+                        help='Confidence of the primary model: label probability from logprobs, or agreement of '
+                             'several samples (default: logprobs)')
+    parser.add_argument('--prompt-style', type=str, default='full', choices=list(PROMPT_STYLES),
+                        help='Instructions sent to the primary model; use the style it was fine-tuned with '
+                             '(default: full)')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=DEFAULT_THRESHOLDS,
+                        help=f'Confidence thresholds to report (default: {" ".join(map(str, DEFAULT_THRESHOLDS))})')
+    parser.add_argument('--eval-file', type=str, default='evals100.jsonl', help='Eval file (default: evals100.jsonl)')
+    parser.add_argument('--limit', type=int, help='Only use the first messages of the eval file')
+
+    args = parser.parse_args()
+
+    items = load_eval_items(args.eval_file)[:args.limit]
+
+    # Both models answer every message once; every threshold is then evaluated on the same answers.
+    # A message either model failed on (after retries) is left out of every routing
+    evaluated = []
+    primary_results = []
+    fallback_results = []
+    errors = 0
+    for i, (message, label) in enumerate(items):
+        print(f"Classifying message {i + 1}/{len(items)}...")
+        try:
+            primary = classify_with_confidence(client, message, args.primary_model, args.confidence,
+                                               args.prompt_style)
+            fallback = classify_with_confidence(client, message, args.fallback_model, "logprobs")
+        except Exception as e:
+            print(f"Error for message {i + 1}: {str(e)}")
+            errors += 1
+            continue
+        evaluated.append((message, label))
+        primary_results.append(primary)
+        fallback_results.append(fallback)
+    correct_labels = [label for _, label in evaluated]
+
+    summaries = [
+        summarize_routing("primary only", [blend(result, None) for result in primary_results], correct_labels),
+        summarize_routing("fallback only", [blend(result, None) for result in fallback_results], correct_labels)
+    ]
+    for threshold in sorted(args.thresholds):
+        routed = [blend(primary, None) if primary["label"] is not None and primary["confidence"] >= threshold
+                  else blend(primary, fallback)
+                  for primary, fallback in zip(primary_results, fallback_results)]
+        summaries.append(summarize_routing(f"threshold {threshold:.2f}", routed, correct_labels))
+
+    print(f"\nPrimary: {args.primary_model} ({args.confidence} confidence), fallback: {args.fallback_model}, "
+          f"{len(evaluated)} messages of {args.eval_file} ({errors} left out after errors)")
+    print_report(summaries)
+    print_rate_limit_stats()
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = f"cascade_{timestamp}.json"
+    with open(results_file, "w") as f:
+        json.dump({
+            "primary_model": args.primary_model,
+            "fallback_model": args.fallback_model,
+            "confidence": args.confidence,
+            "default_threshold": DEFAULT_THRESHOLD,
+            "errors": errors,
+            "summaries": summaries,
+            "messages": [
+                {"message": message, "correct_label": label, "primary": primary, "fallback": fallback}
+                for (message, label), primary, fallback in zip(evaluated, primary_results, fallback_results)
+            ]
+        }, f, indent=2)
+
+    print(f"\nDetailed results saved to {results_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import argparse
+from openai import OpenAI
+from datetime import datetime
+from intent_extractor import extract_intention
+from classification_modes import CLASSIFICATION_MODES, classification_params
+from latency_stats import summarize_latencies, format_seconds, reduction
+from rate_limiter import create_chat_completion, print_rate_limit_stats
+from streaming_classifier import stream_classification
+from openai_eval import SYSTEM_PROMPT
+from messages_mappings100 import vague_messages, correct_mappings
+
+# Initialize the OpenAI client
+api_key = os.environ.get("OPENAI_API_KEY")
+if not api_key:
+    raise ValueError("OPENAI_API_KEY environment variable is not set")
+
+client = OpenAI(api_key=api_key, base_url=os.environ.get("OPENAI_BASE_URL"))
+
+DEFAULT_MODELS = ["gpt-4o-mini", "ft:gpt-4o-mini-2024-07-18:personal:sft400:BUKolthG"]
+
+
+def run_mode(model, mode, messages, mappings, stream=False):
+    """
+    Classify the messages with one model in one classification mode.
+
+    Args:
+        model (str): The model to use
+        mode (str): One of CLASSIFICATION_MODES
+        messages (list): Guest messages
+        mappings (list): Correct intention numbers for the messages
+        stream (bool): Whether to stream the responses and stop once the label is known; the latency
+            is then the time to label and output tokens are not reported
+
+    Returns:
+        dict: Accuracy, output token and latency statistics
+    """
+    latencies = []
+    ttfbs = []
+    completion_tokens = []
+    correct = 0
+    errors = 0
+
+    for message, correct_mapping in zip(messages, mappings):
+        request = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": message}
+            ],
+            "seed": 42
+        }
+        request.update(classification_params(mode, model))
+
+        try:
+            if stream:
+                result = stream_classification(client, request)
+                latencies.append(result["time_to_label"])
+                ttfbs.append(result["ttfb"])
+                label = result["label"]
+            else:
+                start_time = time.perf_counter()
+                response = create_chat_completion(client, request)
+                latencies.append(time.perf_counter() - start_time)
+                completion_tokens.append(response.usage.completion_tokens)
+                label = extract_intention(response.choices[0].message.content)
+        except Exception as e:
+            print(f"Error for {model} ({mode}): {str(e)}")
+            errors += 1
+            continue
+
+        if label == str(correct_mapping):
+            correct += 1
+
+    answered = len(latencies)
+    return {
+        "model": model,
+        "mode": f"{mode}+stream" if stream else mode,
+        "requests": len(messages),
+        "errors": errors,
+        "accuracy": correct / answered if answered > 0 else 0,
+        "mean_completion_tokens": sum(completion_tokens) / answered if completion_tokens else None,
+        "latency": summarize_latencies(latencies),
+        "ttfb": summarize_latencies(ttfbs) if stream else None
+    }
+
+
+def print_report(results):
+    """Print the per-model comparison of the classification modes against free mode"""
+    for model in dict.fromkeys(result["model"] for result in results):
+        model_results = [result for result in results if result["model"] == model]
+        baseline = next((result for result in model_results if result["mode"] == "free"), None)
+
+        print(f"\nModel: {model}")
+        print(f"{'Mode':<18} {'Accuracy':>9} {'Out tokens':>11} {'Token cut':>10} "
+              f"{'p50':>8} {'p95':>8} {'Latency cut':>12}")
+        for result in model_results:
+            token_cut = latency_cut = None
+            if baseline:
+                token_cut = reduction(baseline["mean_completion_tokens"], result["mean_completion_tokens"])
+                latency_cut = reduction(baseline["latency"]["mean"], result["latency"]["mean"])
+            tokens = result["mean_completion_tokens"]
+            print(f"{result['mode']:<18} {result['accuracy']:>9.2%} "
+                  f"{tokens if tokens is not None else float('nan'):>11.1f} "
+                  f"{token_cut if token_cut is not None else float('nan'):>10.1%} "
+                  f"{format_seconds(result['latency']['p50']):>8} {format_seconds(result['latency']['p95']):>8} "
+                  f"{latency_cut if latency_cut is not None else float('nan'):>12.1%}")
+
+
+def main():
+    """
+    Main function to parse arguments and compare the classification modes
+    """
+    parser = argparse.ArgumentParser(description='Compare output tokens and latency of the classification modes')
+    parser.add_argument('--models', type=str, nargs='+', default=DEFAULT_MODELS, help='Models to compare')
+    parser.add_argument('--modes', type=str, nargs='+', default=CLASSIFICATION_MODES,
+                        choices=CLASSIFICATION_MODES, help='Classification modes to compare')
+    parser.add_argument('--stream', action='store_true',
+                        help='Also run every mode streamed, stopping once the label is known (reported as <mode>+stream)')
+    parser.add_argument('--limit', type=int, default=20, help='Number of messages per model and mode (default: 20)')
+
+    args = parser.parse_args()
+
+    messages = vague_messages[:args.limit]
+    mappings = correct_mappings[:args.limit]
+
+    results = []
+    for model in args.models:
+        for mode in args.modes:
+            print(f"Classifying {len(messages)} messages with {model} in {mode} mode...")
+            results.append(run_mode(model, mode, messages, mappings))
+            if args.stream:
+                print(f"Classifying {len(messages)} messages with {model} in {mode} mode, streamed...")
+                results.append(run_mode(model, mode, messages, mappings, stream=True))
+
+    print_report(results)
+    print_rate_limit_stats()
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = f"classification_modes_{timestamp}.json"
+    with open(results_file, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\nDetailed results saved to {results_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import argparse
+from openai import OpenAI
+from datetime import datetime
+from intent_extractor import extract_intention
+from latency_stats import summarize_latencies, format_seconds
+from rate_limiter import create_chat_completion, print_rate_limit_stats
+from prompt_cache import get_prompt_prefix
+from fewshot_index import FewShotIndex, with_examples
+from lexical_classifier import load_training_data, DEFAULT_TRAINING_FILES
+from create_jsonl import SYSTEM_PROMPT
+
+# Initialize the OpenAI client
+api_key = os.environ.get("OPENAI_API_KEY")
+if not api_key:
+    raise ValueError("OPENAI_API_KEY environment variable is not set")
+
+client = OpenAI(api_key=api_key, base_url=os.environ.get("OPENAI_BASE_URL"))
+
+DEFAULT_MODELS = ["gpt-4o-mini", "gpt-4.1"]
+
+# Examples per message; 0 is the static prompt without examples
+DEFAULT_KS = [0, 1, 3, 5, 10]
+
+
+def run_few_shot(model, k, index, messages, labels):
+    """
+    Classify the messages with k retrieved examples per message.
+
+    Returns:
+        dict: Accuracy, mean prompt tokens and latency statistics
+    """
+    latencies = []
+    prompt_tokens = []
+    correct = 0
+    errors = 0
+
+    for message, label in zip(messages, labels):
+        request = {
+            "model": model,
+            "messages": with_examples(get_prompt_prefix(SYSTEM_PROMPT, model=model).messages(message), index, k),
+            "max_tokens": 10,
+            "seed": 42
+        }
+        try:
+            start_time = time.perf_counter()
+            response = create_chat_completion(client, request)
+            latencies.append(time.perf_counter() - start_time)
+        except Exception as e:
+            print(f"Error for {model} ({k} examples): {str(e)}")
+            errors += 1
+            continue
+
+        prompt_tokens.append(response.usage.prompt_tokens)
+        if extract_intention(response.choices[0].message.content) == str(label):
+            correct += 1
+
+    answered = len(latencies)
+    return {
+        "model": model,
+        "k": k,
+        "errors": errors,
+        "accuracy": correct / answered if answered else 0,
+        "mean_prompt_tokens": sum(prompt_tokens) / answered if answered else None,
+        "latency": summarize_latencies(latencies)
+    }
+
+
+def measure_queries(index, messages, k):
+    """Measure the latency of retrieving k examples for each message"""
+    latencies = []
+    for message in messages:
+        start_time = time.perf_counter()
+        index.query(message, k)
+        latencies.append(time.perf_counter() - start_time)
+    return summarize_latencies(latencies)
+
+
+def add_gains(results):
+    """Add the prompt tokens added by the examples and the accuracy gain per 1000 of them, against k = 0"""
+    baseline = results[0]
+    for result in results:
+        tokens = result["mean_prompt_tokens"]
+        added = None
+        if tokens is not None and baseline["mean_prompt_tokens"] is not None:
+            added = tokens - baseline["mean_prompt_tokens"]
+        result["added_prompt_tokens"] = added
+        result["gain_per_1k_tokens"] = ((result["accuracy"] - baseline["accuracy"]) * 100 / added * 1000
+                                        if added else None)
+
+
+def print_report(model, results):
+    """Print accuracy, added prompt tokens and accuracy gain per added token for every k of one model"""
+    print(f"\n{model} (gain in accuracy points per 1000 added prompt tokens per message)")
+    print(f"{'k':>3} {'Accuracy':>9} {'In tokens':>10} {'Added':>8} {'Gain/1k':>8} {'p50':>8}")
+    for result in results:
+        tokens = result["mean_prompt_tokens"]
+        added = result["added_prompt_tokens"]
+        gain = result["gain_per_1k_tokens"]
+        print(f"{result['k']:>3} {result['accuracy']:>9.2%} {tokens if tokens is not None else float('nan'):>10.1f} "
+              f"{added if added is not None else float('nan'):>8.1f} "
+              f"{gain if gain is not None else float('nan'):>8.2f} {format_seconds(result['latency']['p50']):>8}")
+
+
+def main():
+    """
+    Main function to parse arguments and compare base models with retrieved few-shot examples
+    """
+    parser = argparse.ArgumentParser(description='Compare accuracy and prompt tokens of base models with the k most '
+                                                 'similar labelled examples added as few-shot turns')
+    parser.add_argument('--models', type=str, nargs='+', default=DEFAULT_MODELS,
+                        help=f'Models to compare (default: {" ".join(DEFAULT_MODELS)})')
+    parser.add_argument('--ks', type=int, nargs='+', default=DEFAULT_KS,
+                        help=f'Examples per message (default: {" ".join(map(str, DEFAULT_KS))}); 0 is always run')
+    parser.add_argument('--index-files', type=str, nargs='+', default=DEFAULT_TRAINING_FILES,
+                        help='Labelled messages to retrieve examples from (default: tests400.jsonl)')
+    parser.add_argument('--test-files', type=str, nargs='+', default=['messages_mappings100.py'],
+                        help='Held-out messages to classify (default: messages_mappings100.py)')
+    parser.add_argument('--limit', type=int, default=40, help='Number of messages (default: 40)')
+
+    args = parser.parse_args()
+
+    index = FewShotIndex.from_files(args.index_files)
+    messages, labels = load_training_data(args.test_files)
+    messages, labels = messages[:args.limit], labels[:args.limit]
+    ks = [0] + sorted(set(k for k in args.ks if k > 0))
+
+    query_latency = measure_queries(index, messages, max(ks))
+    print(f"Index of {len(index.messages)} examples built in {index.build_time * 1000:.1f}ms; "
+          f"query p50 {query_latency['p50'] * 1e6:.0f}µs, p99 {query_latency['p99'] * 1e6:.0f}µs")
+
+    report = {"index": {"examples": len(index.messages), "build_time": index.build_time,
+                        "query_latency": query_latency}, "models": {}}
+    for model in args.models:
+        results = []
+        for k in ks:
+            print(f"Classifying {len(messages)} messages with {model} and {k} examples...")
+            results.append(run_few_shot(model, k, index, messages, labels))
+        add_gains(results)
+        print_report(model, results)
+        report["models"][model] = results
+
+    print_rate_limit_stats()
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = f"few_shot_{timestamp}.json"
+    with open(results_file, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\nDetailed results saved to {results_file}")
+
+
+if __name__ == "__main__":
+    main()
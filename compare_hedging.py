@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime
+import openai
+import local_openai_server
+from intent_extractor import extract_intention
+from classification_modes import CLASSIFICATION_MODES, classification_params
+from latency_stats import summarize_latencies, format_seconds, reduction
+from rate_limiter import create_chat_completion_async, rate_limiter_for, reset_rate_limiters
+from prompt_cache import get_prompt_prefix
+from hedging import DEFAULT_MAX_EXTRA_RATE, HedgePolicy, has_label
+from lexical_classifier import load_training_data
+from cascade_router import DEFAULT_PRIMARY_MODEL
+from create_jsonl import SYSTEM_PROMPT
+
+openai_api_key = os.environ.get("OPENAI_API_KEY")
+if not openai_api_key:
+    raise ValueError("OPENAI_API_KEY environment variable is not set")
+
+DEFAULT_PERCENTILES = [90, 95, 99]
+
+
+async def run_policy(async_client, items, model, mode, concurrency, policy=None):
+    """
+    Classify the messages concurrently, with or without hedging.
+
+    Args:
+        async_client (openai.AsyncOpenAI): Async OpenAI client
+        items (list): (message, correct label) tuples
+        model (str): The model to use
+        mode (str): Classification mode limiting the output
+        concurrency (int): Classifications in flight at the same time
+        policy (HedgePolicy): Hedging policy, None for the baseline
+
+    Returns:
+        dict: errors, accuracy, latency summary of the classifications from their admission by the
+            rate limiter, the hedging summary and the counters of the model's rate limiter
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    prefix = get_prompt_prefix(SYSTEM_PROMPT, model=model)
+    latencies = []
+    errors = 0
+    correct = 0
+
+    async def classify(message, label):
+        nonlocal errors, correct
+        request = {"model": model, "messages": prefix.messages(message)}
+        request.update(classification_params(mode, model))
+        # The latency counts from the rate limiter's admission: the wait for the limiter is the same
+        # with and without hedging and is reported apart
+        admitted = []
+        async with semaphore:
+            try:
+                response = await create_chat_completion_async(async_client, request, hedge_policy=policy,
+                                                              is_valid=has_label,
+                                                              on_admit=lambda: admitted.append(time.perf_counter()))
+            except Exception as e:
+                print(f"Error: {str(e)}")
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - admitted[0])
+        if extract_intention(response.choices[0].message.content) == str(label):
+            correct += 1
+
+    await asyncio.gather(*(classify(message, label) for message, label in items))
+    answered = len(latencies)
+    return {
+        "policy": f"hedge at p{policy.hedge_percentile:g}" if policy else "no hedging",
+        "errors": errors,
+        "accuracy": correct / answered if answered else 0,
+        "latency": summarize_latencies(latencies),
+        "hedging": policy.summary() if policy else None,
+        "rate_limiter": dict(rate_limiter_for(model).stats)
+    }
+
+
+async def run_policies(async_client, items, model, mode, concurrency, policies):
+    """
+    Run every policy in turn in one event loop, so the client keeps its connections. Every policy starts
+    with fresh rate limiters, so an earlier policy has not drained the buckets of a later one.
+    """
+    results = []
+    for policy in policies:
+        name = f"hedging at p{policy.hedge_percentile:g}" if policy else "no hedging"
+        print(f"Classifying {len(items)} messages with {name}...")
+        reset_rate_limiters()
+        results.append(await run_policy(async_client, items, model, mode, concurrency, policy))
+    await async_client.close()
+    return results
+
+
+def add_improvements(results):
+    """Add the p95 and p99 reductions of every policy against the baseline (the first result)"""
+    baseline = results[0]["latency"]
+    for result in results:
+        result["p95_reduction"] = reduction(baseline["p95"], result["latency"]["p95"])
+        result["p99_reduction"] = reduction(baseline["p99"], result["latency"]["p99"])
+
+
+def print_report(results):
+    """
+    Print the latency percentiles, extra request rate and tail reductions of every policy, then the
+    time spent waiting for the rate limiter, which the latencies leave out
+    """
+    def percent(value):
+        return f"{value:.1%}" if value is not None else "n/a"
+
+    print(f"\n{'Policy':<16} {'p50':>8} {'p95':>8} {'p99':>8} {'Extra req':>10} {'p95 cut':>8} {'p99 cut':>8} "
+          f"{'Accuracy':>9}")
+    for result in results:
+        latency = result["latency"]
+        extra = result["hedging"]["extra_request_rate"] if result["hedging"] else 0
+        print(f"{result['policy']:<16} {format_seconds(latency['p50']):>8} {format_seconds(latency['p95']):>8} "
+              f"{format_seconds(latency['p99']):>8} {extra:>10.1%} {percent(result['p95_reduction']):>8} "
+              f"{percent(result['p99_reduction']):>8} {result['accuracy']:>9.2%}")
+
+    waits = ", ".join(f"{result['policy']} {result['rate_limiter']['wait_seconds']:.1f}s" for result in results)
+    print(f"Latencies count from the rate limiter's admission; time waited for the limiter: {waits}")
+
+
+def main():
+    """
+    Main function to parse arguments and compare hedging policies against no hedging
+    """
+    parser = argparse.ArgumentParser(description='Compare tail latency and extra requests of hedged classification '
+                                                 'requests at several percentiles of recent latency')
+    parser.add_argument('--model', type=str, default=DEFAULT_PRIMARY_MODEL,
+                        help=f'Model to use (default: {DEFAULT_PRIMARY_MODEL})')
+    parser.add_argument('--mode', type=str, default='short', choices=CLASSIFICATION_MODES,
+                        help='Classification mode limiting the model output (default: short)')
+    parser.add_argument('--percentiles', type=float, nargs='+', default=DEFAULT_PERCENTILES,
+                        help=f'Hedge percentiles to compare (default: {" ".join(map(str, DEFAULT_PERCENTILES))})')
+    parser.add_argument('--hedge-budget', type=float, default=DEFAULT_MAX_EXTRA_RATE,
+                        help=f'Most duplicate requests per request (default: {DEFAULT_MAX_EXTRA_RATE})')
+    parser.add_argument('--files', type=str, nargs='+', default=['messages_mappings100.py'],
+                        help='Labelled messages to classify (default: messages_mappings100.py)')
+    parser.add_argument('--requests', type=int, default=500,
+                        help='Classifications per policy, cycling through the messages (default: 500)')
+    parser.add_argument('--concurrency', type=int, default=10, help='Classifications in flight (default: 10)')
+    parser.add_argument('--local', action='store_true',
+                        help='Start the local OpenAI stand-in in the background and classify against it')
+    local_openai_server.add_config_arguments(parser.add_argument_group('local stand-in settings (with --local)'))
+
+    args = parser.parse_args()
+
+    base_url = os.environ.get("OPENAI_BASE_URL")
+    if args.local:
+        _, base_url = local_openai_server.start_in_background(port=0, config=local_openai_server.config_from_args(args))
+        print(f"Local OpenAI stand-in on {base_url}")
+    async_client = openai.AsyncOpenAI(api_key=openai_api_key, base_url=base_url)
+
+    messages, labels = load_training_data(args.files)
+    items = [(messages[i % len(messages)], labels[i % len(messages)]) for i in range(args.requests)]
+
+    policies = [None] + [HedgePolicy(pct, max_extra_rate=args.hedge_budget) for pct in args.percentiles]
+    results = asyncio.run(run_policies(async_client, items, args.model, args.mode, args.concurrency, policies))
+
+    add_improvements(results)
+    print(f"\n{args.model}, {len(items)} classifications per policy at concurrency {args.concurrency}, "
+          f"at most {args.hedge_budget:.0%} extra requests")
+    print_report(results)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = f"hedging_{timestamp}.json"
+    with open(results_file, "w") as f:
+        json.dump({"model": args.model, "mode": args.mode, "concurrency": args.concurrency, "results": results},
+                  f, indent=2)
+
+    print(f"\nDetailed results saved to {results_file}")
+
+
+if __name__ == "__main__":
+    main()
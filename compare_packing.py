@@ -0,0 +1,120 @@
+import os
+import json
+import argparse
+from openai import OpenAI
+from datetime import datetime
+from intent_extractor import extract_intention
+from latency_stats import format_seconds, reduction
+from rate_limiter import print_rate_limit_stats
+from message_packing import classify_packed
+from create_jsonl import SYSTEM_PROMPT
+from messages_mappings100 import vague_messages, correct_mappings
+
+# Initialize the OpenAI client
+api_key = os.environ.get("OPENAI_API_KEY")
+if not api_key:
+    raise ValueError("OPENAI_API_KEY environment variable is not set")
+
+client = OpenAI(api_key=api_key, base_url=os.environ.get("OPENAI_BASE_URL"))
+
+DEFAULT_MODELS = ["gpt-4o-mini", "gpt-4.1"]
+
+# Guest messages per request; 1 is the single-message baseline
+DEFAULT_PACK_SIZES = [1, 5, 10, 20]
+
+
+def run_pack_size(model, pack_size, messages, mappings):
+    """
+    Classify the messages with one model and pack size.
+
+    Returns:
+        dict: Accuracy and the packing summary (packing factor, tokens per classification, retries, latency)
+    """
+    responses, summary = classify_packed(client, messages, SYSTEM_PROMPT, model, pack_size)
+    correct = sum(extract_intention(response) == str(mapping) for response, mapping in zip(responses, mappings))
+    return dict(summary, model=model, accuracy=correct / len(messages) if messages else 0)
+
+
+def best_pack_size(results, max_accuracy_drop):
+    """
+    Pick the pack size with the fewest tokens per classification whose accuracy is at most
+    max_accuracy_drop below the single-message baseline.
+
+    Args:
+        results (list): Results of one model, the baseline first
+        max_accuracy_drop (float): Accepted accuracy loss (e.g. 0.02 for two percentage points)
+
+    Returns:
+        dict: The chosen result
+    """
+    baseline = results[0]
+    accepted = [result for result in results
+                if result["accuracy"] >= baseline["accuracy"] - max_accuracy_drop
+                and result["tokens_per_classification"] is not None]
+    return min(accepted or [baseline], key=lambda result: result["tokens_per_classification"])
+
+
+def print_report(model, results, best):
+    """Print packing factor, tokens per classification and accuracy of every pack size of one model"""
+    baseline = results[0]
+    print(f"\n{model}")
+    print(f"{'Pack':>5} {'Factor':>7} {'Tokens/cls':>11} {'Token cut':>10} {'Accuracy':>9} {'Acc. change':>12} "
+          f"{'Retried':>8} {'p50 request':>12}")
+    for result in results:
+        tokens = result["tokens_per_classification"]
+        token_cut = reduction(baseline["tokens_per_classification"], tokens)
+        marker = "*" if result is best else " "
+        print(f"{marker}{result['pack_size']:>4} {result['packing_factor'] or 0:>7.1f} "
+              f"{tokens if tokens is not None else float('nan'):>11.1f} "
+              f"{token_cut if token_cut is not None else float('nan'):>10.1%} "
+              f"{result['accuracy']:>9.2%} {result['accuracy'] - baseline['accuracy']:>+12.2%} "
+              f"{result['retried']:>8} {format_seconds(result['latency']['p50']):>12}")
+    print(f"Best pack size for {model}: {best['pack_size']}")
+
+
+def main():
+    """
+    Main function to parse arguments and compare the pack sizes
+    """
+    parser = argparse.ArgumentParser(description='Compare tokens per classification and accuracy of classifying '
+                                                 'several guest messages per request')
+    parser.add_argument('--models', type=str, nargs='+', default=DEFAULT_MODELS,
+                        help=f'Models to compare (default: {" ".join(DEFAULT_MODELS)})')
+    parser.add_argument('--pack-sizes', type=int, nargs='+', default=DEFAULT_PACK_SIZES,
+                        help=f'Guest messages per request (default: {" ".join(map(str, DEFAULT_PACK_SIZES))}); '
+                             '1 is always run as the baseline')
+    parser.add_argument('--limit', type=int, default=40, help='Number of messages per run (default: 40)')
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.02,
+                        help='Accuracy loss against the baseline accepted for the best pack size (default: 0.02)')
+
+    args = parser.parse_args()
+
+    if min(args.pack_sizes) < 1:
+        parser.error("--pack-sizes must be at least 1")
+    pack_sizes = [1] + sorted(set(size for size in args.pack_sizes if size > 1))
+    messages = vague_messages[:args.limit]
+    mappings = correct_mappings[:args.limit]
+
+    report = {}
+    for model in args.models:
+        results = []
+        for pack_size in pack_sizes:
+            print(f"Classifying {len(messages)} messages with {model}, {pack_size} per request...")
+            results.append(run_pack_size(model, pack_size, messages, mappings))
+
+        best = best_pack_size(results, args.max_accuracy_drop)
+        print_report(model, results, best)
+        report[model] = {"results": results, "best_pack_size": best["pack_size"]}
+
+    print_rate_limit_stats()
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = f"packing_{timestamp}.json"
+    with open(results_file, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\nDetailed results saved to {results_file}")
+
+
+if __name__ == "__main__":
+    main()
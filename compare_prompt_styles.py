@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import argparse
+from openai import OpenAI
+from datetime import datetime
+from intent_extractor import extract_intention
+from latency_stats import summarize_latencies, format_seconds, reduction
+from rate_limiter import create_chat_completion, print_rate_limit_stats
+from create_jsonl import PROMPT_STYLES, prompt_messages
+from messages_mappings100 import vague_messages, correct_mappings
+
+# Initialize the OpenAI client
+api_key = os.environ.get("OPENAI_API_KEY")
+if not api_key:
+    raise ValueError("OPENAI_API_KEY environment variable is not set")
+
+client = OpenAI(api_key=api_key, base_url=os.environ.get("OPENAI_BASE_URL"))
+
+# MODEL=STYLE pairs; the first one is the baseline of the reductions
+DEFAULT_RUNS = [
+    "ft:gpt-4o-mini-2024-07-18:personal:sft400:BUKolthG=full",
+    "ft:gpt-4o-mini-2024-07-18:personal:sft400:BUKolthG=minimal",
+    "ft:gpt-4o-mini-2024-07-18:personal:sft400:BUKolthG=none",
+]
+
+
+def parse_run(run):
+    """
+    Split a MODEL=STYLE run into its model and prompt style.
+
+    Returns:
+        tuple: (model, prompt style)
+    """
+    model, _, style = run.rpartition("=")
+    if not model or style not in PROMPT_STYLES:
+        raise argparse.ArgumentTypeError(f"Expected MODEL=STYLE with STYLE one of {list(PROMPT_STYLES)}: {run}")
+    return model, style
+
+
+def run_style(model, prompt_style, messages, mappings):
+    """
+    Classify the messages with one model in one prompt style.
+
+    Args:
+        model (str): The model to use
+        prompt_style (str): One of PROMPT_STYLES
+        messages (list): Guest messages
+        mappings (list): Correct intention numbers for the messages
+
+    Returns:
+        dict: Accuracy, input token and latency statistics
+    """
+    latencies = []
+    prompt_tokens = []
+    correct = 0
+    errors = 0
+
+    for message, correct_mapping in zip(messages, mappings):
+        request = {
+            "model": model,
+            "messages": prompt_messages(message, prompt_style),
+            "max_tokens": 10,
+            "seed": 42
+        }
+
+        try:
+            start_time = time.perf_counter()
+            response = create_chat_completion(client, request)
+            latencies.append(time.perf_counter() - start_time)
+        except Exception as e:
+            print(f"Error for {model} ({prompt_style}): {str(e)}")
+            errors += 1
+            continue
+
+        prompt_tokens.append(response.usage.prompt_tokens)
+        if extract_intention(response.choices[0].message.content) == str(correct_mapping):
+            correct += 1
+
+    answered = len(latencies)
+    return {
+        "model": model,
+        "prompt_style": prompt_style,
+        "requests": len(messages),
+        "errors": errors,
+        "accuracy": correct / answered if answered > 0 else 0,
+        "mean_prompt_tokens": sum(prompt_tokens) / answered if answered > 0 else None,
+        "latency": summarize_latencies(latencies)
+    }
+
+
+def print_report(results):
+    """Print accuracy, input tokens and latency of every run, with the reductions against the first run"""
+    baseline = results[0]
+    print(f"\nBaseline: {baseline['model']} ({baseline['prompt_style']})")
+    print(f"{'Model':<52} {'Style':<8} {'Accuracy':>9} {'In tokens':>10} {'Token cut':>10} "
+          f"{'p50':>8} {'p95':>8} {'Latency cut':>12}")
+    for result in results:
+        token_cut = reduction(baseline["mean_prompt_tokens"], result["mean_prompt_tokens"])
+        latency_cut = reduction(baseline["latency"]["mean"], result["latency"]["mean"])
+        tokens = result["mean_prompt_tokens"]
+        print(f"{result['model']:<52} {result['prompt_style']:<8} {result['accuracy']:>9.2%} "
+              f"{tokens if tokens is not None else float('nan'):>10.1f} "
+              f"{token_cut if token_cut is not None else float('nan'):>10.1%} "
+              f"{format_seconds(result['latency']['p50']):>8} {format_seconds(result['latency']['p95']):>8} "
+              f"{latency_cut if latency_cut is not None else float('nan'):>12.1%}")
+
+
+def main():
+    """
+    Main function to parse arguments and compare the prompt styles
+    """
+    parser = argparse.ArgumentParser(description='Compare input tokens, latency and accuracy of prompt styles')
+    parser.add_argument('--runs', type=parse_run, nargs='+', default=[parse_run(run) for run in DEFAULT_RUNS],
+                        help='MODEL=STYLE pairs, e.g. a model fine-tuned with create_jsonl.py --prompt-style none '
+                             'with STYLE none; the first pair is the baseline')
+    parser.add_argument('--limit', type=int, default=20, help='Number of messages per run (default: 20)')
+
+    args = parser.parse_args()
+
+    messages = vague_messages[:args.limit]
+    mappings = correct_mappings[:args.limit]
+
+    results = []
+    for model, prompt_style in args.runs:
+        print(f"Classifying {len(messages)} messages with {model} and prompt style {prompt_style}...")
+        results.append(run_style(model, prompt_style, messages, mappings))
+
+    print_report(results)
+    print_rate_limit_stats()
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = f"prompt_styles_{timestamp}.json"
+    with open(results_file, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\nDetailed results saved to {results_file}")
+
+
+if __name__ == "__main__":
+    main()
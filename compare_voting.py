@@ -0,0 +1,157 @@
+import os
+import json
+import argparse
+from openai import OpenAI
+from datetime import datetime
+from rate_limiter import print_rate_limit_stats
+from self_consistency import vote_classification, vote_with_separate_requests
+from prompt_cache import get_prompt_prefix
+from create_jsonl import SYSTEM_PROMPT
+from messages_mappings100 import vague_messages, correct_mappings
+
+# Initialize the OpenAI client
+api_key = os.environ.get("OPENAI_API_KEY")
+if not api_key:
+    raise ValueError("OPENAI_API_KEY environment variable is not set")
+
+client = OpenAI(api_key=api_key, base_url=os.environ.get("OPENAI_BASE_URL"))
+
+# Samples per message; 1 is the single-sample baseline
+DEFAULT_SAMPLES = [1, 3, 5, 7]
+
+# Ways of drawing the samples
+STRATEGIES = {
+    "n": vote_classification,
+    "separate": vote_with_separate_requests,
+}
+
+
+def run_votes(model, strategy, samples, messages, mappings, temperature, max_tokens):
+    """
+    Classify the messages by majority vote over samples drawn with one strategy.
+
+    Returns:
+        dict: Accuracy, mean vote share and prompt/completion tokens per message
+    """
+    correct = 0
+    errors = 0
+    vote_shares = []
+    prompt_tokens = 0
+    completion_tokens = 0
+
+    for message, correct_mapping in zip(messages, mappings):
+        request = {
+            "model": model,
+            "messages": get_prompt_prefix(SYSTEM_PROMPT, model=model).messages(message),
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        try:
+            vote = STRATEGIES[strategy](client, request, samples)
+        except Exception as e:
+            print(f"Error for {model} ({strategy}, {samples} samples): {str(e)}")
+            errors += 1
+            continue
+
+        vote_shares.append(vote["vote_share"])
+        prompt_tokens += vote["prompt_tokens"]
+        completion_tokens += vote["completion_tokens"]
+        if vote["label"] == str(correct_mapping):
+            correct += 1
+
+    answered = len(vote_shares)
+    return {
+        "model": model,
+        "strategy": strategy,
+        "samples": samples,
+        "errors": errors,
+        "accuracy": correct / answered if answered else 0,
+        "mean_vote_share": sum(vote_shares) / answered if answered else None,
+        "prompt_tokens_per_message": prompt_tokens / answered if answered else None,
+        "completion_tokens_per_message": completion_tokens / answered if answered else None
+    }
+
+
+def add_gains(results):
+    """
+    Add the accuracy gain per extra token against the single-sample baseline (the first result).
+
+    gain_per_1k_output_tokens is the accuracy gain in percentage points per 1000 extra output tokens
+    per message; gain_per_1k_tokens counts the extra prompt tokens as well, which only grow when every
+    sample is a separate request.
+    """
+    baseline = results[0]
+    for result in results[1:]:
+        if baseline["completion_tokens_per_message"] is None or result["completion_tokens_per_message"] is None:
+            continue
+        gain = (result["accuracy"] - baseline["accuracy"]) * 100
+        extra_output = result["completion_tokens_per_message"] - baseline["completion_tokens_per_message"]
+        extra_total = extra_output + result["prompt_tokens_per_message"] - baseline["prompt_tokens_per_message"]
+        result["accuracy_gain"] = gain / 100
+        result["extra_output_tokens"] = extra_output
+        result["extra_tokens"] = extra_total
+        result["gain_per_1k_output_tokens"] = gain / extra_output * 1000 if extra_output > 0 else None
+        result["gain_per_1k_tokens"] = gain / extra_total * 1000 if extra_total > 0 else None
+
+
+def print_report(model, results):
+    """Print accuracy, vote share, tokens and gain per extra token of every strategy and sample count"""
+    def number(value, spec):
+        return format(value if value is not None else float("nan"), spec)
+
+    print(f"\n{model} (gains in accuracy points per 1000 extra tokens per message)")
+    print(f"{'Strategy':<9} {'Samples':>7} {'Accuracy':>9} {'Vote share':>11} {'In tokens':>10} {'Out tokens':>11} "
+          f"{'Gain/1k out':>12} {'Gain/1k all':>12}")
+    for result in results:
+        print(f"{result['strategy']:<9} {result['samples']:>7} {result['accuracy']:>9.2%} "
+              f"{number(result['mean_vote_share'], '>11.1%')} {number(result['prompt_tokens_per_message'], '>10.1f')} "
+              f"{number(result['completion_tokens_per_message'], '>11.1f')} "
+              f"{number(result.get('gain_per_1k_output_tokens'), '>12.2f')} "
+              f"{number(result.get('gain_per_1k_tokens'), '>12.2f')}")
+
+
+def main():
+    """
+    Main function to parse arguments and compare self-consistency voting with n against separate requests
+    """
+    parser = argparse.ArgumentParser(description='Compare majority voting over n samples in one request '
+                                                 'with voting over separate requests')
+    parser.add_argument('--model', type=str, default='gpt-4o-mini', help='Model to test (default: gpt-4o-mini)')
+    parser.add_argument('--samples', type=int, nargs='+', default=DEFAULT_SAMPLES,
+                        help=f'Samples per message (default: {" ".join(map(str, DEFAULT_SAMPLES))}); '
+                             '1 is always run as the baseline')
+    parser.add_argument('--strategies', type=str, nargs='+', default=list(STRATEGIES), choices=list(STRATEGIES),
+                        help='n: all samples in one request; separate: one request per sample (default: both)')
+    parser.add_argument('--temperature', type=float, default=0.7, help='Sampling temperature (default: 0.7)')
+    parser.add_argument('--max-tokens', type=int, default=10, help='Output limit per sample (default: 10)')
+    parser.add_argument('--limit', type=int, default=20, help='Number of messages (default: 20)')
+
+    args = parser.parse_args()
+
+    messages = vague_messages[:args.limit]
+    mappings = correct_mappings[:args.limit]
+
+    print(f"Classifying {len(messages)} messages with {args.model} and a single sample...")
+    results = [run_votes(args.model, "n", 1, messages, mappings, args.temperature, args.max_tokens)]
+    results[0]["strategy"] = "single"
+    for strategy in args.strategies:
+        for samples in sorted(set(samples for samples in args.samples if samples > 1)):
+            print(f"Classifying {len(messages)} messages with {args.model}, "
+                  f"majority of {samples} samples ({strategy})...")
+            results.append(run_votes(args.model, strategy, samples, messages, mappings,
+                                     args.temperature, args.max_tokens))
+
+    add_gains(results)
+    print_report(args.model, results)
+    print_rate_limit_stats()
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = f"voting_{timestamp}.json"
+    with open(results_file, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\nDetailed results saved to {results_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime
+import local_openai_server
+from classification_modes import CLASSIFICATION_MODES
+from latency_stats import summarize_latencies, format_seconds, reduction
+from rate_limiter import create_chat_completion_async, print_rate_limit_stats
+from lexical_classifier import load_training_data
+from classify_service import KEEPALIVE_EXPIRY, build_classification_request, create_pooled_client
+from warmup import DEFAULT_CONNECTIONS, DEFAULT_PING_INTERVAL, ModelWarmer
+from cascade_router import DEFAULT_PRIMARY_MODEL
+
+openai_api_key = os.environ.get("OPENAI_API_KEY")
+if not openai_api_key:
+    raise ValueError("OPENAI_API_KEY environment variable is not set")
+
+
+async def run_policy(base_url, models, messages, mode, rounds, idle, burst, keepalive_expiry, keep_warm=False,
+                     interval=DEFAULT_PING_INTERVAL, connections=DEFAULT_CONNECTIONS):
+    """
+    Classify a burst of messages after each of several quiet periods, with or without keeping the models warm.
+
+    Args:
+        base_url (str): API base URL, None for the OpenAI API
+        models (list): Models to classify with, each in its own burst
+        messages (list): Guest messages, used in turn
+        mode (str): Classification mode limiting the output
+        rounds (int): Number of quiet periods
+        idle (float): Seconds of each quiet period
+        burst (int): Classifications after the first one of each round
+        keepalive_expiry (float): Seconds the client keeps an idle connection open
+        keep_warm (bool): Whether a ModelWarmer warms the models up and sends keep-alive calls
+        interval (float): Idle seconds before a keep-alive round
+        connections (int): Concurrent calls per warm-up or keep-alive round
+
+    Returns:
+        dict: errors, and per model the latency summaries of the first classification after each quiet
+            period and of the following ones, and the synthetic calls sent
+    """
+    client = create_pooled_client(base_url, keepalive_expiry=keepalive_expiry)
+    warmer = ModelWarmer(client, lambda message, model: build_classification_request(message, model, mode=mode),
+                         interval, cold_after=idle, connections=connections)
+    for model in models:
+        warmer.register(model)
+
+    keep_alive_task = None
+    if keep_warm:
+        await warmer.warm_up()
+        keep_alive_task = asyncio.ensure_future(warmer.run())
+
+    first = {model: [] for model in models}
+    steady = {model: [] for model in models}
+    errors = 0
+    sent = 0
+
+    async def classify_burst(model, offset):
+        nonlocal errors
+        for index in range(burst + 1):
+            request = build_classification_request(messages[(offset + index) % len(messages)], model, mode=mode)
+            start_time = time.perf_counter()
+            try:
+                await warmer.call(model, lambda: create_chat_completion_async(client, request))
+            except Exception as e:
+                print(f"Error: {str(e)}")
+                errors += 1
+                continue
+            (steady if index else first)[model].append(time.perf_counter() - start_time)
+
+    try:
+        for round_index in range(rounds):
+            print(f"  Round {round_index + 1}/{rounds}: quiet for {idle:g}s...")
+            await asyncio.sleep(idle)
+            await asyncio.gather(*(classify_burst(model, sent + i * (burst + 1)) for i, model in enumerate(models)))
+            sent += len(models) * (burst + 1)
+    finally:
+        if keep_alive_task is not None:
+            keep_alive_task.cancel()
+        await client.close()
+
+    warmup = warmer.summary()
+    return {
+        "policy": "keep warm" if keep_warm else "no warm-up",
+        "errors": errors,
+        "models": {model: {
+            "first": summarize_latencies(first[model]),
+            "steady": summarize_latencies(steady[model]),
+            "synthetic_calls": warmup[model]["warmup_calls"] + warmup[model]["pings"],
+            "synthetic_errors": warmup[model]["synthetic_errors"]
+        } for model in models}
+    }
+
+
+def add_improvements(results):
+    """Add the reduction of the first-call p50 and max of every policy against the baseline (the first result)"""
+    baseline = results[0]["models"]
+    for result in results:
+        for model, entry in result["models"].items():
+            entry["spike"] = (entry["first"]["p50"] / entry["steady"]["p50"]
+                              if entry["first"]["count"] and entry["steady"]["count"] else None)
+            entry["first_p50_reduction"] = reduction(baseline[model]["first"]["p50"], entry["first"]["p50"])
+            entry["first_max_reduction"] = reduction(baseline[model]["first"]["max"], entry["first"]["max"])
+
+
+def print_report(results):
+    """Print the first-call and steady latency, the spike and the synthetic calls of every policy and model"""
+    def percent(value):
+        return f"{value:.1%}" if value is not None else "n/a"
+
+    for model in results[0]["models"]:
+        print(f"\n{model}")
+        print(f"{'Policy':<12} {'First p50':>10} {'First max':>10} {'Steady p50':>11} {'Steady p95':>11} "
+              f"{'Spike':>7} {'Synthetic':>10} {'p50 cut':>8} {'max cut':>8}")
+        for result in results:
+            entry = result["models"][model]
+            spike = f"{entry['spike']:.1f}x" if entry["spike"] is not None else "n/a"
+            print(f"{result['policy']:<12} {format_seconds(entry['first']['p50']):>10} "
+                  f"{format_seconds(entry['first']['max']):>10} {format_seconds(entry['steady']['p50']):>11} "
+                  f"{format_seconds(entry['steady']['p95']):>11} {spike:>7} {entry['synthetic_calls']:>10} "
+                  f"{percent(entry['first_p50_reduction']):>8} {percent(entry['first_max_reduction']):>8}")
+
+
+async def run_policies(base_url, models, messages, args):
+    """Run the policies in turn in one event loop"""
+    results = []
+    for keep_warm in (False, True):
+        policy = "keeping the models warm" if keep_warm else "without warm-up"
+        print(f"Classifying after {args.rounds} quiet periods {policy}...")
+        results.append(await run_policy(base_url, models, messages, args.mode, args.rounds, args.idle, args.burst,
+                                        args.keepalive_expiry, keep_warm, args.interval, args.connections))
+    return results
+
+
+def main():
+    """
+    Main function to parse arguments and compare the latency after quiet periods with and without keep-alive
+    """
+    parser = argparse.ArgumentParser(description='Measure the cold-start latency of fine-tuned models after quiet '
+                                                 'periods, without warm-up and with keep-alive calls')
+    parser.add_argument('--models', type=str, nargs='+', default=[DEFAULT_PRIMARY_MODEL],
+                        help=f'Models to measure (default: {DEFAULT_PRIMARY_MODEL})')
+    parser.add_argument('--mode', type=str, default='short', choices=CLASSIFICATION_MODES,
+                        help='Classification mode limiting the model output (default: short)')
+    parser.add_argument('--rounds', type=int, default=5, help='Quiet periods per policy (default: 5)')
+    parser.add_argument('--idle', type=float, default=120.0,
+                        help='Seconds of each quiet period (default: 120, longer than the connection keep-alive)')
+    parser.add_argument('--burst', type=int, default=5,
+                        help='Classifications after the first one of each round (default: 5)')
+    parser.add_argument('--interval', type=float, default=DEFAULT_PING_INTERVAL,
+                        help=f'Idle seconds before a keep-alive round (default: {DEFAULT_PING_INTERVAL})')
+    parser.add_argument('--connections', type=int, default=DEFAULT_CONNECTIONS,
+                        help=f'Concurrent calls per warm-up or keep-alive round (default: {DEFAULT_CONNECTIONS})')
+    parser.add_argument('--keepalive-expiry', type=float, default=KEEPALIVE_EXPIRY,
+                        help=f'Seconds the client keeps an idle connection open (default: {KEEPALIVE_EXPIRY})')
+    parser.add_argument('--files', type=str, nargs='+', default=['messages_mappings100.py'],
+                        help='Messages to classify (default: messages_mappings100.py)')
+    parser.add_argument('--local', action='store_true',
+                        help='Start the local OpenAI stand-in in the background and classify against it')
+    local_openai_server.add_config_arguments(parser.add_argument_group('local stand-in settings (with --local)'))
+
+    args = parser.parse_args()
+
+    if args.interval >= args.idle:
+        parser.error("--interval must be shorter than --idle, else no keep-alive call is sent in a quiet period")
+
+    base_url = os.environ.get("OPENAI_BASE_URL")
+    if args.local:
+        _, base_url = local_openai_server.start_in_background(port=0, config=local_openai_server.config_from_args(args))
+        print(f"Local OpenAI stand-in on {base_url}")
+
+    messages, _ = load_training_data(args.files)
+    results = asyncio.run(run_policies(base_url, args.models, messages, args))
+
+    add_improvements(results)
+    print(f"\n{args.rounds} quiet periods of {args.idle:g}s, then {args.burst + 1} classifications per model; "
+          f"keep-alive after {args.interval:g}s idle with {args.connections} calls")
+    print_report(results)
+    print_rate_limit_stats()
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = f"warmup_{timestamp}.json"
+    with open(results_file, "w") as f:
+        json.dump({"models": args.models, "mode": args.mode, "idle": args.idle, "interval": args.interval,
+                   "results": results}, f, indent=2)
+
+    print(f"\nDetailed results saved to {results_file}")
+
+
+if __name__ == "__main__":
+    main()
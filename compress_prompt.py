@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import argparse
+from openai import OpenAI
+from datetime import datetime
+from intent_extractor import extract_intention
+from latency_stats import summarize_latencies, format_seconds, reduction
+from rate_limiter import create_chat_completion, print_rate_limit_stats
+from prompt_cache import count_prompt_tokens
+from prompt_variants import ORIGINAL_VARIANT, generate_variants, pareto_frontier, save_prompt_variant
+from create_jsonl import SYSTEM_PROMPT
+from messages_mappings100 import vague_messages, correct_mappings
+
+# Initialize the OpenAI client
+api_key = os.environ.get("OPENAI_API_KEY")
+if not api_key:
+    raise ValueError("OPENAI_API_KEY environment variable is not set")
+
+client = OpenAI(api_key=api_key, base_url=os.environ.get("OPENAI_BASE_URL"))
+
+# Base models the variants are searched for
+DEFAULT_MODELS = ["gpt-4o-mini", "gpt-4.1"]
+
+
+def evaluate_variant(model, name, prompt, messages, mappings):
+    """
+    Classify the messages with one model and one prompt variant.
+
+    Args:
+        model (str): The model to use
+        name (str): Name of the variant
+        prompt (str): System prompt of the variant
+        messages (list): Guest messages
+        mappings (list): Correct intention numbers for the messages
+
+    Returns:
+        dict: Accuracy, prompt token and latency statistics
+    """
+    latencies = []
+    prompt_tokens = []
+    correct = 0
+    errors = 0
+
+    for message, correct_mapping in zip(messages, mappings):
+        request = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": message}
+            ],
+            "max_tokens": 10,
+            "seed": 42
+        }
+
+        try:
+            start_time = time.perf_counter()
+            response = create_chat_completion(client, request)
+            latencies.append(time.perf_counter() - start_time)
+        except Exception as e:
+            print(f"Error for {model} ({name}): {str(e)}")
+            errors += 1
+            continue
+
+        prompt_tokens.append(response.usage.prompt_tokens)
+        if extract_intention(response.choices[0].message.content) == str(correct_mapping):
+            correct += 1
+
+    answered = len(latencies)
+    return {
+        "model": model,
+        "variant": name,
+        "requests": len(messages),
+        "errors": errors,
+        "accuracy": correct / answered if answered > 0 else 0,
+        "mean_prompt_tokens": sum(prompt_tokens) / answered if answered > 0 else None,
+        "latency": summarize_latencies(latencies)
+    }
+
+
+def print_variants(variants, model):
+    """Print the variants with their prompt tokens, counted offline"""
+    baseline = count_prompt_tokens(variants[ORIGINAL_VARIANT], model)
+    print(f"{'Variant':<60} {'Tokens':>7} {'Token cut':>10}")
+    for name, prompt in variants.items():
+        tokens = count_prompt_tokens(prompt, model)
+        print(f"{name:<60} {tokens:>7} {reduction(baseline, tokens):>10.1%}")
+
+
+def print_report(model, results, frontier):
+    """Print accuracy, prompt tokens and latency of every variant of one model, marking the Pareto frontier"""
+    baseline = results[0]
+    frontier_names = {result["variant"] for result in frontier}
+    print(f"\n{model} (* = Pareto frontier of prompt tokens, p50 latency and accuracy)")
+    print(f"{'Variant':<62} {'Accuracy':>9} {'In tokens':>10} {'Token cut':>10} {'p50':>8} {'Latency cut':>12}")
+    for result in results:
+        tokens = result["mean_prompt_tokens"]
+        token_cut = reduction(baseline["mean_prompt_tokens"], tokens)
+        latency_cut = reduction(baseline["latency"]["p50"], result["latency"]["p50"])
+        marker = "*" if result["variant"] in frontier_names else " "
+        print(f"{marker} {result['variant']:<60} {result['accuracy']:>9.2%} "
+              f"{tokens if tokens is not None else float('nan'):>10.1f} "
+              f"{token_cut if token_cut is not None else float('nan'):>10.1%} "
+              f"{format_seconds(result['latency']['p50']):>8} "
+              f"{latency_cut if latency_cut is not None else float('nan'):>12.1%}")
+
+
+def main():
+    """
+    Main function to parse arguments and search the prompt variants
+    """
+    parser = argparse.ArgumentParser(description='Search shortened system prompts for base models and report the '
+                                                 'Pareto frontier of prompt tokens, latency and accuracy')
+    parser.add_argument('--models', type=str, nargs='+', default=DEFAULT_MODELS,
+                        help=f'Models to evaluate the variants with (default: {" ".join(DEFAULT_MODELS)})')
+    parser.add_argument('--limit', type=int, default=20, help='Number of messages per variant (default: 20)')
+    parser.add_argument('--exhaustive', action='store_true',
+                        help='Drop every combination of guideline sections instead of dropping them one after another')
+    parser.add_argument('--variants', type=str, nargs='+',
+                        help='Only evaluate these variants (the original prompt is always the baseline)')
+    parser.add_argument('--list', action='store_true',
+                        help='Only list the variants with their token counts, without sending requests')
+    parser.add_argument('--save', type=str, nargs='+', metavar='VARIANT',
+                        help='Store these variants in prompt_variants.json, so they can be selected with '
+                             '--prompt-variant in openai_eval.py and test_intent_4o-mini_200.py')
+
+    args = parser.parse_args()
+
+    all_variants = generate_variants(SYSTEM_PROMPT, args.exhaustive)
+    unknown = [name for name in (args.variants or []) + (args.save or []) if name not in all_variants]
+    if unknown:
+        parser.error(f"Unknown variants: {', '.join(unknown)} (see --list)")
+
+    if args.list:
+        print_variants(all_variants, args.models[0])
+        return
+
+    variants = all_variants
+    if args.variants:
+        variants = {name: prompt for name, prompt in all_variants.items()
+                    if name == ORIGINAL_VARIANT or name in args.variants}
+
+    messages = vague_messages[:args.limit]
+    mappings = correct_mappings[:args.limit]
+
+    report = {"models": {}}
+    for model in args.models:
+        results = []
+        for name, prompt in variants.items():
+            print(f"Classifying {len(messages)} messages with {model} and variant {name}...")
+            results.append(evaluate_variant(model, name, prompt, messages, mappings))
+
+        frontier = pareto_frontier(results)
+        print_report(model, results, frontier)
+        report["models"][model] = {
+            "results": results,
+            "pareto_frontier": [result["variant"] for result in frontier]
+        }
+
+    print_rate_limit_stats()
+
+    for name in args.save or []:
+        evaluation = {model: next(result for result in entry["results"] if result["variant"] == name)
+                      for model, entry in report["models"].items()
+                      if any(result["variant"] == name for result in entry["results"])}
+        save_prompt_variant(name, all_variants[name], evaluation or None)
+        print(f"Saved variant {name} to prompt_variants.json")
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = f"prompt_compression_{timestamp}.json"
+    with open(results_file, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\nDetailed results saved to {results_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import json
+import argparse
 
 from messages_mappings200_2 import vague_messages, correct_mappings
 
@@ -75,16 +76,89 @@ LIST OF INTENTIONS:
 39. Request human support or live agent  
 40. Ask for help using the chatbot"""
 
-# Create the JSONL data
-with open('tests200_2.jsonl', 'w') as f:
-    for i in range(len(vague_messages)):
-        example = {
-            "messages": [
-                {"role": "developer", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": vague_messages[i]},
-                {"role": "assistant", "content": str(correct_mappings[i])}
-            ]
-        }
-        f.write(json.dumps(example) + '\n')
-
-print("Created tests200_2.jsonl with 200 examples in the correct format.")
\ No newline at end of file
+# Short instruction for models fine-tuned to know the 40 intentions without the list
+MINIMAL_PROMPT = "Classify the hotel guest message into one of the 40 intentions. Respond with only the intention number."
+
+# Developer message per prompt style; a model fine-tuned with a style must be queried with the same style.
+#   full    - the complete instructions with the list of 40 intentions
+#   minimal - a one-sentence instruction
+#   none    - no developer message, only the guest message
+PROMPT_STYLES = {
+    "full": SYSTEM_PROMPT,
+    "minimal": MINIMAL_PROMPT,
+    "none": None
+}
+
+
+def prompt_messages(message, prompt_style="full", role="developer", full_prompt=SYSTEM_PROMPT):
+    """
+    Build the messages sent for a guest message in a prompt style.
+
+    Args:
+        message (str): Guest message
+        prompt_style (str): One of PROMPT_STYLES
+        role (str): Role of the instruction message
+        full_prompt (str): Instructions used for the full style
+
+    Returns:
+        list: The instruction message (unless the style is none) and the user message
+    """
+    instructions = full_prompt if prompt_style == "full" else PROMPT_STYLES[prompt_style]
+    messages = [{"role": role, "content": instructions}] if instructions else []
+    messages.append({"role": "user", "content": message})
+    return messages
+
+
+def build_example(message, mapping, prompt_style="full"):
+    """
+    Build one fine-tuning example in the chat format.
+
+    Args:
+        message (str): Guest message
+        mapping: Correct intention number
+        prompt_style (str): One of PROMPT_STYLES
+
+    Returns:
+        dict: The example with developer (unless the style is none), user and assistant messages
+    """
+    return {
+        "messages": prompt_messages(message, prompt_style) + [
+            {"role": "assistant", "content": str(mapping)}
+        ]
+    }
+
+
+def create_jsonl(output_file, messages, mappings, prompt_style="full"):
+    """
+    Write the messages and their correct intentions as a JSONL fine-tuning file.
+
+    Args:
+        output_file (str): Path of the JSONL file
+        messages (list): Guest messages
+        mappings (list): Correct intention numbers
+        prompt_style (str): One of PROMPT_STYLES
+
+    Returns:
+        int: Number of examples written
+    """
+    with open(output_file, 'w') as f:
+        for message, mapping in zip(messages, mappings):
+            f.write(json.dumps(build_example(message, mapping, prompt_style)) + '\n')
+    return len(messages)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Create a JSONL fine-tuning file from the mapping file')
+    parser.add_argument('--prompt-style', type=str, default='full', choices=list(PROMPT_STYLES),
+                        help='Instructions included in every example (default: full)')
+    parser.add_argument('--output', type=str, help='Output file (default: tests200_2.jsonl, '
+                                                   'or tests200_2_<style>.jsonl for other styles)')
+    args = parser.parse_args()
+
+    output_file = args.output or ('tests200_2.jsonl' if args.prompt_style == 'full'
+                                  else f'tests200_2_{args.prompt_style}.jsonl')
+
+    # Create the JSONL data
+    create_jsonl(output_file, vague_messages, correct_mappings, args.prompt_style)
+
+    print(f"Created {output_file} with {len(vague_messages)} examples in the correct format.")
@@ -0,0 +1,133 @@
+import json
+import time
+import numpy as np
+from lexical_classifier import hashed_features, load_training_data, DEFAULT_TRAINING_FILES
+from messages_mappings100 import intention_names
+
+# Hash buckets of the retrieval vectors. The index is a dense (RETRIEVAL_DIM x examples) float32 matrix,
+# e.g. 400 examples take 13 MB; queries only read the rows of the message's own n-grams.
+RETRIEVAL_DIM = 2 ** 13
+
+# Instruction of the full test prompt asking for "INTENTION: #16 - name" and the reasoning instead of the number.
+# Examples answer with the INTENTION line only: a made-up reasoning repeated under every example would be
+# copied by the model and add prompt tokens without information
+REASONING_INSTRUCTION = "explain your reasoning"
+
+
+def answer_format(system_message, mode="free"):
+    """
+    Get how the few-shot examples answer, so they show the model the output the request asks for.
+
+    Args:
+        system_message (str): The system message of the request, or None
+        mode (str): Classification mode of the request
+
+    Returns:
+        callable: label -> assistant message content: JSON in json_schema mode, the bare number in
+            logit_bias mode or when the system message asks for only the number, else "INTENTION: #N - name"
+    """
+    if mode == "json_schema":
+        return lambda label: json.dumps({"intention": label})
+    if mode == "logit_bias" or system_message is None or REASONING_INSTRUCTION not in system_message:
+        return str
+    return lambda label: f"INTENTION: #{label} - {intention_names[int(label)]}"
+
+
+class FewShotIndex:
+    """Cosine-similarity index over labelled guest messages, to pick few-shot examples for a message"""
+
+    def __init__(self, messages, labels, vectors, dim=RETRIEVAL_DIM, build_time=None):
+        """
+        Args:
+            messages (list): Labelled guest messages
+            labels (list): Their intention numbers
+            vectors (numpy.ndarray): (dim, len(messages)) L2-normalized hashed n-gram vectors, one column
+                per message; a query gathers the rows of its own buckets
+            dim (int): Number of hash buckets
+            build_time (float): Seconds it took to build the index
+        """
+        self.messages = messages
+        self.labels = [str(label) for label in labels]
+        self.vectors = vectors
+        self.dim = dim
+        self.build_time = build_time
+
+    @classmethod
+    def build(cls, messages, labels, dim=RETRIEVAL_DIM):
+        """Build the index over labelled guest messages"""
+        start_time = time.perf_counter()
+        vectors = np.zeros((dim, len(messages)), dtype=np.float32)
+        for column, message in enumerate(messages):
+            indices, values = hashed_features(message, dim)
+            vectors[indices, column] = values
+        return cls(messages, labels, vectors, dim, time.perf_counter() - start_time)
+
+    @classmethod
+    def from_files(cls, training_files=DEFAULT_TRAINING_FILES, dim=RETRIEVAL_DIM):
+        """Build the index over the messages of JSONL files or messages_mappings*.py modules"""
+        messages, labels = load_training_data(training_files)
+        return cls.build(messages, labels, dim)
+
+    def query(self, message, k=5):
+        """
+        Find the labelled messages most similar to a message.
+
+        Args:
+            message (str): Guest message
+            k (int): Number of examples
+
+        Returns:
+            list: (message, label, cosine similarity) of the k most similar examples, most similar first.
+                An example identical to the message is skipped, so it cannot give away the answer.
+        """
+        if k <= 0:
+            return []
+        indices, values = hashed_features(message, self.dim)
+        similarities = values @ self.vectors[indices]
+
+        candidates = min(k + 1, len(self.messages))
+        top = np.argpartition(-similarities, candidates - 1)[:candidates]
+        top = top[np.argsort(-similarities[top])]
+        examples = [(self.messages[i], self.labels[i], float(similarities[i]))
+                    for i in top if self.messages[i] != message]
+        return examples[:k]
+
+    def example_turns(self, message, k=5, answer=str):
+        """
+        Get the k most similar labelled messages as few-shot turns.
+
+        The most similar example comes last, right before the guest message.
+
+        Args:
+            message (str): Guest message
+            k (int): Number of examples
+            answer (callable): Renders the assistant answer of a label, see answer_format (default: the number)
+
+        Returns:
+            list: Alternating user and assistant chat messages
+        """
+        turns = []
+        for example, label, _ in reversed(self.query(message, k)):
+            turns.append({"role": "user", "content": example})
+            turns.append({"role": "assistant", "content": answer(label)})
+        return turns
+
+
+def with_examples(messages, index, k=5, mode="free"):
+    """
+    Insert the few-shot turns for the guest message of a request between its instructions and the message.
+
+    The examples answer in the format the request's system message and mode ask for.
+
+    Args:
+        messages (list): Chat messages of the request, the guest message last
+        index (FewShotIndex): Retrieval index
+        k (int): Number of examples
+        mode (str): Classification mode of the request
+
+    Returns:
+        list: The chat messages with the examples
+    """
+    system_message = messages[0]["content"] if messages[0]["role"] != "user" else None
+    answer = answer_format(system_message, mode)
+    return messages[:-1] + index.example_turns(messages[-1]["content"], k, answer) + messages[-1:]
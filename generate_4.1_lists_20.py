@@ -2,13 +2,23 @@ import os
 import openai
 import json
 from datetime import datetime
-import time
+from concurrent.futures import ThreadPoolExecutor
+from response_cache import ResponseCache
+from intent_extractor import extract_intention
+from classification_modes import classification_params
+from rate_limiter import create_chat_completion, rate_limiter_for, print_rate_limit_stats
+from aimd_controller import AIMDController
+from prompt_cache import get_prompt_prefix, print_prompt_cache_stats
+from self_consistency import majority_vote, sample_texts
 
 openai_api_key = os.environ.get("OPENAI_API_KEY")
 if not openai_api_key:
     raise ValueError("OPENAI_API_KEY environment variable is not set")
 
-client = openai.OpenAI(api_key=openai_api_key)
+client = openai.OpenAI(api_key=openai_api_key, base_url=os.environ.get("OPENAI_BASE_URL"))
+
+# On-disk cache of chat completion responses, keyed by the full request
+response_cache = ResponseCache()
 
 # Function to generate vague messages using GPT-4.1
 def generate_vague_messages(num_messages=20):
@@ -99,18 +109,18 @@ def generate_vague_messages(num_messages=20):
 
     try:
         # Create a chat completion request
-        response = client.chat.completions.create(
-            model="gpt-4.1",
-            messages=[
+        response = create_chat_completion(client, {
+            "model": "gpt-4.1",
+            "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
-            temperature=0.9,  # Higher temperature for more creative variations
-            max_tokens=3000,
-            top_p=1.0,
-            frequency_penalty=0.2,
-            presence_penalty=0.2
-        )
+            "temperature": 0.9,  # Higher temperature for more creative variations
+            "max_tokens": 3000,
+            "top_p": 1.0,
+            "frequency_penalty": 0.2,
+            "presence_penalty": 0.2
+        })
 
         # Extract the response text
         response_text = response.choices[0].message.content
@@ -146,13 +156,69 @@ def generate_vague_messages(num_messages=20):
         return None
 
 # Function to test the hospitality chatbot with the generated messages
-def test_chatbot_with_messages(messages_data, model="gpt-4o-mini"):
+def fetch_responses_concurrently(requests, concurrency="auto"):
+    """
+    Send chat completion requests from a thread pool and collect the response texts.
+
+    Args:
+        requests (list): Chat completion requests
+        concurrency (int or str): Number of requests in flight, or "auto" to let an
+            AIMD controller find the highest concurrency that does not cause throttling or latency inflation
+
+    Returns:
+        list: Response text (the text of every sample for requests with n > 1, or the raised exception)
+            for each request, in input order
+    """
+    controller = None
+    if concurrency == "auto":
+        model = requests[0]["model"] if requests else None
+        controller = AIMDController(throttle_counter=lambda: rate_limiter_for(model).stats["throttled"])
+        max_workers = controller.maximum
+    else:
+        max_workers = int(concurrency)
+
+    def fetch(request):
+        # Cache hits do not take a slot from the controller, so they do not skew its latency baseline
+        cached_response = response_cache.get(request)
+        if cached_response is not None:
+            return cached_response
+
+        try:
+            if controller:
+                with controller:
+                    response = create_chat_completion(client, request)
+            else:
+                response = create_chat_completion(client, request)
+        except Exception as e:
+            return e
+
+        chatbot_response = sample_texts(response) if request.get("n", 1) > 1 else response.choices[0].message.content
+        response_cache.put(request, chatbot_response)
+        return chatbot_response
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        responses = list(executor.map(fetch, requests))
+
+    if controller:
+        controller.print_summary()
+
+    return responses
+
+# Function to test the hospitality chatbot with the generated messages
+def test_chatbot_with_messages(messages_data, model="gpt-4o-mini", use_cache=True, mode="free", concurrency=1,
+                               pad_prefix=False, votes=1):
     """
     Test the hospitality chatbot with the generated vague messages.
 
     Args:
         messages_data (list): List of dictionaries containing messages and correct mappings
         model (str): The model to test (default: gpt-4o-mini)
+        use_cache (bool): Whether to reuse responses from the on-disk response cache
+        mode (str): Classification mode limiting the output, see classification_modes (default: free)
+        concurrency (int or str): Number of requests in flight; "auto" adapts it with an AIMD controller (default: 1)
+        pad_prefix (bool): Whether to pad the system prompt to the prompt cache threshold
+        votes (int): Number of samples drawn with the n parameter in one request per message; the majority
+            label is taken (default: 1, a single sample)
 
     Returns:
         dict: Test results
@@ -244,10 +310,36 @@ def test_chatbot_with_messages(messages_data, model="gpt-4o-mini"):
         "detailed_results": []
     }
 
+    response_cache.bypass = not use_cache
+
+    requests = []
+    for message_data in messages_data:
+        request = {
+            "model": model,
+            # Byte-identical system prompt first, so the API can serve it from its prompt cache
+            "messages": get_prompt_prefix(system_prompt, pad=pad_prefix, model=model).messages(message_data["message"]),
+            "temperature": 0.7,
+            "top_p": 1.0,
+            "frequency_penalty": 0.0,
+            "presence_penalty": 0.0
+        }
+        request.update(classification_params(mode, model))
+        if votes > 1:
+            # k samples in one call: the prompt is billed once, only the output tokens grow
+            request["n"] = votes
+        requests.append(request)
+
+    # With concurrency, all responses are fetched up front and evaluated in input order below
+    prefetched = None
+    if concurrency != 1:
+        print(f"Sending requests with concurrency {concurrency}...")
+        prefetched = fetch_responses_concurrently(requests, concurrency)
+
     # Process each message
     for i, message_data in enumerate(messages_data):
         message = message_data["message"]
         correct_mapping = message_data["correct_mapping"]
+        request = requests[i]
 
         print(f"\nProcessing message {i+1}/{len(messages_data)}")
 
@@ -255,36 +347,39 @@ def test_chatbot_with_messages(messages_data, model="gpt-4o-mini"):
         correct_number = correct_mapping.split(' ')[0]
 
         try:
-            # Send the message to the chatbot
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": message}
-                ],
-                temperature=0.7,
-                max_tokens=1000,
-                top_p=1.0,
-                frequency_penalty=0.0,
-                presence_penalty=0.0
-            )
-
-            # Extract the response text
-            chatbot_response = response.choices[0].message.content
-
-            # Extract the intention from the response
-            extracted_intention = extract_intention(chatbot_response)
+            # Reuse the response of an identical earlier request (or the prefetched one)
+            if prefetched is not None:
+                chatbot_response = prefetched[i]
+                if isinstance(chatbot_response, Exception):
+                    raise chatbot_response
+            else:
+                chatbot_response = response_cache.get(request)
+
+            if chatbot_response is None:
+                # Send the message to the chatbot, paced and retried by the rate limiter
+                response = create_chat_completion(client, request)
+
+                # Extract the response text (of every sample when voting)
+                chatbot_response = sample_texts(response) if votes > 1 else response.choices[0].message.content
+                response_cache.put(request, chatbot_response)
+
+            # Extract the intention from the response, or the majority label of the samples
+            if votes > 1:
+                vote = majority_vote(chatbot_response)
+                extracted_intention = vote["label"]
+                chatbot_response = "\n--- next sample ---\n".join(chatbot_response)
+            else:
+                vote = None
+                extracted_intention = extract_intention(chatbot_response)
 
             # Determine if the mapping is correct
             is_correct = extracted_intention == correct_number if extracted_intention else False
 
-            # Add delay to avoid rate limits
-            time.sleep(1)
-
         except Exception as e:
             print(f"Error testing message: {str(e)}")
             chatbot_response = f"Error: {str(e)}"
             extracted_intention = None
+            vote = None
             is_correct = False
 
         # Store the result
@@ -294,6 +389,8 @@ def test_chatbot_with_messages(messages_data, model="gpt-4o-mini"):
             "explanation": message_data.get("explanation", ""),
             "chatbot_response": chatbot_response,
             "extracted_intention": extracted_intention,
+            "vote_share": vote["vote_share"] if vote else None,
+            "votes": vote["votes"] if vote else None,
             "is_correct": is_correct
         }
 
@@ -308,6 +405,8 @@ def test_chatbot_with_messages(messages_data, model="gpt-4o-mini"):
         print(f"Message: {message}")
         print(f"Correct mapping: {correct_mapping}")
         print(f"Extracted intention: {extracted_intention}")
+        if vote:
+            print(f"Vote share: {vote['vote_share']:.0%} ({vote['votes']})")
         print(f"Is correct: {is_correct}")
 
     # Calculate accuracy
@@ -320,7 +419,10 @@ def test_chatbot_with_messages(messages_data, model="gpt-4o-mini"):
         f.write(f"Total messages: {results['total_messages']}\n")
         f.write(f"Correct mappings: {results['correct_mappings']}\n")
         f.write(f"Incorrect mappings: {results['incorrect_mappings']}\n")
-        f.write(f"Accuracy: {accuracy:.2%}\n\n")
+        f.write(f"Accuracy: {accuracy:.2%}\n")
+        if votes > 1:
+            f.write(f"Majority vote of {votes} samples per message\n")
+        f.write("\n")
 
         for i, result in enumerate(results["detailed_results"]):
             f.write(f"=== Message {i+1} ===\n")
@@ -328,6 +430,8 @@ def test_chatbot_with_messages(messages_data, model="gpt-4o-mini"):
             f.write(f"Correct mapping: {result['correct_mapping']}\n")
             f.write(f"Explanation: {result['explanation']}\n")
             f.write(f"Extracted intention: {result['extracted_intention']}\n")
+            if result["vote_share"] is not None:
+                f.write(f"Vote share: {result['vote_share']:.0%} ({result['votes']})\n")
             f.write(f"Is correct: {result['is_correct']}\n")
             f.write(f"Chatbot response:\n{result['chatbot_response']}\n\n")
 
@@ -349,58 +453,14 @@ def test_chatbot_with_messages(messages_data, model="gpt-4o-mini"):
 
     print(f"\nTesting completed!")
     print(f"Accuracy: {accuracy:.2%}")
+    response_cache.print_stats()
+    print_rate_limit_stats()
+    print_prompt_cache_stats()
     print(f"Complete results saved to {results_file}")
     print(f"Messages and mappings saved to vague_messages_{timestamp}.py")
 
     return results
 
-def extract_intention(response):
-    """
-    Extract the intention number from the chatbot's response.
-
-    Args:
-        response (str): The chatbot's response
-
-    Returns:
-        str: The extracted intention number or None if not found
-    """
-    # Look for patterns like "INTENTION: #16 - Request room cleaning" or variations
-    import re
-
-    # Try different patterns
-    patterns = [
-        r"INTENTION:\s*#?(\d+)",
-        r"intention:\s*#?(\d+)",
-        r"#(\d+)\s*-",
-        r"intention\s*(?:is|:)?\s*(?:number)?\s*#?(\d+)",
-        r"intention\s*(?:is|:)?\s*(?:to)?\s*#?(\d+)",
-        r"(\d+)\s*-\s*[A-Za-z]"
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, response, re.IGNORECASE)
-        if match:
-            return match.group(1)
-
-    # If we can't find it with regex, try line by line
-    lines = response.split('\n')
-    for line in lines:
-        if "INTENTION:" in line or "intention:" in line or "#" in line:
-            parts = line.split('#')
-            if len(parts) > 1:
-                # Extract the number after #
-                intention_part = parts[1].strip()
-                # If there's a space or dash, get just the number
-                if ' ' in intention_part:
-                    intention_number = intention_part.split(' ')[0]
-                elif '-' in intention_part:
-                    intention_number = intention_part.split('-')[0]
-                else:
-                    intention_number = intention_part
-                return intention_number.strip()
-
-    return None
-
 def main():
     # Generate vague messages
     print("Generating vague messages using GPT-4.1...")
@@ -446,7 +506,7 @@ def main():
 
     if test_now.lower() == 'y':
         # Test the chatbot with the generated messages
-        test_results = test_chatbot_with_messages(generated_data)
+        test_results = test_chatbot_with_messages(generated_data, concurrency="auto")
         print("\nMessages that GPT-4o-mini got wrong:")
         for result in test_results["detailed_results"]:
             if not result["is_correct"]:
@@ -0,0 +1,165 @@
+import time
+import asyncio
+from collections import deque
+from intent_extractor import extract_intention
+from latency_stats import percentile, format_seconds
+
+# Hedged requests: if a call has not answered after the given percentile of recent call latencies,
+# the same call is sent again and the first valid answer wins; the other call is cancelled.
+# At the 95th percentile about 5% of calls are duplicated, and those are exactly the slow tail.
+# Only the upstream call is hedged: create_chat_completion_async(..., hedge_policy=policy) starts the
+# clock once the rate limiter has admitted the request, and a duplicate is skipped while the limiter has
+# no room for it, since a duplicate waiting in the same queue cannot answer sooner.
+
+DEFAULT_HEDGE_PERCENTILE = 95
+
+# Latencies of the most recent calls the hedge delay is taken from
+DEFAULT_LATENCY_WINDOW = 200
+
+# Until this many calls have completed, INITIAL_HEDGE_DELAY is used
+MIN_SAMPLES = 20
+INITIAL_HEDGE_DELAY = 1.0
+
+# Never hedge sooner than this, so a burst of fast answers cannot make every call a duplicate
+MIN_HEDGE_DELAY = 0.05
+
+# Most duplicate calls per call; above it calls are not hedged, so a slow API does not get twice the load
+DEFAULT_MAX_EXTRA_RATE = 0.1
+
+
+def has_label(response):
+    """Whether a chat completion answers a valid intention label, the usual is_valid of hedged classifications"""
+    return extract_intention(response.choices[0].message.content) is not None
+
+
+class HedgePolicy:
+    """
+    Decides when to send a duplicate of a slow call and keeps the statistics of the hedging.
+
+    One policy is shared by all calls to the same model from one event loop, so the hedge delay
+    follows the recent latency of that model.
+    """
+
+    def __init__(self, hedge_percentile=DEFAULT_HEDGE_PERCENTILE, window=DEFAULT_LATENCY_WINDOW,
+                 max_extra_rate=DEFAULT_MAX_EXTRA_RATE, min_delay=MIN_HEDGE_DELAY):
+        """
+        Args:
+            hedge_percentile (float): Percentile (0..100) of recent call latencies after which a duplicate is sent
+            window (int): Number of recent call latencies the percentile is taken over
+            max_extra_rate (float): Highest share of duplicate calls per call
+            min_delay (float): Lowest hedge delay in seconds
+        """
+        self.hedge_percentile = hedge_percentile
+        self.max_extra_rate = max_extra_rate
+        self.min_delay = min_delay
+        self.latencies = deque(maxlen=window)
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "skipped_budget": 0, "skipped_limiter": 0,
+                      "cancelled": 0}
+
+    def hedge_delay(self):
+        """Seconds to wait for the first call before sending the duplicate"""
+        if len(self.latencies) < MIN_SAMPLES:
+            return max(INITIAL_HEDGE_DELAY, self.min_delay)
+        return max(percentile(list(self.latencies), self.hedge_percentile), self.min_delay)
+
+    def within_budget(self):
+        """Whether one more duplicate keeps the duplicate calls within max_extra_rate of the calls"""
+        return self.stats["hedged"] + 1 <= self.max_extra_rate * self.stats["calls"]
+
+    async def call(self, send, is_valid=None, admit=None):
+        """
+        Run a call, sending a duplicate if it is slower than the hedge delay.
+
+        Args:
+            send (callable): Returns a new awaitable for each attempt, e.g. lambda: classify(message)
+            is_valid (callable): Whether a result answers the call (e.g. has a valid label); an invalid
+                result of the first call waits for the duplicate, if one was sent. Default: every result
+            admit (callable): Whether a duplicate may be sent now, e.g. the rate limiter has room for it
+                (and takes it); default: always
+
+        Returns:
+            The first valid result, else the last invalid result
+
+        Raises:
+            Exception: The error of the last attempt, if no attempt returned a result
+        """
+        self.stats["calls"] += 1
+        start_time = time.perf_counter()
+        attempts = {asyncio.ensure_future(send()): "primary"}
+        pending = set(attempts)
+        fallback = None
+        error = None
+        # Every attempt still running is cancelled on the way out, also when the caller is cancelled
+        try:
+            done, pending = await asyncio.wait(attempts, timeout=self.hedge_delay())
+
+            if not done:
+                if not self.within_budget():
+                    self.stats["skipped_budget"] += 1
+                elif admit is not None and not admit():
+                    self.stats["skipped_limiter"] += 1
+                else:
+                    self.stats["hedged"] += 1
+                    duplicate = asyncio.ensure_future(send())
+                    attempts[duplicate] = "hedge"
+                    pending.add(duplicate)
+
+            while True:
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    result = task.result()
+                    if is_valid is None or is_valid(result):
+                        if attempts[task] == "hedge":
+                            self.stats["hedge_wins"] += 1
+                        self._record(start_time)
+                        return result
+                    fallback = result
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+                self.stats["cancelled"] += 1
+
+        if fallback is not None:
+            self._record(start_time)
+            return fallback
+        raise error
+
+    def _record(self, start_time):
+        """
+        Record the end-to-end latency of an answered call. Calls are recorded rather than attempts,
+        so the slow attempts a duplicate overtook (and that are cancelled) still count.
+        """
+        self.latencies.append(time.perf_counter() - start_time)
+
+    def summary(self):
+        """
+        Summarize the hedging.
+
+        Returns:
+            dict: counters, extra_request_rate (duplicate calls per call), hedge_win_rate (share of
+                duplicates that answered first) and the current hedge delay in seconds
+        """
+        calls = self.stats["calls"]
+        hedged = self.stats["hedged"]
+        return dict(
+            self.stats,
+            hedge_percentile=self.hedge_percentile,
+            extra_request_rate=hedged / calls if calls else 0,
+            hedge_win_rate=self.stats["hedge_wins"] / hedged if hedged else None,
+            hedge_delay=self.hedge_delay()
+        )
+
+
+def format_hedging_summary(summary):
+    """Format the extra request rate and hedge wins for reports"""
+    win_rate = summary["hedge_win_rate"]
+    return (f"Hedging at p{summary['hedge_percentile']:g}: {summary['hedged']} duplicates for {summary['calls']} calls "
+            f"({summary['extra_request_rate']:.1%} extra requests), "
+            f"{f'{win_rate:.0%}' if win_rate is not None else 'n/a'} of them answered first, "
+            f"{summary['skipped_budget']} skipped over budget, {summary['skipped_limiter']} by the rate limiter, "
+            f"hedge delay {format_seconds(summary['hedge_delay'])}")
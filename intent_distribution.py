@@ -0,0 +1,100 @@
+import math
+from intent_extractor import MIN_INTENTION, MAX_INTENTION, validate_intention
+
+# Number of alternatives requested per output token (the API maximum)
+TOP_LOGPROBS = 20
+
+# Request parameters to get the log probabilities of the output tokens
+LOGPROB_PARAMS = {"logprobs": True, "top_logprobs": TOP_LOGPROBS}
+
+NUM_INTENTIONS = MAX_INTENTION - MIN_INTENTION + 1
+
+
+def label_of_token(token):
+    """
+    Get the intention label a token stands for.
+
+    Args:
+        token (str): Output token, e.g. "16", " 16" or "#"
+
+    Returns:
+        str: The intention label, or None if the token is not a valid intention number
+    """
+    stripped = token.strip().lstrip("#")
+    if stripped.isdigit() and stripped.isascii():
+        return validate_intention(stripped)
+    return None
+
+
+def find_label_token(logprobs_content):
+    """
+    Find the first output token that is an intention label.
+
+    With the number-only prompt and the constrained modes this is the first output token;
+    for verbose answers like "INTENTION: #16 - ..." it is the token after "#".
+
+    Args:
+        logprobs_content (list): The "content" list of choice.logprobs, as plain dicts
+
+    Returns:
+        dict: The token entry with its top_logprobs, or None if no token is a label
+    """
+    for entry in logprobs_content or []:
+        if label_of_token(entry["token"]) is not None:
+            return entry
+    return None
+
+
+def intent_distribution(logprobs_content, k=3):
+    """
+    Turn the top log probabilities of the label token into a probability vector over the 40 intents.
+
+    Only the TOP_LOGPROBS most likely tokens are returned by the API, so intents outside of them
+    get probability 0. The probabilities are renormalized over the label tokens; label_mass is the
+    share of the total probability the model put on valid labels before renormalizing.
+
+    Args:
+        logprobs_content (list): The "content" list of choice.logprobs, as plain dicts
+        k (int): Number of most likely intents to return in top_k
+
+    Returns:
+        dict: probabilities (index 0 is intention 1), top_k [(label, probability)], margin between
+            the two most likely intents, entropy in nats and label_mass; or None if no label token was found
+    """
+    entry = find_label_token(logprobs_content)
+    if entry is None:
+        return None
+
+    probabilities = [0.0] * NUM_INTENTIONS
+    alternatives = entry.get("top_logprobs") or [{"token": entry["token"], "logprob": entry["logprob"]}]
+    for alternative in alternatives:
+        label = label_of_token(alternative["token"])
+        if label is not None:
+            # Tokens like "16" and " 16" stand for the same label
+            probabilities[int(label) - MIN_INTENTION] += math.exp(alternative["logprob"])
+
+    label_mass = sum(probabilities)
+    if label_mass <= 0:
+        return None
+    probabilities = [p / label_mass for p in probabilities]
+
+    ranked = sorted(range(NUM_INTENTIONS), key=lambda i: probabilities[i], reverse=True)
+    top_k = [(str(i + MIN_INTENTION), probabilities[i]) for i in ranked[:k] if probabilities[i] > 0]
+    margin = probabilities[ranked[0]] - probabilities[ranked[1]]
+    entropy = -sum(p * math.log(p) for p in probabilities if p > 0)
+
+    return {
+        "probabilities": probabilities,
+        "top_k": top_k,
+        "margin": margin,
+        "entropy": entropy,
+        "label_mass": min(label_mass, 1.0)
+    }
+
+
+def format_distribution(distribution):
+    """Format the top intents, margin and entropy of a distribution for reports"""
+    if distribution is None:
+        return "n/a"
+    top_k = ", ".join(f"#{label} ({p:.2%})" for label, p in distribution["top_k"])
+    return f"{top_k}; margin {distribution['margin']:.2%}, entropy {distribution['entropy']:.3f} nats"
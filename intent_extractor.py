@@ -0,0 +1,109 @@
+import re
+
+# Valid range of intention numbers
+MIN_INTENTION = 1
+MAX_INTENTION = 40
+
+# Bare-number answers as requested by the prompt, e.g. "16", "#16" or "16."
+BARE_NUMBER_PATTERN = re.compile(r"#?\s*(\d{1,3})\s*\.?", re.ASCII)
+
+# Patterns for verbose answers, in priority order.
+# All patterns are compiled once at import time instead of on every call;
+# re.ASCII keeps \d from matching non-ASCII digits.
+INTENTION_PATTERNS = [
+    # Structured output, e.g. {"intention": "16"}
+    re.compile(r'"intention"\s*:\s*"?(\d+)', re.ASCII),
+    # "INTENTION: #16 - Request room cleaning", "Intention: 16"
+    re.compile(r"intention\s*:\s*#?\s*(\d+)", re.IGNORECASE | re.ASCII),
+    # "#16 - Request room cleaning"
+    re.compile(r"#(\d+)\s*-", re.ASCII),
+    # "The intention is #16", "intention number 16", "intention is to 16"
+    re.compile(r"intention\s*(?:is|:)?\s*(?:number|to)?\s*#?(\d+)", re.IGNORECASE | re.ASCII),
+    # Any number preceded by #
+    re.compile(r"#(\d+)", re.ASCII),
+    # "16 - Request room cleaning"
+    re.compile(r"(\d+)\s*-\s*[A-Za-z]", re.ASCII),
+    # A number at the very start of the response, e.g. "16\nThe guest wants..."
+    re.compile(r"^\s*(\d+)\b", re.ASCII),
+]
+
+
+def validate_intention(number):
+    """
+    Normalize an intention number and check that it is in range.
+
+    Args:
+        number (str): Candidate intention number (ASCII digits)
+
+    Returns:
+        str: The intention number without leading zeros, or None if it is outside 1..40
+    """
+    value = int(number)
+    if MIN_INTENTION <= value <= MAX_INTENTION:
+        return str(value)
+    return None
+
+
+def extract_intention(response):
+    """
+    Extract the intention number from the model's response.
+
+    The bare-number answer the prompt asks for is handled without running any regex
+    search. Verbose answers like "INTENTION: #16 - Request room cleaning" are matched
+    against precompiled patterns in priority order, skipping numbers outside 1..40.
+
+    Args:
+        response (str): The model's response
+
+    Returns:
+        str: The extracted intention number (e.g. "16") or None if not found
+    """
+    if not response:
+        return None
+
+    # Fast path: the response is only the number
+    stripped = response.strip()
+    if stripped.isdigit() and stripped.isascii():
+        return validate_intention(stripped)
+
+    match = BARE_NUMBER_PATTERN.fullmatch(stripped)
+    if match:
+        return validate_intention(match.group(1))
+
+    for pattern in INTENTION_PATTERNS:
+        for match in pattern.finditer(response):
+            intention = validate_intention(match.group(1))
+            if intention is not None:
+                return intention
+
+    return None
+
+
+# Labels at the start of a response, e.g. "16\n", "#16 - ", "INTENTION: #16 - " or {"intention": "16"}.
+# The lookahead requires a character after the number, so a partial "1" of "16" is never taken for a label.
+LEADING_LABEL_PATTERNS = [
+    re.compile(r'[\s*]*\{\s*"intention"\s*:\s*"?(\d+)(?=\D)', re.ASCII),
+    re.compile(r"[\s*]*intention\s*:\s*[\s*]*#?\s*(\d+)(?=\D)", re.IGNORECASE | re.ASCII),
+    re.compile(r"[\s*]*#?\s*(\d+)(?=\D)", re.ASCII),
+]
+
+
+def extract_leading_intention(partial_response):
+    """
+    Extract the intention from the beginning of a response that is still being generated.
+
+    Only labels at the start of the response are taken, and only once the number is followed by
+    another character, so the result cannot change when more text arrives. Use extract_intention
+    on the complete response when this returns None.
+
+    Args:
+        partial_response (str): The text received so far
+
+    Returns:
+        str: The extracted intention number (e.g. "16") or None if it cannot be decided yet
+    """
+    for pattern in LEADING_LABEL_PATTERNS:
+        match = pattern.match(partial_response)
+        if match:
+            return validate_intention(match.group(1))
+    return None
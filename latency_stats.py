@@ -0,0 +1,55 @@
+import math
+
+
+def percentile(values, pct):
+    """
+    Get a percentile of a list of values (nearest-rank method).
+
+    Args:
+        values (list): Numbers, in any order
+        pct (float): Percentile in 0..100
+
+    Returns:
+        float: The percentile, or None if there are no values
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize_latencies(latencies):
+    """
+    Summarize latencies in seconds.
+
+    Args:
+        latencies (list): Latencies in seconds
+
+    Returns:
+        dict: count, mean, p50, p95, p99 and max of the latencies
+    """
+    if not latencies:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+    return {
+        "count": len(latencies),
+        "mean": sum(latencies) / len(latencies),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies)
+    }
+
+
+def format_seconds(value):
+    """Format a latency in seconds as milliseconds for reports"""
+    if value is None:
+        return "n/a"
+    return f"{value * 1000:.0f}ms"
+
+
+def reduction(baseline, value):
+    """Relative reduction of a value compared with the baseline, e.g. 0.8 for 80% lower"""
+    if not baseline or value is None:
+        return None
+    return 1 - value / baseline
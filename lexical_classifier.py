@@ -0,0 +1,293 @@
+import re
+import json
+import time
+import zlib
+import argparse
+import numpy as np
+from intent_extractor import MIN_INTENTION, MAX_INTENTION
+
+# In-process classifier for guest messages that are near-paraphrases of training examples.
+# Messages are turned into hashed character n-grams and word uni-/bigrams, and a softmax
+# linear model over the 40 intentions is trained with NumPy. Its weights are saved as a
+# .npy file that is memory-mapped on load, so starting a script does not read the whole model.
+
+NUM_INTENTIONS = MAX_INTENTION - MIN_INTENTION + 1
+
+# Number of hashed feature buckets (the weight matrix has DEFAULT_DIM + 1 rows, the last one is the bias)
+DEFAULT_DIM = 2 ** 17
+CHAR_NGRAM_RANGE = (3, 5)
+
+DEFAULT_MODEL_FILE = "lexical_model.npy"
+DEFAULT_TRAINING_FILES = ["tests400.jsonl"]
+DEFAULT_THRESHOLDS = [0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+def metadata_file(model_file):
+    """Get the file holding the settings of a saved model"""
+    return model_file[:-len(".npy")] + ".json" if model_file.endswith(".npy") else model_file + ".json"
+
+
+def hashed_features(message, dim=DEFAULT_DIM, ngram_range=CHAR_NGRAM_RANGE):
+    """
+    Turn a message into hashed, signed and L2-normalized n-gram counts.
+
+    Character n-grams are taken over the UTF-8 bytes of the lowercased message, so slicing
+    needs no re-encoding; word unigrams and bigrams are added with their own prefixes.
+
+    Args:
+        message (str): Guest message
+        dim (int): Number of hash buckets
+        ngram_range (tuple): Smallest and largest character n-gram
+
+    Returns:
+        tuple: (indices, values) - sorted int64 bucket indices and float32 values of the non-zero features
+    """
+    text = " ".join(message.lower().split())
+    data = f" {text} ".encode("utf-8")
+    words = WORD_PATTERN.findall(text)
+    crc32 = zlib.crc32
+    digests = [crc32(data[i:i + n]) for n in range(ngram_range[0], ngram_range[1] + 1)
+               for i in range(len(data) - n + 1)]
+    digests += [crc32(b"w:" + word.encode("utf-8")) for word in words]
+    digests += [crc32(f"b:{first} {second}".encode("utf-8")) for first, second in zip(words, words[1:])]
+
+    digests = np.array(digests, dtype=np.uint32)
+    # The top bit decides the sign, so colliding n-grams tend to cancel out instead of adding up
+    signs = np.where(digests & 0x80000000, 1.0, -1.0)
+    indices, positions = np.unique((digests % dim).astype(np.int64), return_inverse=True)
+    values = np.bincount(positions, weights=signs, minlength=len(indices)).astype(np.float32)
+    norm = np.linalg.norm(values)
+    if norm > 0:
+        values /= norm
+    return indices, values
+
+
+def load_training_data(training_files=DEFAULT_TRAINING_FILES):
+    """
+    Load guest messages and their intention numbers.
+
+    Args:
+        training_files (list): Chat format JSONL files (e.g. tests400.jsonl, where the user message is the
+            guest message and the assistant message its intention number) or messages_mappings*.py modules
+
+    Returns:
+        tuple: (messages, labels) with the labels as ints in 1..40
+    """
+    messages = []
+    labels = []
+    for training_file in training_files:
+        if training_file.endswith(".py"):
+            module = __import__(training_file[:-len(".py")])
+            messages += list(module.vague_messages)
+            labels += [int(str(mapping).split(" ")[0]) for mapping in module.correct_mappings]
+            continue
+
+        with open(training_file, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                example = json.loads(line)
+                if "item" in example:
+                    messages.append(example["item"]["input_text"])
+                    labels.append(int(example["item"]["correct_label"]))
+                    continue
+                user = [m["content"] for m in example["messages"] if m["role"] == "user"]
+                assistant = [m["content"] for m in example["messages"] if m["role"] == "assistant"]
+                messages.append(user[-1])
+                labels.append(int(assistant[-1].strip()))
+    return messages, labels
+
+
+class LexicalClassifier:
+    """Softmax linear model over hashed n-gram features of guest messages"""
+
+    def __init__(self, weights, dim=DEFAULT_DIM, ngram_range=CHAR_NGRAM_RANGE):
+        """
+        Args:
+            weights (numpy.ndarray): (dim + 1, 40) float32 weights, the last row is the bias
+            dim (int): Number of hash buckets
+            ngram_range (tuple): Smallest and largest character n-gram
+        """
+        self.weights = weights
+        self.dim = dim
+        self.ngram_range = tuple(ngram_range)
+
+    @classmethod
+    def train(cls, messages, labels, dim=DEFAULT_DIM, epochs=300, learning_rate=50.0, l2=1e-5):
+        """
+        Train the model with full-batch gradient descent on the cross-entropy loss.
+
+        Args:
+            messages (list): Guest messages
+            labels (list): Intention numbers (1..40) of the messages
+            dim (int): Number of hash buckets
+            epochs (int): Gradient descent steps
+            learning_rate (float): Step size
+            l2 (float): L2 regularization of the weights
+
+        Returns:
+            LexicalClassifier: The trained model
+        """
+        features = [hashed_features(message, dim) for message in messages]
+        lengths = np.array([len(indices) for indices, _ in features])
+        indices = np.concatenate([indices for indices, _ in features])
+        values = np.concatenate([values for _, values in features])
+        rows = np.repeat(np.arange(len(features)), lengths)
+
+        # Only the buckets seen in training get weights; work on them as compact columns
+        used, columns = np.unique(indices, return_inverse=True)
+        # Entries sorted by column, so the gradient of every column is one reduceat segment
+        order = np.argsort(columns, kind="stable")
+        column_starts = np.flatnonzero(np.diff(np.concatenate([[-1], columns[order]])))
+        # Entries in row order are already grouped by row
+        row_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+        targets = np.zeros((len(messages), NUM_INTENTIONS), dtype=np.float32)
+        targets[np.arange(len(messages)), np.asarray(labels) - MIN_INTENTION] = 1.0
+
+        compact = np.zeros((len(used), NUM_INTENTIONS), dtype=np.float32)
+        bias = np.zeros(NUM_INTENTIONS, dtype=np.float32)
+        for _ in range(epochs):
+            logits = np.add.reduceat(compact[columns] * values[:, None], row_starts, axis=0) + bias
+            errors = (softmax(logits) - targets) / len(messages)
+
+            gradient = np.add.reduceat(errors[rows[order]] * values[order, None], column_starts, axis=0)
+            compact -= learning_rate * (gradient + l2 * compact)
+            bias -= learning_rate * errors.sum(axis=0)
+
+        weights = np.zeros((dim + 1, NUM_INTENTIONS), dtype=np.float32)
+        weights[used] = compact
+        weights[dim] = bias
+        return cls(weights, dim)
+
+    def predict_proba(self, message):
+        """Get the probabilities of the 40 intentions for a message (index 0 is intention 1)"""
+        indices, values = hashed_features(message, self.dim, self.ngram_range)
+        logits = values @ self.weights[indices] + self.weights[self.dim]
+        return softmax(logits)
+
+    def predict(self, message):
+        """
+        Classify a message.
+
+        Returns:
+            tuple: (intention number as str, confidence in 0..1)
+        """
+        probabilities = self.predict_proba(message)
+        best = int(np.argmax(probabilities))
+        return str(best + MIN_INTENTION), float(probabilities[best])
+
+    def save(self, model_file=DEFAULT_MODEL_FILE, training_info=None):
+        """Save the weights as a .npy file and the settings next to it"""
+        np.save(model_file, self.weights)
+        with open(metadata_file(model_file), "w") as f:
+            json.dump({"dim": self.dim, "ngram_range": list(self.ngram_range), "training": training_info}, f, indent=2)
+
+    @classmethod
+    def load(cls, model_file=DEFAULT_MODEL_FILE):
+        """Load a saved model, memory-mapping its weights"""
+        with open(metadata_file(model_file), "r") as f:
+            metadata = json.load(f)
+        weights = np.load(model_file, mmap_mode="r")
+        return cls(weights, metadata["dim"], metadata["ngram_range"])
+
+
+def softmax(logits):
+    """Softmax over the last axis"""
+    shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return shifted / shifted.sum(axis=-1, keepdims=True)
+
+
+def threshold_report(classifier, messages, labels, thresholds=DEFAULT_THRESHOLDS):
+    """
+    Measure how many messages the classifier answers at each confidence threshold and how accurately.
+
+    Args:
+        classifier (LexicalClassifier): The model
+        messages (list): Held-out guest messages
+        labels (list): Their intention numbers
+        thresholds (list): Confidence thresholds
+
+    Returns:
+        dict: accuracy over all messages, mean prediction time (seconds) and per threshold the coverage
+            (share of messages answered locally) and the accuracy of those answers
+    """
+    predictions = []
+    start_time = time.perf_counter()
+    for message in messages:
+        predictions.append(classifier.predict(message))
+    mean_time = (time.perf_counter() - start_time) / len(messages) if messages else None
+
+    rows = []
+    for threshold in thresholds:
+        answered = [(label, str(correct)) for (label, confidence), correct in zip(predictions, labels)
+                    if confidence >= threshold]
+        rows.append({
+            "threshold": threshold,
+            "coverage": len(answered) / len(messages) if messages else 0,
+            "accuracy": sum(label == correct for label, correct in answered) / len(answered) if answered else None
+        })
+
+    correct = sum(label == str(expected) for (label, _), expected in zip(predictions, labels))
+    return {
+        "messages": len(messages),
+        "accuracy": correct / len(messages) if messages else 0,
+        "mean_prediction_time": mean_time,
+        "thresholds": rows
+    }
+
+
+def print_threshold_report(report):
+    """Print the coverage and accuracy at each threshold"""
+    print(f"\n{report['messages']} held-out messages, accuracy without a threshold {report['accuracy']:.2%}, "
+          f"{report['mean_prediction_time'] * 1e6:.0f}µs per message")
+    print(f"{'Threshold':>9} {'Coverage':>9} {'Accuracy':>9}")
+    for row in report["thresholds"]:
+        accuracy = f"{row['accuracy']:.2%}" if row["accuracy"] is not None else "n/a"
+        print(f"{row['threshold']:>9.2f} {row['coverage']:>9.1%} {accuracy:>9}")
+
+
+def main():
+    """
+    Main function to parse arguments, train and evaluate the classifier
+    """
+    parser = argparse.ArgumentParser(description='Train and evaluate the local lexical fast-path classifier')
+    parser.add_argument('--train', action='store_true', help='Train the model and save it')
+    parser.add_argument('--report', action='store_true',
+                        help='Report coverage and accuracy at each threshold on the held-out messages')
+    parser.add_argument('--training-files', type=str, nargs='+', default=DEFAULT_TRAINING_FILES,
+                        help='JSONL files or messages_mappings*.py modules to train on (default: tests400.jsonl)')
+    parser.add_argument('--test-files', type=str, nargs='+', default=['messages_mappings100.py'],
+                        help='Held-out messages for the report (default: messages_mappings100.py)')
+    parser.add_argument('--model-file', type=str, default=DEFAULT_MODEL_FILE,
+                        help=f'Model file (default: {DEFAULT_MODEL_FILE})')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=DEFAULT_THRESHOLDS,
+                        help='Confidence thresholds of the report')
+    parser.add_argument('--epochs', type=int, default=300, help='Training steps (default: 300)')
+
+    args = parser.parse_args()
+
+    if not args.train and not args.report:
+        parser.print_help()
+        return
+
+    if args.train:
+        messages, labels = load_training_data(args.training_files)
+        print(f"Training on {len(messages)} messages from {', '.join(args.training_files)}...")
+        start_time = time.perf_counter()
+        classifier = LexicalClassifier.train(messages, labels, epochs=args.epochs)
+        elapsed = time.perf_counter() - start_time
+        classifier.save(args.model_file, {"files": args.training_files, "messages": len(messages),
+                                          "epochs": args.epochs, "seconds": elapsed})
+        print(f"Trained in {elapsed:.1f}s, saved to {args.model_file}")
+
+    if args.report:
+        classifier = LexicalClassifier.load(args.model_file)
+        messages, labels = load_training_data(args.test_files)
+        print_threshold_report(threshold_report(classifier, messages, labels, args.thresholds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1118 @@
+import os
+import re
+import json
+import math
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the subset of the OpenAI API used by the scripts in this repository:
+# chat completions, files, batches, fine-tuning jobs, evals and eval runs.
+# Point a script at it with OPENAI_BASE_URL=http://127.0.0.1:8000/v1 (any OPENAI_API_KEY works).
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+
+LATENCY_DISTRIBUTIONS = ["fixed", "uniform", "normal", "lognormal"]
+
+# Labelled messages used to answer correctly with the configured accuracy
+LABELLED_JSONL_FILES = ["tests400.jsonl", "evals100.jsonl"]
+LABELLED_MAPPING_MODULES = ["messages_mappings100", "messages_mappings200", "messages_mappings200_2"]
+
+INTENTION_NAMES = {
+    1: "Check room availability", 2: "Make a reservation / Book a room", 3: "Modify reservation",
+    4: "Cancel reservation", 5: "Check reservation status", 6: "Request early check-in",
+    7: "Request late check-out", 8: "Check-in online", 9: "Check-out online", 10: "Request luggage assistance",
+    11: "Order room service", 12: "Book a table at a restaurant", 13: "Request menu or dietary information",
+    14: "Ask for breakfast hours or availability", 15: "Request minibar refill", 16: "Request room cleaning",
+    17: "Request extra towels, toiletries, or pillows", 18: "Report an issue in the room",
+    19: "Request laundry service", 20: "Request in-room amenities (e.g., iron, hair dryer)",
+    21: "Ask about local attractions or tours", 22: "Request a wake-up call", 23: "Ask for taxi or shuttle service",
+    24: "Ask about hotel policies", 25: "Request spa or gym appointment", 26: "Ask for invoice or receipt",
+    27: "Query charges on the bill", 28: "Change payment method", 29: "Split bill",
+    30: "Pre-authorize payment or deposit", 31: "Ask for Wi-Fi access or help", 32: "Ask about facility opening hours",
+    33: "Request parking information", 34: "Ask about pet policy", 35: "Ask about smoking policy",
+    36: "Leave a review or feedback", 37: "Report a complaint", 38: "Ask to speak to a manager",
+    39: "Request human support or live agent", 40: "Ask for help using the chatbot"
+}
+
+# Prompts are cached from this many tokens on, in steps of PROMPT_CACHE_STEP tokens
+PROMPT_CACHE_THRESHOLD = 1024
+PROMPT_CACHE_STEP = 128
+
+# Packed requests (message_packing.py) list numbered guest messages and ask for a JSON array of labels
+PACKED_PROMPT_MARKER = "JSON array of their intention numbers"
+PACKED_LINE_PATTERN = re.compile(r"^\d+\.\s+(.*)$")
+
+# Output tokens are approximated as pieces of words, numbers and punctuation
+TOKEN_PATTERN = re.compile(r"\d{1,3}|\s?[A-Za-z]+|\s?[^\sA-Za-z\d]|\s+")
+
+
+def new_id(prefix):
+    """Generate an OpenAI-style object ID"""
+    return f"{prefix}-{uuid.uuid4().hex[:24]}"
+
+
+def stable_fraction(*parts):
+    """Deterministic number in [0, 1) derived from the given values"""
+    digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+def fake_label(message, sample=0):
+    """
+    Deterministic fake intention label for a guest message.
+
+    Args:
+        message (str): The guest message
+        sample (int): Index of the sample when several are requested (n > 1)
+
+    Returns:
+        int: Intention number in 1..40, always the same for the same message and sample
+    """
+    if sample == 0:
+        digest = hashlib.sha256(message.encode("utf-8")).digest()
+        return int.from_bytes(digest[:4], "big") % 40 + 1
+    return int(stable_fraction(message, sample) * 40) + 1
+
+
+def count_tokens(text):
+    """Approximate number of tokens of a text (~4 characters per token)"""
+    return len(text) // 4 + 1 if text else 0
+
+
+def load_labelled_messages(directory="."):
+    """
+    Load the labelled guest messages of the repository.
+
+    Returns:
+        dict: Guest message -> correct intention number
+    """
+    labels = {}
+    for filename in LABELLED_JSONL_FILES:
+        path = os.path.join(directory, filename)
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if "messages" in record:
+                    messages = record["messages"]
+                    labels[messages[-2]["content"]] = int(messages[-1]["content"])
+                elif "item" in record:
+                    labels[record["item"]["input_text"]] = int(record["item"]["correct_label"])
+
+    for module_name in LABELLED_MAPPING_MODULES:
+        try:
+            module = __import__(module_name)
+        except ImportError:
+            continue
+        for message, mapping in zip(module.vague_messages, module.correct_mappings):
+            labels[message] = int(str(mapping).split(' ')[0])
+
+    return labels
+
+
+class ServerConfig:
+    """Latency, fault injection, rate limit and answer settings of the local server"""
+
+    def __init__(self, latency_distribution="lognormal", latency_mean=0.3, latency_spread=0.5,
+                 per_token_latency=0.01, error_rate_429=0.0, error_rate_500=0.0, requests_per_minute=0,
+                 tokens_per_minute=0, accuracy=0.6, batch_delay=0.0, job_duration=0.0, seed=42, outage_start=None,
+                 outage_duration=0.0, outage_models=None, outage_latency=0.0, cold_start_latency=0.0,
+                 cold_start_idle=60.0, connect_latency=0.0):
+        """
+        Args:
+            latency_distribution (str): One of LATENCY_DISTRIBUTIONS
+            latency_mean (float): Mean latency in seconds (the median for lognormal)
+            latency_spread (float): Half-width for uniform, standard deviation for normal, sigma for lognormal
+            per_token_latency (float): Extra seconds per generated output token
+            error_rate_429 (float): Share of chat completions answered with an injected 429
+            error_rate_500 (float): Share of chat completions answered with an injected 500
+            requests_per_minute (int): Enforced requests/min per model (0 = unlimited)
+            tokens_per_minute (int): Enforced tokens/min per model (0 = unlimited)
+            accuracy (float): Share of labelled messages answered with their correct intention
+            batch_delay (float): Seconds a batch stays in progress before it completes
+            job_duration (float): Seconds a fine-tuning job or eval run takes
+            seed (int): Seed of the latency and fault injection random generator
+            outage_start (float): Seconds after the server started when an outage begins (None = no outage)
+            outage_duration (float): Seconds the outage lasts; chat completions fail with 503 meanwhile
+            outage_models (list): Models affected by the outage (None = all models)
+            outage_latency (float): Seconds a chat completion takes to fail during the outage
+            cold_start_latency (float): Extra seconds of the first chat completion of a fine-tuned model
+                after it was idle for cold_start_idle seconds
+            cold_start_idle (float): Seconds without requests after which a fine-tuned model is cold again
+            connect_latency (float): Seconds a new client connection takes, like a TCP and TLS handshake
+        """
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency_distribution}")
+        self.latency_distribution = latency_distribution
+        self.latency_mean = latency_mean
+        self.latency_spread = latency_spread
+        self.per_token_latency = per_token_latency
+        self.error_rate_429 = error_rate_429
+        self.error_rate_500 = error_rate_500
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.accuracy = accuracy
+        self.batch_delay = batch_delay
+        self.job_duration = job_duration
+        self.seed = seed
+        self.outage_start = outage_start
+        self.outage_duration = outage_duration
+        self.outage_models = outage_models
+        self.outage_latency = outage_latency
+        self.cold_start_latency = cold_start_latency
+        self.cold_start_idle = cold_start_idle
+        self.connect_latency = connect_latency
+
+
+class ServerRateLimit:
+    """Server-side requests/min and tokens/min buckets of one model, producing x-ratelimit-* headers"""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.available = dict(self.limits)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        for name, limit in self.limits.items():
+            if limit:
+                self.available[name] = min(limit, self.available[name] + elapsed * limit / 60)
+        self.updated = now
+
+    def _reset_seconds(self, name, missing):
+        limit = self.limits[name]
+        return max(0.0, missing * 60 / limit) if limit else 0.0
+
+    def consume(self, tokens):
+        """
+        Take one request and the tokens from the buckets.
+
+        Returns:
+            tuple: (allowed, headers, retry_after_seconds)
+        """
+        now = time.monotonic()
+        self._refill(now)
+        needed = {"requests": 1, "tokens": tokens}
+        allowed = all(not limit or self.available[name] >= min(needed[name], limit)
+                      for name, limit in self.limits.items())
+        if allowed:
+            for name, limit in self.limits.items():
+                if limit:
+                    self.available[name] -= min(needed[name], limit)
+
+        headers = {}
+        retry_after = 0.0
+        for name, limit in self.limits.items():
+            if not limit:
+                continue
+            remaining = max(0, int(self.available[name]))
+            reset = self._reset_seconds(name, limit - self.available[name])
+            headers[f"x-ratelimit-limit-{name}"] = str(limit)
+            headers[f"x-ratelimit-remaining-{name}"] = str(remaining)
+            headers[f"x-ratelimit-reset-{name}"] = f"{reset:.3f}s"
+            if self.available[name] < min(needed[name], limit):
+                retry_after = max(retry_after, self._reset_seconds(name, min(needed[name], limit) - self.available[name]))
+        return allowed, headers, retry_after
+
+
+class LocalOpenAIState:
+    """In-memory store and fake model behind the local server"""
+
+    def __init__(self, config=None):
+        """
+        Args:
+            config (ServerConfig): Server settings (default settings if None)
+        """
+        self.config = config or ServerConfig()
+        self.files = {}
+        self.file_contents = {}
+        self.batches = {}
+        self.batch_started = {}
+        self.jobs = {}
+        self.evals = {}
+        self.runs = {}
+        self.started = {}
+        self.rate_limits = {}
+        self.seen_prefixes = set()
+        self.labels = load_labelled_messages(os.path.dirname(os.path.abspath(__file__)))
+        self.random = random.Random(self.config.seed)
+        self.created = time.monotonic()
+        self.last_used = {}
+        self.stats = {"chat_completions": 0, "injected_429": 0, "injected_500": 0, "rate_limited": 0,
+                      "closed_streams": 0, "client_disconnects": 0, "outage_errors": 0, "cold_starts": 0,
+                      "connections": 0}
+        self.lock = threading.Lock()
+
+    # Fake model
+
+    def answer_label(self, message, sample=0):
+        """
+        Get the label the fake model answers for a message: the correct one for a share of
+        labelled messages given by the configured accuracy, else a deterministic fake label.
+        """
+        correct = self.labels.get(message)
+        if correct is not None and stable_fraction("accuracy", message, sample) < self.config.accuracy:
+            return correct
+        return fake_label(message, sample)
+
+    def answer_content(self, body, label, message="", sample=0):
+        """Render the answer for a label in the output format the request asks for"""
+        system_prompt = " ".join(str(m.get("content", "")) for m in body.get("messages", [])
+                                 if m.get("role") in ("system", "developer"))
+        if PACKED_PROMPT_MARKER in system_prompt:
+            packed = [PACKED_LINE_PATTERN.match(line.strip()) for line in message.splitlines()]
+            return json.dumps([self.answer_label(match.group(1), sample) for match in packed if match])
+
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            return json.dumps({"intention": str(label)})
+
+        constrained = body.get("logit_bias") or (body.get("max_tokens") or 1000) <= 5
+        if not constrained and "explain your reasoning" in system_prompt:
+            return (f"INTENTION: #{label} - {INTENTION_NAMES[label]}\n"
+                    f"The guest's message points to this request, as it is the most actionable need mentioned.")
+        return str(label)
+
+    def label_logprobs(self, message, label, sample, top_logprobs):
+        """Deterministic top log probabilities of the label token"""
+        confidence = 0.5 + 0.49 * stable_fraction("confidence", message, sample)
+        alternatives = [label]
+        offset = 0
+        while len(alternatives) < max(1, top_logprobs):
+            offset += 1
+            candidate = (label + offset * 7 - 1) % 40 + 1
+            if candidate not in alternatives:
+                alternatives.append(candidate)
+        remaining = 1 - confidence
+        entries = [{"token": str(label), "logprob": math.log(confidence), "bytes": list(str(label).encode())}]
+        for rank, alternative in enumerate(alternatives[1:], start=1):
+            probability = remaining / 2 ** rank
+            entries.append({"token": str(alternative), "logprob": math.log(probability),
+                            "bytes": list(str(alternative).encode())})
+        return entries
+
+    def chat_completion(self, body):
+        """
+        Build a deterministic chat completion for a request body.
+
+        Returns:
+            tuple: (chat completion dict, number of completion tokens)
+        """
+        messages = body.get("messages", [])
+        user_messages = [str(m.get("content", "")) for m in messages if m.get("role") == "user"]
+        message = user_messages[-1] if user_messages else ""
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens") or 4096
+        top_logprobs = body.get("top_logprobs") or 0
+
+        choices = []
+        completion_tokens = 0
+        for sample in range(body.get("n") or 1):
+            label = self.answer_label(message, sample)
+            content = self.answer_content(body, label, message, sample)
+            tokens = TOKEN_PATTERN.findall(content)
+            finish_reason = "stop"
+            if len(tokens) > max_tokens:
+                tokens = tokens[:max_tokens]
+                content = "".join(tokens)
+                finish_reason = "length"
+            completion_tokens += len(tokens)
+
+            logprobs = None
+            if body.get("logprobs"):
+                logprob_content = []
+                for token in tokens:
+                    if token.strip() == str(label):
+                        entries = self.label_logprobs(message, label, sample, top_logprobs)
+                        logprob_content.append(dict(entries[0], top_logprobs=entries[:top_logprobs]))
+                    else:
+                        logprob_content.append({"token": token, "logprob": 0.0, "bytes": list(token.encode()),
+                                                "top_logprobs": []})
+                logprobs = {"content": logprob_content, "refusal": None}
+
+            choices.append({
+                "index": sample,
+                "message": {"role": "assistant", "content": content, "refusal": None},
+                "logprobs": logprobs,
+                "finish_reason": finish_reason
+            })
+
+        prompt_tokens = sum(count_tokens(str(m.get("content", ""))) for m in messages)
+        cached_tokens = self.cached_prompt_tokens(body.get("model"), messages, prompt_tokens)
+        completion = {
+            "id": new_id("chatcmpl"),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": choices,
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens}
+            }
+        }
+        return completion, completion_tokens
+
+    def cached_prompt_tokens(self, model, messages, prompt_tokens):
+        """
+        Simulate automatic prompt caching: once a first message has been seen for a model, later
+        prompts of at least PROMPT_CACHE_THRESHOLD tokens reuse it in steps of PROMPT_CACHE_STEP tokens.
+        """
+        if not messages or prompt_tokens < PROMPT_CACHE_THRESHOLD:
+            return 0
+        prefix = str(messages[0].get("content", ""))
+        key = (model, hashlib.sha256(prefix.encode("utf-8")).hexdigest())
+        with self.lock:
+            seen = key in self.seen_prefixes
+            self.seen_prefixes.add(key)
+        if not seen:
+            return 0
+        return min(count_tokens(prefix), prompt_tokens) // PROMPT_CACHE_STEP * PROMPT_CACHE_STEP
+
+    def sample_latency(self, completion_tokens):
+        """Sample the latency of a chat completion from the configured distribution"""
+        config = self.config
+        with self.lock:
+            if config.latency_distribution == "fixed":
+                latency = config.latency_mean
+            elif config.latency_distribution == "uniform":
+                latency = self.random.uniform(config.latency_mean - config.latency_spread,
+                                              config.latency_mean + config.latency_spread)
+            elif config.latency_distribution == "normal":
+                latency = self.random.gauss(config.latency_mean, config.latency_spread)
+            else:
+                latency = self.random.lognormvariate(math.log(max(config.latency_mean, 1e-6)), config.latency_spread)
+        return max(0.0, latency) + config.per_token_latency * completion_tokens
+
+    def inject_fault(self):
+        """Decide whether to answer with an injected error: returns 429, 500 or None"""
+        with self.lock:
+            value = self.random.random()
+        if value < self.config.error_rate_429:
+            self.stats["injected_429"] += 1
+            return 429
+        if value < self.config.error_rate_429 + self.config.error_rate_500:
+            self.stats["injected_500"] += 1
+            return 500
+        return None
+
+    def in_outage(self, model):
+        """Whether chat completions of a model are failing because of the configured outage"""
+        config = self.config
+        if config.outage_start is None or (config.outage_models and model not in config.outage_models):
+            return False
+        elapsed = time.monotonic() - self.created
+        return config.outage_start <= elapsed < config.outage_start + config.outage_duration
+
+    def cold_start_delay(self, model):
+        """
+        Simulate the cold start of fine-tuned model deployments: the first chat completion of a
+        fine-tuned model, and the first after it was idle for cold_start_idle seconds, is slower.
+
+        Returns:
+            float: Extra seconds of this chat completion
+        """
+        config = self.config
+        if not config.cold_start_latency or not model.startswith("ft:"):
+            return 0.0
+        now = time.monotonic()
+        with self.lock:
+            last_used = self.last_used.get(model)
+            self.last_used[model] = now
+            if last_used is not None and now - last_used < config.cold_start_idle:
+                return 0.0
+            self.stats["cold_starts"] += 1
+        return config.cold_start_latency
+
+    def rate_limit(self, model, tokens):
+        """Apply the server-side rate limit of a model: returns (allowed, headers, retry_after)"""
+        if not self.config.requests_per_minute and not self.config.tokens_per_minute:
+            return True, {}, 0.0
+        with self.lock:
+            if model not in self.rate_limits:
+                self.rate_limits[model] = ServerRateLimit(self.config.requests_per_minute,
+                                                          self.config.tokens_per_minute)
+            return self.rate_limits[model].consume(tokens)
+
+    # Files and batches
+
+    def add_file(self, filename, content, purpose):
+        """Store an uploaded file and return its file object"""
+        file_id = new_id("file")
+        file_object = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed"
+        }
+        with self.lock:
+            self.files[file_id] = file_object
+            self.file_contents[file_id] = content
+        return file_object
+
+    def add_batch(self, body):
+        """Create a batch for an uploaded input file and return its batch object"""
+        batch_id = new_id("batch")
+        now = int(time.time())
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body.get("endpoint"),
+            "input_file_id": body.get("input_file_id"),
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": now,
+            "in_progress_at": now,
+            "completed_at": None,
+            "metadata": body.get("metadata"),
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "errors": None
+        }
+        with self.lock:
+            self.batches[batch_id] = batch
+            self.batch_started[batch_id] = time.time()
+        return batch
+
+    def refresh_batch(self, batch_id):
+        """Complete the batch once its delay has passed and return its batch object"""
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch is None or batch["status"] != "in_progress":
+                return batch
+            if time.time() - self.batch_started[batch_id] < self.config.batch_delay:
+                return batch
+            input_content = self.file_contents.get(batch["input_file_id"])
+
+        if input_content is None:
+            with self.lock:
+                batch["status"] = "failed"
+                batch["errors"] = {"object": "list", "data": [{"message": "Input file not found"}]}
+            return batch
+
+        output_lines = []
+        error_lines = []
+        for line in input_content.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            if request.get("url") != batch["endpoint"]:
+                error_lines.append({
+                    "id": new_id("batch_req"),
+                    "custom_id": request.get("custom_id"),
+                    "response": None,
+                    "error": {"code": "invalid_url", "message": f"Unsupported url {request.get('url')}"}
+                })
+                continue
+            completion, _ = self.chat_completion(request.get("body", {}))
+            output_lines.append({
+                "id": new_id("batch_req"),
+                "custom_id": request.get("custom_id"),
+                "response": {
+                    "status_code": 200,
+                    "request_id": uuid.uuid4().hex,
+                    "body": completion
+                },
+                "error": None
+            })
+
+        output_file = self.add_file(f"{batch_id}_output.jsonl", encode_jsonl(output_lines), "batch_output")
+        error_file = self.add_file(f"{batch_id}_error.jsonl", encode_jsonl(error_lines), "batch_output") if error_lines else None
+
+        with self.lock:
+            batch["status"] = "completed"
+            batch["completed_at"] = int(time.time())
+            batch["output_file_id"] = output_file["id"]
+            batch["error_file_id"] = error_file["id"] if error_file else None
+            batch["request_counts"] = {
+                "total": len(output_lines) + len(error_lines),
+                "completed": len(output_lines),
+                "failed": len(error_lines)
+            }
+        return batch
+
+    # Fine-tuning jobs
+
+    def add_job(self, body):
+        """Create a fine-tuning job and return its job object"""
+        job_id = new_id("ftjob")
+        job = {
+            "id": job_id,
+            "object": "fine_tuning.job",
+            "model": body.get("model"),
+            "training_file": body.get("training_file"),
+            "validation_file": body.get("validation_file"),
+            "method": body.get("method"),
+            "hyperparameters": (body.get("method") or {}).get("supervised", {}).get("hyperparameters", {}),
+            "seed": body.get("seed", 42),
+            "suffix": body.get("suffix"),
+            "status": "validating_files",
+            "created_at": int(time.time()),
+            "finished_at": None,
+            "fine_tuned_model": None,
+            "organization_id": "org-local",
+            "result_files": [],
+            "trained_tokens": None,
+            "error": None
+        }
+        with self.lock:
+            self.jobs[job_id] = job
+            self.started[job_id] = time.time()
+        return job
+
+    def refresh_job(self, job_id):
+        """Advance the job through running to succeeded and return its job object"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job["status"] in ["succeeded", "failed", "cancelled"]:
+                return job
+            elapsed = time.time() - self.started[job_id]
+            if elapsed < self.config.job_duration:
+                job["status"] = "running" if elapsed > self.config.job_duration / 4 else "validating_files"
+                return job
+            job["status"] = "succeeded"
+            job["finished_at"] = int(time.time())
+            job["fine_tuned_model"] = f"ft:{job['model']}:local:{job['suffix'] or 'sft'}:{job_id[-8:]}"
+            job["trained_tokens"] = len(self.file_contents.get(job["training_file"], b"")) // 4
+        return job
+
+    # Evals and eval runs
+
+    def add_eval(self, body):
+        """Create an eval and return its eval object"""
+        eval_id = new_id("eval")
+        eval_object = {
+            "id": eval_id,
+            "object": "eval",
+            "name": body.get("name"),
+            "metadata": body.get("metadata"),
+            "data_source_config": body.get("data_source_config"),
+            "testing_criteria": body.get("testing_criteria", []),
+            "created_at": int(time.time())
+        }
+        with self.lock:
+            self.evals[eval_id] = eval_object
+        return eval_object
+
+    def add_run(self, eval_id, body):
+        """Create an eval run and return its run object"""
+        run_id = new_id("evalrun")
+        data_source = body.get("data_source", {})
+        run = {
+            "id": run_id,
+            "object": "eval.run",
+            "eval_id": eval_id,
+            "name": body.get("name"),
+            "model": data_source.get("model"),
+            "data_source": data_source,
+            "metadata": body.get("metadata"),
+            "status": "queued",
+            "created_at": int(time.time()),
+            "error": None,
+            "report_url": f"http://localhost/evals/{eval_id}/runs/{run_id}",
+            "result_counts": {"total": 0, "passed": 0, "failed": 0, "errored": 0},
+            "per_model_usage": [],
+            "per_testing_criteria_results": [],
+            "output_items": []
+        }
+        with self.lock:
+            self.runs[run_id] = run
+            self.started[run_id] = time.time()
+        return run
+
+    def refresh_run(self, run_id):
+        """Complete the eval run once its duration has passed and return its run object"""
+        with self.lock:
+            run = self.runs.get(run_id)
+            if run is None or run["status"] in ["completed", "failed", "canceled"]:
+                return run
+            if time.time() - self.started[run_id] < self.config.job_duration:
+                run["status"] = "in_progress"
+                return run
+            data_source = run["data_source"]
+            content = self.file_contents.get((data_source.get("source") or {}).get("id"))
+
+        if content is None:
+            with self.lock:
+                run["status"] = "failed"
+                run["error"] = {"code": "file_not_found", "message": "Data source file not found"}
+            return run
+
+        template = (data_source.get("input_messages") or {}).get("template", [])
+        output_items = []
+        passed = 0
+        for line in content.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line).get("item", {})
+            messages = [{"role": m.get("role"), "content": render_template(m.get("content", ""), item)}
+                        for m in template]
+            completion, _ = self.chat_completion({"model": run["model"], "messages": messages,
+                                                  **(data_source.get("sampling_params") or {})})
+            output = completion["choices"][0]["message"]["content"]
+            is_passed = output == str(item.get("correct_label"))
+            passed += is_passed
+            output_items.append({
+                "id": new_id("outputitem"),
+                "object": "eval.run.output_item",
+                "eval_id": run["eval_id"],
+                "run_id": run_id,
+                "created_at": int(time.time()),
+                "status": "pass" if is_passed else "fail",
+                "datasource_item_id": len(output_items),
+                "datasource_item": item,
+                "results": [{"name": "Match output to human label", "passed": is_passed, "score": float(is_passed)}],
+                "sample": {
+                    "input": messages,
+                    "output": [{"role": "assistant", "content": output}],
+                    "model": run["model"],
+                    "finish_reason": "stop",
+                    "usage": completion["usage"],
+                    "error": None,
+                    "seed": (data_source.get("sampling_params") or {}).get("seed"),
+                    "temperature": 1.0,
+                    "top_p": 1.0,
+                    "max_completion_tokens": 4096
+                }
+            })
+
+        with self.lock:
+            run["output_items"] = output_items
+            run["status"] = "completed"
+            run["result_counts"] = {"total": len(output_items), "passed": passed,
+                                    "failed": len(output_items) - passed, "errored": 0}
+        return run
+
+
+def completion_chunks(completion, include_usage=False):
+    """
+    Split a chat completion into the chunks of a streamed response, one per output token.
+
+    Returns:
+        list: chat.completion.chunk dicts
+    """
+    base = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"],
+            "model": completion["model"]}
+    chunks = []
+    for choice in completion["choices"]:
+        index = choice["index"]
+        chunks.append(dict(base, choices=[{"index": index, "delta": {"role": "assistant", "content": ""},
+                                            "logprobs": None, "finish_reason": None}]))
+        for token in TOKEN_PATTERN.findall(choice["message"]["content"]):
+            chunks.append(dict(base, choices=[{"index": index, "delta": {"content": token},
+                                                "logprobs": None, "finish_reason": None}]))
+        chunks.append(dict(base, choices=[{"index": index, "delta": {}, "logprobs": None,
+                                            "finish_reason": choice["finish_reason"]}]))
+    if include_usage:
+        chunks.append(dict(base, choices=[], usage=completion["usage"]))
+    return chunks
+
+
+def render_template(content, item):
+    """Replace {{item.field}} placeholders of an eval input message template"""
+    return re.sub(r"\{\{\s*item\.(\w+)\s*\}\}", lambda match: str(item.get(match.group(1), "")), content)
+
+
+def encode_jsonl(lines):
+    """Encode a list of objects as JSONL bytes"""
+    return "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8")
+
+
+def parse_multipart(content_type, body):
+    """
+    Parse a multipart/form-data request body.
+
+    Returns:
+        dict: Field name -> (filename, bytes) for every part
+    """
+    message = BytesParser(policy=default_policy).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + body
+    )
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        fields[name] = (part.get_filename(), part.get_payload(decode=True) or b"")
+    return fields
+
+
+def list_object(data):
+    """Wrap objects in an OpenAI list object"""
+    return {
+        "object": "list",
+        "data": data,
+        "first_id": data[0]["id"] if data else None,
+        "last_id": data[-1]["id"] if data else None,
+        "has_more": False
+    }
+
+
+class LocalOpenAIHandler(BaseHTTPRequestHandler):
+    """HTTP handler routing OpenAI API paths to the in-memory state of the server"""
+
+    protocol_version = "HTTP/1.1"
+
+    # (method, path pattern, handler method name)
+    routes = [
+        ("POST", r"/v1/chat/completions", "create_chat_completion"),
+        ("POST", r"/v1/files", "create_file"),
+        ("GET", r"/v1/files/(?P<file_id>[^/]+)", "retrieve_file"),
+        ("GET", r"/v1/files/(?P<file_id>[^/]+)/content", "file_content"),
+        ("POST", r"/v1/batches", "create_batch"),
+        ("GET", r"/v1/batches/(?P<batch_id>[^/]+)", "retrieve_batch"),
+        ("POST", r"/v1/fine_tuning/jobs", "create_job"),
+        ("GET", r"/v1/fine_tuning/jobs/(?P<job_id>[^/]+)", "retrieve_job"),
+        ("POST", r"/v1/evals", "create_eval"),
+        ("GET", r"/v1/evals/(?P<eval_id>[^/]+)", "retrieve_eval"),
+        ("POST", r"/v1/evals/(?P<eval_id>[^/]+)/runs", "create_run"),
+        ("GET", r"/v1/evals/(?P<eval_id>[^/]+)/runs/(?P<run_id>[^/]+)", "retrieve_run"),
+        ("GET", r"/v1/evals/(?P<eval_id>[^/]+)/runs/(?P<run_id>[^/]+)/output_items", "list_output_items"),
+    ]
+
+    def setup(self):
+        super().setup()
+        state = self.server.state
+        state.stats["connections"] += 1
+        # A new connection pays the handshake once; keep-alive requests on it do not
+        time.sleep(state.config.connect_latency)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method):
+        path = self.path.split("?", 1)[0]
+        length = int(self.headers.get("Content-Length", 0))
+        self.body = self.rfile.read(length) if length else b""
+
+        for route_method, pattern, handler_name in self.routes:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                try:
+                    getattr(self, handler_name)(**match.groupdict())
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on the request, e.g. a cancelled hedged request
+                    self.server.state.stats["client_disconnects"] += 1
+                    self.close_connection = True
+                return
+
+        self.send_error_json(404, f"Unknown path {method} {path}")
+
+    def json_body(self):
+        return json.loads(self.body or b"{}")
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_bytes(status, data, "application/json", headers)
+
+    def send_bytes(self, status, data, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("x-request-id", uuid.uuid4().hex)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status, message, error_type="invalid_request_error", headers=None, code=None):
+        self.send_json(status, {"error": {"message": message, "type": error_type, "param": None, "code": code}},
+                       headers)
+
+    def send_not_found(self, kind, object_id):
+        self.send_error_json(404, f"No such {kind}: {object_id}")
+
+    def create_chat_completion(self):
+        state = self.server.state
+        body = self.json_body()
+        model = body.get("model", "gpt-4o-mini")
+        state.stats["chat_completions"] += 1
+
+        prompt_tokens = sum(count_tokens(str(m.get("content", ""))) for m in body.get("messages", []))
+        allowed, headers, retry_after = state.rate_limit(model, prompt_tokens + (body.get("max_tokens") or 1000))
+        if not allowed:
+            state.stats["rate_limited"] += 1
+            headers["retry-after-ms"] = str(int(retry_after * 1000))
+            self.send_error_json(429, f"Rate limit reached for {model}", "requests", headers, "rate_limit_exceeded")
+            return
+
+        if state.in_outage(model):
+            state.stats["outage_errors"] += 1
+            time.sleep(state.config.outage_latency)
+            self.send_error_json(503, f"The model {model} is currently unavailable (injected outage)",
+                                 "server_error", headers)
+            return
+
+        fault = state.inject_fault()
+        if fault == 429:
+            headers["retry-after-ms"] = "250"
+            self.send_error_json(429, f"Rate limit reached for {model} (injected)", "requests", headers,
+                                 "rate_limit_exceeded")
+            return
+
+        completion, completion_tokens = state.chat_completion(body)
+        cold_start = state.cold_start_delay(model)
+        if body.get("stream") and fault is None:
+            self.send_stream(completion, completion_tokens, headers,
+                             include_usage=(body.get("stream_options") or {}).get("include_usage", False),
+                             extra_latency=cold_start)
+            return
+        time.sleep(state.sample_latency(completion_tokens) + cold_start)
+
+        if fault == 500:
+            self.send_error_json(500, "The server had an error while processing your request (injected)",
+                                 "server_error", headers)
+            return
+
+        self.send_json(200, completion, headers)
+
+    def send_stream(self, completion, completion_tokens, headers, include_usage=False, extra_latency=0.0):
+        """Send a completion as server-sent events, spreading the latency over the tokens"""
+        state = self.server.state
+        chunks = completion_chunks(completion, include_usage)
+        time.sleep(state.sample_latency(0) + extra_latency)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.send_header("x-request-id", uuid.uuid4().hex)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.close_connection = True
+
+        try:
+            for chunk in chunks:
+                if chunk["choices"] and "content" in chunk["choices"][0]["delta"]:
+                    time.sleep(state.config.per_token_latency)
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early, e.g. once it had the label
+            state.stats["closed_streams"] += 1
+
+    def create_file(self):
+        fields = parse_multipart(self.headers.get("Content-Type", ""), self.body)
+        if "file" not in fields:
+            self.send_error_json(400, "Missing file")
+            return
+        filename, content = fields["file"]
+        purpose = fields.get("purpose", (None, b""))[1].decode("utf-8")
+        self.send_json(200, self.server.state.add_file(filename or "upload.jsonl", content, purpose))
+
+    def retrieve_file(self, file_id):
+        file_object = self.server.state.files.get(file_id)
+        if file_object is None:
+            self.send_not_found("file", file_id)
+            return
+        self.send_json(200, file_object)
+
+    def file_content(self, file_id):
+        content = self.server.state.file_contents.get(file_id)
+        if content is None:
+            self.send_not_found("file", file_id)
+            return
+        self.send_bytes(200, content, "application/octet-stream")
+
+    def create_batch(self):
+        body = self.json_body()
+        if body.get("input_file_id") not in self.server.state.files:
+            self.send_error_json(400, f"No such file: {body.get('input_file_id')}")
+            return
+        self.send_json(200, self.server.state.add_batch(body))
+
+    def retrieve_batch(self, batch_id):
+        batch = self.server.state.refresh_batch(batch_id)
+        if batch is None:
+            self.send_not_found("batch", batch_id)
+            return
+        self.send_json(200, batch)
+
+    def create_job(self):
+        body = self.json_body()
+        if body.get("training_file") not in self.server.state.files:
+            self.send_error_json(400, f"No such file: {body.get('training_file')}")
+            return
+        self.send_json(200, self.server.state.add_job(body))
+
+    def retrieve_job(self, job_id):
+        job = self.server.state.refresh_job(job_id)
+        if job is None:
+            self.send_not_found("fine-tuning job", job_id)
+            return
+        self.send_json(200, job)
+
+    def create_eval(self):
+        self.send_json(200, self.server.state.add_eval(self.json_body()))
+
+    def retrieve_eval(self, eval_id):
+        eval_object = self.server.state.evals.get(eval_id)
+        if eval_object is None:
+            self.send_not_found("eval", eval_id)
+            return
+        self.send_json(200, eval_object)
+
+    def create_run(self, eval_id):
+        if eval_id not in self.server.state.evals:
+            self.send_not_found("eval", eval_id)
+            return
+        run = self.server.state.add_run(eval_id, self.json_body())
+        self.send_json(200, {key: value for key, value in run.items() if key != "output_items"})
+
+    def retrieve_run(self, eval_id, run_id):
+        run = self.server.state.refresh_run(run_id)
+        if run is None or run["eval_id"] != eval_id:
+            self.send_not_found("eval run", run_id)
+            return
+        self.send_json(200, {key: value for key, value in run.items() if key != "output_items"})
+
+    def list_output_items(self, eval_id, run_id):
+        run = self.server.state.refresh_run(run_id)
+        if run is None or run["eval_id"] != eval_id:
+            self.send_not_found("eval run", run_id)
+            return
+        self.send_json(200, list_object(run["output_items"]))
+
+
+def create_server(host=DEFAULT_HOST, port=DEFAULT_PORT, config=None, verbose=False):
+    """
+    Create the local OpenAI stand-in server (not yet serving).
+
+    Args:
+        host (str): Host to bind to
+        port (int): Port to bind to (0 picks a free port)
+        config (ServerConfig): Latency, fault injection and rate limit settings
+        verbose (bool): Whether to log every request
+
+    Returns:
+        ThreadingHTTPServer: The server; its base URL is http://host:port/v1
+    """
+    server = ThreadingHTTPServer((host, port), LocalOpenAIHandler)
+    server.daemon_threads = True
+    server.state = LocalOpenAIState(config)
+    server.verbose = verbose
+    return server
+
+
+def start_in_background(**kwargs):
+    """
+    Start the server on a daemon thread, e.g. from a benchmark.
+
+    Returns:
+        tuple: (server, base_url)
+    """
+    server = create_server(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1"
+
+
+def add_config_arguments(parser):
+    """Add the ServerConfig settings as command line arguments"""
+    parser.add_argument('--latency-dist', type=str, default='lognormal', choices=LATENCY_DISTRIBUTIONS,
+                        help='Latency distribution of chat completions (default: lognormal)')
+    parser.add_argument('--latency-mean', type=float, default=0.3,
+                        help='Mean latency in seconds, the median for lognormal (default: 0.3)')
+    parser.add_argument('--latency-spread', type=float, default=0.5,
+                        help='Half-width (uniform), standard deviation (normal) or sigma (lognormal) (default: 0.5)')
+    parser.add_argument('--per-token-latency', type=float, default=0.01,
+                        help='Extra seconds per output token (default: 0.01)')
+    parser.add_argument('--error-rate-429', type=float, default=0.0, help='Share of injected 429 responses')
+    parser.add_argument('--error-rate-500', type=float, default=0.0, help='Share of injected 500 responses')
+    parser.add_argument('--rpm', type=int, default=0, help='Enforced requests/min per model (default: unlimited)')
+    parser.add_argument('--tpm', type=int, default=0, help='Enforced tokens/min per model (default: unlimited)')
+    parser.add_argument('--accuracy', type=float, default=0.6,
+                        help='Share of labelled messages answered correctly (default: 0.6)')
+    parser.add_argument('--batch-delay', type=float, default=0.0,
+                        help='Seconds a batch stays in progress before it completes')
+    parser.add_argument('--job-duration', type=float, default=0.0,
+                        help='Seconds a fine-tuning job or eval run takes')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of latency and fault injection')
+    parser.add_argument('--outage', type=float, nargs=2, metavar=('START', 'DURATION'),
+                        help='Fail chat completions with 503 from START seconds after startup for DURATION seconds')
+    parser.add_argument('--outage-models', type=str, nargs='+',
+                        help='Models affected by --outage (default: all models)')
+    parser.add_argument('--outage-latency', type=float, default=0.0,
+                        help='Seconds a chat completion takes to fail during the outage (default: 0)')
+    parser.add_argument('--cold-start-latency', type=float, default=0.0,
+                        help='Extra seconds of the first chat completion of a fine-tuned model after it was idle '
+                             '(default: 0, no cold starts)')
+    parser.add_argument('--cold-start-idle', type=float, default=60.0,
+                        help='Seconds without requests after which a fine-tuned model is cold again (default: 60)')
+    parser.add_argument('--connect-latency', type=float, default=0.0,
+                        help='Seconds a new client connection takes, like a TCP and TLS handshake (default: 0)')
+
+
+def config_from_args(args):
+    """Build a ServerConfig from parsed command line arguments"""
+    return ServerConfig(
+        latency_distribution=args.latency_dist,
+        latency_mean=args.latency_mean,
+        latency_spread=args.latency_spread,
+        per_token_latency=args.per_token_latency,
+        error_rate_429=args.error_rate_429,
+        error_rate_500=args.error_rate_500,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        accuracy=args.accuracy,
+        batch_delay=args.batch_delay,
+        job_duration=args.job_duration,
+        seed=args.seed,
+        outage_start=args.outage[0] if args.outage else None,
+        outage_duration=args.outage[1] if args.outage else 0.0,
+        outage_models=args.outage_models,
+        outage_latency=args.outage_latency,
+        cold_start_latency=args.cold_start_latency,
+        cold_start_idle=args.cold_start_idle,
+        connect_latency=args.connect_latency
+    )
+
+
+def main():
+    """
+    Main function to parse arguments and run the server
+    """
+    parser = argparse.ArgumentParser(description='Local stand-in for the OpenAI API')
+    parser.add_argument('--host', type=str, default=DEFAULT_HOST, help='Host to bind to')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to bind to')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    add_config_arguments(parser)
+
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, config=config_from_args(args), verbose=args.verbose)
+    print(f"Local OpenAI stand-in listening on http://{args.host}:{args.port}/v1")
+    print(f"Loaded {len(server.state.labels)} labelled messages")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down")
+        print(f"Stats: {server.state.stats}")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import re
+import json
+import time
+from intent_extractor import extract_intention, validate_intention
+from latency_stats import summarize_latencies, format_seconds
+from prompt_cache import get_prompt_prefix
+from rate_limiter import create_chat_completion
+
+# Appended to the system prompt of packed requests. It does not mention the number of messages,
+# so the system prompt stays a byte-identical, cacheable prefix for every pack size.
+PACKED_INSTRUCTION = (
+    "\n\nPACKED MESSAGES:\n"
+    "The user message contains several numbered guest messages, one per line. "
+    "Classify each guest message on its own and respond with only a JSON array of their intention numbers, "
+    "one per guest message in the same order, e.g. [16, 3, 39]."
+)
+
+PACKED_LINE_PATTERN = re.compile(r"^(\d+)\.\s+(.*)$")
+JSON_ARRAY_PATTERN = re.compile(r"\[[^\[\]]*\]")
+
+# Output tokens per label in the JSON array ("16, "), plus margin for the brackets
+TOKENS_PER_PACKED_LABEL = 4
+PACKED_MAX_TOKENS_MARGIN = 10
+
+# Output limit of single requests, for pack size 1 and retried slots
+SINGLE_MAX_TOKENS = 10
+
+
+def packed_system_prompt(system_prompt):
+    """Get the system prompt of packed requests"""
+    return system_prompt + PACKED_INSTRUCTION
+
+
+def pack_messages(messages):
+    """
+    Number the guest messages, one per line.
+
+    Line breaks inside a message are replaced by spaces, so every line is exactly one guest message.
+    """
+    return "\n".join(f"{index}. {' '.join(message.split())}" for index, message in enumerate(messages, start=1))
+
+
+def unpack_messages(content):
+    """Split a packed user message back into its guest messages"""
+    messages = []
+    for line in content.splitlines():
+        match = PACKED_LINE_PATTERN.match(line.strip())
+        if match:
+            messages.append(match.group(2))
+    return messages
+
+
+def parse_packed_labels(response, count):
+    """
+    Parse the labels of a packed response.
+
+    Args:
+        response (str): The model's response, e.g. "[16, 3, 39]"
+        count (int): Number of guest messages in the request
+
+    Returns:
+        list: One intention number (str) per guest message, None for missing or malformed slots.
+            If the array has the wrong length, the labels cannot be matched to the messages
+            and all slots are None.
+    """
+    match = JSON_ARRAY_PATTERN.search(response or "")
+    if not match:
+        return [None] * count
+    try:
+        values = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return [None] * count
+    if len(values) != count:
+        return [None] * count
+
+    labels = []
+    for value in values:
+        text = str(value).strip().lstrip("#")
+        labels.append(validate_intention(text) if text.isdigit() and text.isascii() else None)
+    return labels
+
+
+def build_packed_request(messages, system_message, model="gpt-4o-mini", pad_prefix=False):
+    """
+    Build the chat completion request classifying several guest messages at once.
+
+    Args:
+        messages (list): Guest messages
+        system_message (str): The system prompt (PACKED_INSTRUCTION is appended)
+        model (str): The model to use
+        pad_prefix (bool): Whether to pad the system prompt to the prompt cache threshold
+
+    Returns:
+        dict: Keyword arguments for client.chat.completions.create
+    """
+    prefix = get_prompt_prefix(packed_system_prompt(system_message), pad=pad_prefix, model=model)
+    return {
+        "model": model,
+        "messages": prefix.messages(pack_messages(messages)),
+        "max_tokens": TOKENS_PER_PACKED_LABEL * len(messages) + PACKED_MAX_TOKENS_MARGIN,
+        "seed": 42
+    }
+
+
+def build_single_request(message, system_message, model="gpt-4o-mini", pad_prefix=False):
+    """Build the chat completion request classifying one guest message"""
+    return {
+        "model": model,
+        "messages": get_prompt_prefix(system_message, pad=pad_prefix, model=model).messages(message),
+        "max_tokens": SINGLE_MAX_TOKENS,
+        "seed": 42
+    }
+
+
+class PackingStats:
+    """Requests, tokens and retried slots of a packed classification run"""
+
+    def __init__(self, pack_size):
+        self.pack_size = pack_size
+        self.messages = 0
+        self.requests = 0
+        self.retried = 0
+        self.failed = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies = []
+
+    def record(self, response, latency):
+        """Count one request, failed ones (response None) included"""
+        self.requests += 1
+        self.latencies.append(latency)
+        if response is not None and response.usage is not None:
+            self.prompt_tokens += response.usage.prompt_tokens
+            self.completion_tokens += response.usage.completion_tokens
+
+    def summary(self):
+        """
+        Summarize the packing.
+
+        Returns:
+            dict: pack_size, messages, requests, packing_factor (classifications per request), retried and
+                failed slots, prompt and completion tokens per classification, and the request latencies
+        """
+        def per_classification(tokens):
+            return tokens / self.messages if self.messages else None
+
+        return {
+            "pack_size": self.pack_size,
+            "messages": self.messages,
+            "requests": self.requests,
+            "packing_factor": self.messages / self.requests if self.requests else None,
+            "retried": self.retried,
+            "failed": self.failed,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "prompt_tokens_per_classification": per_classification(self.prompt_tokens),
+            "tokens_per_classification": per_classification(self.prompt_tokens + self.completion_tokens),
+            "latency": summarize_latencies(self.latencies)
+        }
+
+
+def format_packing_summary(summary):
+    """Format the packing factor, tokens per classification and retries for reports"""
+    tokens = summary["tokens_per_classification"]
+    return (f"Packing: {summary['messages']} messages in {summary['requests']} requests "
+            f"(pack size {summary['pack_size']}, packing factor {summary['packing_factor'] or 0:.1f}), "
+            f"{tokens if tokens is not None else float('nan'):.1f} tokens per classification, "
+            f"{summary['retried']} slots retried individually, {summary['failed']} failed, "
+            f"p50 request latency {format_seconds(summary['latency']['p50'])}")
+
+
+def send_single(client, message, system_message, model, pad_prefix, stats):
+    """Classify one guest message, returning the response text ("Error: ..." if the request failed)"""
+    request = build_single_request(message, system_message, model, pad_prefix)
+    start_time = time.perf_counter()
+    try:
+        response = create_chat_completion(client, request)
+    except Exception as e:
+        stats.record(None, time.perf_counter() - start_time)
+        return f"Error: {str(e)}"
+    stats.record(response, time.perf_counter() - start_time)
+    return response.choices[0].message.content
+
+
+def classify_packed(client, messages, system_message, model="gpt-4o-mini", pack_size=10, pad_prefix=False):
+    """
+    Classify guest messages with pack_size numbered messages per request.
+
+    The labels are parsed from the JSON array of each response. Slots that are missing or
+    malformed are retried with one request per message. A pack size of 1 sends the usual
+    single-message requests, as the baseline of the packed runs.
+
+    Args:
+        client (openai.OpenAI): OpenAI client
+        messages (list): Guest messages
+        system_message (str): The system prompt
+        model (str): The model to use
+        pack_size (int): Guest messages per request
+        pad_prefix (bool): Whether to pad the system prompt to the prompt cache threshold
+
+    Returns:
+        tuple: (responses, summary) - one response text per message in input order (the label for
+            packed slots, the full answer for single requests) and the PackingStats summary
+    """
+    stats = PackingStats(pack_size)
+    responses = []
+
+    for start in range(0, len(messages), pack_size):
+        chunk = messages[start:start + pack_size]
+        stats.messages += len(chunk)
+        if pack_size == 1:
+            answer = send_single(client, chunk[0], system_message, model, pad_prefix, stats)
+            if extract_intention(answer) is None:
+                stats.failed += 1
+            responses.append(answer)
+            continue
+
+        request = build_packed_request(chunk, system_message, model, pad_prefix)
+        start_time = time.perf_counter()
+        response = None
+        try:
+            response = create_chat_completion(client, request)
+            labels = parse_packed_labels(response.choices[0].message.content, len(chunk))
+        except Exception as e:
+            print(f"Error for packed request of messages {start + 1}-{start + len(chunk)}: {str(e)}")
+            labels = [None] * len(chunk)
+        finally:
+            stats.record(response, time.perf_counter() - start_time)
+
+        for message, label in zip(chunk, labels):
+            if label is None:
+                stats.retried += 1
+                label = send_single(client, message, system_message, model, pad_prefix, stats)
+                if extract_intention(label) is None:
+                    stats.failed += 1
+            responses.append(label)
+
+    return responses, stats.summary()
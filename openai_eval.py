@@ -4,13 +4,18 @@ import time
 import argparse
 from openai import OpenAI
 from datetime import datetime
+from intent_extractor import extract_intention
+from create_jsonl import PROMPT_STYLES, prompt_messages
+from prompt_cache import get_prompt_prefix, PromptCacheStats, cached_tokens_of, format_prompt_cache_summary
+from prompt_variants import select_prompt
 
 # Initialize the OpenAI client
 api_key = os.environ.get("OPENAI_API_KEY")
 if not api_key:
     raise ValueError("OPENAI_API_KEY environment variable is not set")
 
-client = OpenAI(api_key=api_key)
+# OPENAI_BASE_URL points the scripts at another endpoint, e.g. the local stand-in server
+client = OpenAI(api_key=api_key, base_url=os.environ.get("OPENAI_BASE_URL"))
 
 # System prompt from test_intent_4o-mini_200.py with updated response format for evals
 SYSTEM_PROMPT = """You are an advanced hospitality chatbot for a premium hotel chain. Your primary function is to analyze user messages and accurately identify their main intention from a predefined list of 40 possible intentions. Follow these guidelines:
@@ -192,10 +197,16 @@ def upload_test_data():
         print(f"Error uploading test data: {str(e)}")
         return None
 
-def create_eval_run(eval_id=None, data_id=None):
+def create_eval_run(eval_id=None, data_id=None, pad_prefix=False, prompt_style="full",
+                    model="ft:gpt-4o-mini-2024-07-18:personal:sft400:BUKolthG", prompt_variant=None):
     """
     Create an evaluation run using the gpt-4o-mini model
     Reference: https://platform.openai.com/docs/api-reference/evals/createRun
+    
+    With pad_prefix the developer message is padded to the 1024-token prompt cache threshold.
+    prompt_style selects the instructions sent with each message (see create_jsonl.PROMPT_STYLES);
+    use the style the model was fine-tuned with. prompt_variant replaces the full instructions
+    with a variant stored by compress_prompt.py.
     """
     if eval_id is None or data_id is None:
         ids = load_ids()
@@ -217,7 +228,7 @@ def create_eval_run(eval_id=None, data_id=None):
         # "name": "gpt-4.1 100 " + datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "data_source": {
             "type": "completions",
-            "model": "ft:gpt-4o-mini-2024-07-18:personal:sft400:BUKolthG",
+            "model": model,
             # "model": "ft:gpt-4o-mini-2024-07-18:personal:sft200:BTfrZIAI",
             # "model": "ft:gpt-4o-mini-2024-07-18:personal:sft200:BTfZkUri",
             # "model": "ft:gpt-4o-mini-2024-07-18:personal:sft200:BTfHQPSh",
@@ -230,16 +241,12 @@ def create_eval_run(eval_id=None, data_id=None):
             # "model": "gpt-4.1",
             "input_messages": {
                 "type": "template",
-                "template": [
-                    {
-                        "role": "developer",
-                        "content": SYSTEM_PROMPT
-                    },
-                    {
-                        "role": "user",
-                        "content": "{{item.input_text}}"
-                    }
-                ]
+                "template": prompt_messages(
+                    "{{item.input_text}}",
+                    prompt_style,
+                    full_prompt=get_prompt_prefix(select_prompt(prompt_variant, SYSTEM_PROMPT), role="developer",
+                                                  pad=pad_prefix).content
+                )
             },
             "sampling_params": {
                 "seed": 42
@@ -274,33 +281,34 @@ def create_eval_run(eval_id=None, data_id=None):
         print(f"Error creating eval run: {str(e)}")
         return None
 
-def check_run_status(run_id=None):
+def check_run_status(run_id=None, eval_id=None):
     """
     Check the status of the evaluation run
     """
-    if run_id is None:
+    if run_id is None or eval_id is None:
         ids = load_ids()
-        run_id = ids.get("run_id")
-        if not run_id:
-            print("No run ID provided or found in saved IDs. Please create a run first.")
+        run_id = ids.get("run_id") if run_id is None else run_id
+        eval_id = ids.get("eval_id") if eval_id is None else eval_id
+        if not run_id or not eval_id:
+            print("No run ID or eval ID provided or found in saved IDs. Please create a run first.")
             return None
     
     print(f"Checking status for run ID: {run_id}...")
     
     try:
         while True:
-            response = client.evaluations.get_run(run_id=run_id)
+            response = client.evals.runs.retrieve(run_id, eval_id=eval_id)
             status = response.status
             print(f"Run status: {status}")
             
-            if status in ["completed", "failed", "cancelled"]:
+            if status in ["completed", "failed", "canceled"]:
                 # Print details when status changes to completed or failed
                 print("\nRun details:")
                 print(f"Run ID: {response.id}")
                 print(f"Status: {response.status}")
-                print(f"Started at: {response.started_at}")
-                print(f"Completed at: {response.completed_at}")
-                if hasattr(response, 'error'):
+                print(f"Created at: {response.created_at}")
+                print(f"Result counts: {response.result_counts}")
+                if response.error:
                     print(f"Error: {response.error}")
                 return status
             
@@ -310,109 +318,115 @@ def check_run_status(run_id=None):
         print(f"Error checking run status: {str(e)}")
         return None
 
-def extract_intention_number(response):
+def aggregate_results(run_id, records):
     """
-    Extract the intention number from the model's response
+    Compare the extracted intention of every eval output item with its correct label
+    
+    Args:
+        run_id (str): ID of the eval run
+        records (list): Output items of the run
+    
+    Returns:
+        dict: Counts, accuracy and the details of every record
     """
-    # Look for patterns like "INTENTION: #16 - Request room cleaning" or variations
-    lines = response.split('\n')
-    for line in lines:
-        if "INTENTION:" in line or "intention:" in line:
-            parts = line.split('#')
-            if len(parts) > 1:
-                # Extract the number after the #
-                intention_part = parts[1].strip()
-                # If there's a space or dash, get just the number
-                if ' ' in intention_part:
-                    intention_number = intention_part.split(' ')[0]
-                elif '-' in intention_part:
-                    intention_number = intention_part.split('-')[0]
-                else:
-                    intention_number = intention_part
-                return intention_number.strip()
-
-    # If the above doesn't work, try to find any number preceded by #
-    import re
-    match = re.search(r'#(\d+)', response)
-    if match:
-        return match.group(1)
+    total_records = len(records)
+    correct = 0
+    incorrect = 0
+    processed_records = []
+    prompt_cache_stats = None
+    
+    # Process each record
+    for record in records:
+        expected = str(record.datasource_item["correct_label"])
+        actual_response = record.sample.output[0].content if record.sample.output else ""
+        
+        # Count the prompt tokens the API served from its prompt cache
+        usage = getattr(record.sample, "usage", None)
+        if usage is not None:
+            if prompt_cache_stats is None:
+                prompt_cache_stats = PromptCacheStats(getattr(record.sample, "model", None) or "unknown")
+            prompt_cache_stats.record(*cached_tokens_of(usage))
+        
+        # Extract the intention number from the response
+        extracted_intention = extract_intention(actual_response)
+        
+        # Check if the intention is correct
+        is_correct = extracted_intention == expected
+        
+        if is_correct:
+            correct += 1
+        else:
+            incorrect += 1
+        
+        # Store the record details
+        processed_record = {
+            "id": record.id,
+            "input_text": record.datasource_item.get("input_text", ""),
+            "expected_intention": expected,
+            "model_response": actual_response,
+            "extracted_intention": extracted_intention,
+            "is_correct": is_correct
+        }
+        
+        processed_records.append(processed_record)
+    
+    # Calculate accuracy
+    accuracy = correct / total_records if total_records > 0 else 0
+    
+    # Create a results summary
+    return {
+        "run_id": run_id,
+        "total_records": total_records,
+        "correct": correct,
+        "incorrect": incorrect,
+        "accuracy": accuracy,
+        "prompt_cache": prompt_cache_stats.summary() if prompt_cache_stats else None,
+        "records": processed_records
+    }
 
-    return None
+def save_results(results, results_file):
+    """
+    Save the analysis results to a JSON file
+    """
+    with open(results_file, "w") as f:
+        json.dump(results, f, indent=2)
 
-def analyze_results(run_id=None):
+def analyze_results(run_id=None, eval_id=None):
     """
     Analyze the results of the evaluation run
     """
-    if run_id is None:
+    if run_id is None or eval_id is None:
         ids = load_ids()
-        run_id = ids.get("run_id")
-        if not run_id:
-            print("No run ID provided or found in saved IDs. Please create a run first.")
+        run_id = ids.get("run_id") if run_id is None else run_id
+        eval_id = ids.get("eval_id") if eval_id is None else eval_id
+        if not run_id or not eval_id:
+            print("No run ID or eval ID provided or found in saved IDs. Please create a run first.")
             return None
     
     print(f"Analyzing results for run ID: {run_id}...")
     
     try:
         # Get the results of the run
-        response = client.evaluations.list_records(run_id=run_id)
-        records = response.data
+        records = list(client.evals.runs.output_items.list(run_id, eval_id=eval_id))
         
-        total_records = len(records)
-        correct = 0
-        incorrect = 0
-        processed_records = []
-        
-        # Process each record
-        for record in records:
-            expected = record.expected_output
-            actual_response = record.output
-            
-            # Extract the intention number from the response
-            extracted_intention = extract_intention_number(actual_response)
-            
-            # Check if the intention is correct
-            is_correct = extracted_intention == expected
-            
-            if is_correct:
-                correct += 1
-            else:
-                incorrect += 1
-            
-            # Store the record details
-            processed_record = {
-                "id": record.id,
-                "input_text": record.input_messages[1].content if len(record.input_messages) > 1 else "",
-                "expected_intention": expected,
-                "model_response": actual_response,
-                "extracted_intention": extracted_intention,
-                "is_correct": is_correct
-            }
-            
-            processed_records.append(processed_record)
-        
-        # Calculate accuracy
-        accuracy = correct / total_records if total_records > 0 else 0
-        
-        # Create a results summary
-        results = {
-            "run_id": run_id,
-            "total_records": total_records,
-            "correct": correct,
-            "incorrect": incorrect,
-            "accuracy": accuracy,
-            "records": processed_records
-        }
+        results = aggregate_results(run_id, records)
         
         # Save the results to a file
         results_file = f"eval_results_{run_id}.json"
-        with open(results_file, "w") as f:
-            json.dump(results, f, indent=2)
+        save_results(results, results_file)
+        
+        total_records = results["total_records"]
+        correct = results["correct"]
+        incorrect = results["incorrect"]
+        accuracy = results["accuracy"]
         
         print(f"\nAnalysis completed!")
         print(f"Total records: {total_records}")
         print(f"Correct: {correct}")
         print(f"Incorrect: {incorrect}")
         print(f"Accuracy: {accuracy:.2%}")
+        if results["prompt_cache"]:
+            print(format_prompt_cache_summary(results["prompt_cache"]))
         print(f"Detailed results saved to {results_file}")
         
         return results
@@ -443,13 +457,13 @@ def run_all():
         return
     
     # Step 4: Check the status of the run
-    status = check_run_status(run_id)
+    status = check_run_status(run_id, eval_id)
     if status != "completed":
         print(f"Run did not complete successfully. Status: {status}")
         return
     
     # Step 5: Analyze the results
-    analyze_results(run_id)
+    analyze_results(run_id, eval_id)
 
 def main():
     """
@@ -469,6 +483,14 @@ def main():
     parser.add_argument('--eval-id', type=str, help='Eval ID for operations that require it')
     parser.add_argument('--data-id', type=str, help='Data ID for operations that require it')
     parser.add_argument('--run-id', type=str, help='Run ID for operations that require it')
+    parser.add_argument('--model', type=str, default='ft:gpt-4o-mini-2024-07-18:personal:sft400:BUKolthG',
+                        help='Model of the eval run')
+    parser.add_argument('--prompt-style', type=str, default='full', choices=list(PROMPT_STYLES),
+                        help='Instructions sent with each message in the run (default: full)')
+    parser.add_argument('--pad-prefix', action='store_true',
+                        help='Pad the developer message of the run to the 1024-token prompt cache threshold')
+    parser.add_argument('--prompt-variant', type=str,
+                        help='Shortened instructions stored by compress_prompt.py --save, used with --prompt-style full')
     
     args = parser.parse_args()
     
@@ -488,13 +510,14 @@ def main():
             create_eval()
         
         if args.run:
-            create_eval_run(args.eval_id, args.data_id)
+            create_eval_run(args.eval_id, args.data_id, args.pad_prefix, args.prompt_style, args.model,
+                            args.prompt_variant)
         
         if args.check:
-            check_run_status(args.run_id)
+            check_run_status(args.run_id, args.eval_id)
         
         if args.analyze:
-            analyze_results(args.run_id)
+            analyze_results(args.run_id, args.eval_id)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -4,13 +4,14 @@ import time
 import argparse
 from openai import OpenAI
 from datetime import datetime
+from rate_limiter import create_chat_completion
 
 # Initialize the OpenAI client
 api_key = os.environ.get("OPENAI_API_KEY")
 if not api_key:
     raise ValueError("OPENAI_API_KEY environment variable is not set")
 
-client = OpenAI(api_key=api_key)
+client = OpenAI(api_key=api_key, base_url=os.environ.get("OPENAI_BASE_URL"))
 
 # File to store IDs for each step
 IDS_FILE = "openai_ft_ids.json"
@@ -30,17 +31,17 @@ def save_ids(ids_dict):
     with open(IDS_FILE, 'w') as f:
         json.dump(ids_dict, f, indent=2)
 
-def upload_training_file():
+def upload_training_file(training_file="tests400.jsonl"):
     """
     Upload training data file to OpenAI API
     Reference: https://platform.openai.com/docs/api-reference/files
     """
-    print("Uploading training file...")
+    print(f"Uploading training file {training_file}...")
     
     try:
         # Upload the data to OpenAI
         response = client.files.create(
-            file=open("tests400.jsonl", "rb"),
+            file=open(training_file, "rb"),
             purpose="fine-tune"
         )
 
@@ -184,9 +185,18 @@ def check_fine_tuning_status(job_id=None):
         print(f"Error checking fine-tuning job status: {str(e)}")
         return None
 
-def analyze_results(job_id=None):
+def load_test_examples(test_file="tests200.jsonl"):
+    """
+    Load the chat format examples of a JSONL test file
+    """
+    with open(test_file, "r") as f:
+        return [json.loads(line) for line in f]
+
+def analyze_results(job_id=None, test_file="tests200.jsonl"):
     """
     Analyze the results of the fine-tuning job
+    
+    The test examples should use the prompt style of the training file (see create_jsonl.PROMPT_STYLES)
     """
     print("Analyzing fine-tuning job results...")
     
@@ -231,10 +241,9 @@ def analyze_results(job_id=None):
         # Test the fine-tuned model on a few examples
         print("\nTesting fine-tuned model on examples...")
         
-        # Load test examples from tests200.jsonl
+        # Load test examples from the test file
         try:
-            with open("tests200.jsonl", "r") as f:
-                test_examples = [json.loads(line) for line in f]
+            test_examples = load_test_examples(test_file)
             
             # Select a few examples for testing
             test_sample = test_examples[:3]  # Using first 3 examples
@@ -245,10 +254,11 @@ def analyze_results(job_id=None):
             
             for idx, example in enumerate(test_sample):
                 # Extract messages from the example
+                # The developer message is missing in prompt-free examples
                 messages = example["messages"]
-                system_message = messages[0]["content"]
-                user_message = messages[1]["content"]
-                expected_label = messages[2]["content"]
+                prompt_messages = messages[:-1]
+                user_message = messages[-2]["content"]
+                expected_label = messages[-1]["content"]
                 
                 total_count += 1
                 
@@ -258,14 +268,11 @@ def analyze_results(job_id=None):
                 
                 # Query the fine-tuned model
                 try:
-                    completion = client.chat.completions.create(
-                        model=fine_tuned_model,
-                        messages=[
-                            {"role": "system", "content": system_message},
-                            {"role": "user", "content": user_message}
-                        ],
-                        max_tokens=10
-                    )
+                    completion = create_chat_completion(client, {
+                        "model": fine_tuned_model,
+                        "messages": prompt_messages,
+                        "max_tokens": 10
+                    })
                     
                     # Get the model's prediction
                     prediction = completion.choices[0].message.content.strip()
@@ -310,14 +317,14 @@ def analyze_results(job_id=None):
         print(f"Error analyzing fine-tuning job results: {str(e)}")
         return None
 
-def run_all():
+def run_all(training_file="tests400.jsonl", test_file="tests200.jsonl"):
     """
     Run all steps in sequence
     """
     print("Starting complete fine-tuning process...")
 
     # Step 1: Upload training file
-    file_id = upload_training_file()
+    file_id = upload_training_file(training_file)
     if not file_id:
         print("Failed to upload training file. Aborting.")
         return
@@ -353,7 +360,7 @@ def run_all():
     
     # Step 4: Analyze results if job succeeded
     if status == "succeeded":
-        analyze_results(job_id)
+        analyze_results(job_id, test_file)
     else:
         print(f"Fine-tuning job did not succeed (status: {status}). Skipping analysis.")
     
@@ -376,6 +383,10 @@ def main():
     parser.add_argument('--file-id', type=str, help='File ID for operations that require it')
     parser.add_argument('--job-id', type=str, help='Job ID for operations that require it')
     
+    # Add arguments for the data files, e.g. prompt-free files from create_jsonl.py --prompt-style none
+    parser.add_argument('--training-file', type=str, default='tests400.jsonl', help='Training file to upload')
+    parser.add_argument('--test-file', type=str, default='tests200.jsonl', help='Test examples for the analysis')
+    
     args = parser.parse_args()
     
     # If no arguments provided, show help
@@ -385,10 +396,10 @@ def main():
     
     # Run the appropriate step based on the arguments
     if args.all:
-        run_all()
+        run_all(args.training_file, args.test_file)
     else:
         if args.upload:
-            upload_training_file()
+            upload_training_file(args.training_file)
 
         if args.create:
             create_fine_tuning_job(args.file_id)
@@ -397,7 +408,7 @@ def main():
             check_fine_tuning_status(args.job_id)
         
         if args.analyze:
-            analyze_results(args.job_id)
+            analyze_results(args.job_id, args.test_file)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
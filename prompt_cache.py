@@ -0,0 +1,287 @@
+import hashlib
+import threading
+from classification_modes import base_model_name, DEFAULT_ENCODING
+from latency_stats import format_seconds
+
+# Prompts are only cached by the API from this many tokens on, in steps of 128 tokens after that
+PREFIX_CACHE_THRESHOLD = 1024
+
+# Tokens added per message by the chat format, kept as margin when padding
+MESSAGE_OVERHEAD_TOKENS = 8
+
+# Neutral text appended to the static prefix to reach the cache threshold
+PADDING_HEADER = "\n\nREFERENCE NOTES:\n"
+PADDING_LINE = "- The instructions above apply to every message in this conversation.\n"
+
+# USD per 1M input tokens: (uncached, cached), matched by model name prefix
+INPUT_PRICES = {
+    "ft:gpt-4o-mini": (0.30, 0.15),
+    "ft:gpt-4.1-mini": (0.80, 0.20),
+    "ft:gpt-4.1": (3.00, 0.75),
+    "gpt-4o-mini": (0.15, 0.075),
+    "gpt-4o": (2.50, 1.25),
+    "gpt-4.1-nano": (0.10, 0.025),
+    "gpt-4.1-mini": (0.40, 0.10),
+    "gpt-4.1": (2.00, 0.50),
+    "gpt-3.5-turbo": (0.50, 0.50),
+}
+
+# USD per 1M output tokens, matched by model name prefix
+OUTPUT_PRICES = {
+    "ft:gpt-4o-mini": 1.20,
+    "ft:gpt-4.1-mini": 3.20,
+    "ft:gpt-4.1": 12.00,
+    "gpt-4o-mini": 0.60,
+    "gpt-4o": 10.00,
+    "gpt-4.1-nano": 0.40,
+    "gpt-4.1-mini": 1.60,
+    "gpt-4.1": 8.00,
+    "gpt-3.5-turbo": 1.50,
+}
+
+
+def count_prompt_tokens(text, model="gpt-4o-mini"):
+    """
+    Count the tokens of a text with the model's encoding.
+
+    Uses tiktoken when it is installed, else estimates ~4 characters per token.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return len(text) // 4 + 1
+
+    try:
+        encoding = tiktoken.encoding_for_model(base_model_name(model))
+    except KeyError:
+        encoding = tiktoken.get_encoding(DEFAULT_ENCODING)
+    return len(encoding.encode(text))
+
+
+def model_price(model, prices):
+    """Get the price of a model from a table keyed by model name prefix, or None if unknown"""
+    # Longest prefix first, so "gpt-4o-mini-2024-07-18" is not priced as "gpt-4o"
+    for prefix in sorted(prices, key=len, reverse=True):
+        if model.startswith(prefix):
+            return prices[prefix]
+    return None
+
+
+def input_prices(model):
+    """Get the (uncached, cached) USD price per 1M input tokens of a model, or None if unknown"""
+    return model_price(model, INPUT_PRICES)
+
+
+def request_cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    """
+    Get the USD cost of one request.
+
+    Args:
+        model (str): Model of the request
+        prompt_tokens (int): Prompt tokens, including the cached ones
+        completion_tokens (int): Output tokens
+        cached_tokens (int): Prompt tokens served from the prompt cache
+
+    Returns:
+        float: The cost, or None for models without known prices
+    """
+    prices = input_prices(model)
+    output_price = model_price(model, OUTPUT_PRICES)
+    if prices is None or output_price is None:
+        return None
+    uncached_price, cached_price = prices
+    return ((prompt_tokens - cached_tokens) * uncached_price + cached_tokens * cached_price
+            + completion_tokens * output_price) / 1e6
+
+
+class PromptPrefix:
+    """
+    Static system prompt that is sent byte-identical at the start of every request.
+
+    The API caches the longest previously seen prompt prefix, so everything that changes
+    between requests (the guest message) must come after it. The prefix is frozen when the
+    object is created and can be padded to the cache threshold, since shorter prompts are
+    never cached.
+    """
+
+    def __init__(self, system_prompt, role="system", pad=False, model="gpt-4o-mini"):
+        """
+        Args:
+            system_prompt (str): The static instructions
+            role (str): Role of the prefix message ("system" or "developer")
+            pad (bool): Whether to pad the prefix to PREFIX_CACHE_THRESHOLD tokens
+            model (str): Model whose encoding is used to count the tokens
+        """
+        content = system_prompt
+        tokens = count_prompt_tokens(content, model)
+        if pad and tokens + MESSAGE_OVERHEAD_TOKENS < PREFIX_CACHE_THRESHOLD:
+            padding_tokens = count_prompt_tokens(PADDING_LINE, model)
+            missing = PREFIX_CACHE_THRESHOLD - tokens - MESSAGE_OVERHEAD_TOKENS
+            content += PADDING_HEADER + PADDING_LINE * (missing // padding_tokens + 1)
+            tokens = count_prompt_tokens(content, model)
+
+        self.role = role
+        self.content = content
+        self.tokens = tokens
+        self.padded = content != system_prompt
+        self.fingerprint = hashlib.sha256(content.encode("utf-8")).hexdigest()[:12]
+
+    def messages(self, user_message):
+        """Get the messages of a request: the static prefix first, then the guest message"""
+        return [
+            {"role": self.role, "content": self.content},
+            {"role": "user", "content": user_message}
+        ]
+
+    def describe(self):
+        """Describe the prefix for reports"""
+        padded = ", padded" if self.padded else ""
+        cacheable = "cacheable" if self.tokens + MESSAGE_OVERHEAD_TOKENS >= PREFIX_CACHE_THRESHOLD else \
+            f"below the {PREFIX_CACHE_THRESHOLD}-token cache threshold"
+        return f"prompt prefix {self.fingerprint}: {self.tokens} tokens{padded}, {cacheable}"
+
+
+# Frozen prefixes, so every request with the same settings reuses the same content
+_prefixes = {}
+_prefixes_lock = threading.Lock()
+
+
+def get_prompt_prefix(system_prompt, role="system", pad=False, model="gpt-4o-mini"):
+    """
+    Get the shared PromptPrefix of a system prompt, creating it on first use.
+
+    Args:
+        system_prompt (str): The static instructions
+        role (str): Role of the prefix message ("system" or "developer")
+        pad (bool): Whether to pad the prefix to PREFIX_CACHE_THRESHOLD tokens
+        model (str): Model whose encoding is used to count the tokens
+
+    Returns:
+        PromptPrefix: The prefix
+    """
+    key = (system_prompt, role, pad, base_model_name(model) if pad else None)
+    with _prefixes_lock:
+        if key not in _prefixes:
+            _prefixes[key] = PromptPrefix(system_prompt, role, pad, model)
+        return _prefixes[key]
+
+
+class PromptCacheStats:
+    """Cached prompt tokens and latencies of the requests to one model"""
+
+    def __init__(self, model):
+        self.model = model
+        self.requests = 0
+        self.hits = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.hit_latencies = []
+        self.miss_latencies = []
+
+    def record(self, prompt_tokens, cached_tokens, latency=None):
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        if cached_tokens > 0:
+            self.hits += 1
+        if latency is not None:
+            (self.hit_latencies if cached_tokens > 0 else self.miss_latencies).append(latency)
+
+    def summary(self):
+        """
+        Summarize the cache hits and their savings.
+
+        Returns:
+            dict: requests, hit_ratio, cached_token_share, input_cost and input_cost_uncached (USD, None for
+                unknown models), cost_savings, and the mean latency of hits and misses
+        """
+        prices = input_prices(self.model)
+        input_cost = input_cost_uncached = None
+        if prices:
+            uncached_price, cached_price = prices
+            input_cost = ((self.prompt_tokens - self.cached_tokens) * uncached_price
+                          + self.cached_tokens * cached_price) / 1e6
+            input_cost_uncached = self.prompt_tokens * uncached_price / 1e6
+
+        mean_hit = sum(self.hit_latencies) / len(self.hit_latencies) if self.hit_latencies else None
+        mean_miss = sum(self.miss_latencies) / len(self.miss_latencies) if self.miss_latencies else None
+        return {
+            "model": self.model,
+            "requests": self.requests,
+            "hit_ratio": self.hits / self.requests if self.requests else 0,
+            "cached_token_share": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "input_cost": input_cost,
+            "input_cost_uncached": input_cost_uncached,
+            "cost_savings": 1 - input_cost / input_cost_uncached if input_cost_uncached else None,
+            "mean_hit_latency": mean_hit,
+            "mean_miss_latency": mean_miss,
+            "latency_savings": 1 - mean_hit / mean_miss if mean_hit is not None and mean_miss else None
+        }
+
+
+# One set of counters per model, since caching is per model
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def cached_tokens_of(usage):
+    """
+    Read the number of cached prompt tokens from the usage of a response.
+
+    Args:
+        usage: CompletionUsage object or usage dict (None when the API did not report usage)
+
+    Returns:
+        tuple: (prompt_tokens, cached_tokens)
+    """
+    if usage is None:
+        return 0, 0
+    if not isinstance(usage, dict):
+        usage = usage.model_dump() if hasattr(usage, "model_dump") else vars(usage)
+    details = usage.get("prompt_tokens_details") or {}
+    return usage.get("prompt_tokens") or 0, details.get("cached_tokens") or usage.get("cached_tokens") or 0
+
+
+def record_usage(model, usage, latency=None):
+    """
+    Record the cached prompt tokens of one response.
+
+    Args:
+        model (str): Model of the request
+        usage: Usage of the response (object or dict)
+        latency (float): Seconds the request took, to compare cache hits and misses
+    """
+    prompt_tokens, cached_tokens = cached_tokens_of(usage)
+    if prompt_tokens == 0:
+        return
+    with _stats_lock:
+        if model not in _stats:
+            _stats[model] = PromptCacheStats(model)
+        _stats[model].record(prompt_tokens, cached_tokens, latency)
+
+
+def prompt_cache_summaries():
+    """Get the summary of every model's prompt cache counters"""
+    with _stats_lock:
+        return [stats.summary() for stats in _stats.values()]
+
+
+def format_prompt_cache_summary(summary):
+    """Format the cache-hit ratio and savings of one model for reports"""
+    line = (f"Prompt cache {summary['model']}: {summary['hit_ratio']:.1%} of {summary['requests']} requests hit, "
+            f"{summary['cached_token_share']:.1%} of {summary['prompt_tokens']} prompt tokens cached")
+    if summary["input_cost"] is not None:
+        line += (f"; input cost ${summary['input_cost']:.4f} instead of ${summary['input_cost_uncached']:.4f} "
+                 f"({summary['cost_savings']:.1%} saved)")
+    if summary["latency_savings"] is not None:
+        line += (f"; mean latency {format_seconds(summary['mean_hit_latency'])} on hits vs "
+                 f"{format_seconds(summary['mean_miss_latency'])} on misses ({summary['latency_savings']:.1%} faster)")
+    return line
+
+
+def print_prompt_cache_stats():
+    """Print the cache-hit ratio and the input-cost and latency savings of every model"""
+    for summary in prompt_cache_summaries():
+        print(format_prompt_cache_summary(summary))
@@ -0,0 +1,225 @@
+import os
+import re
+import json
+import itertools
+from datetime import datetime
+
+# Selected variants, stored by name so the scripts can use them
+PROMPT_VARIANTS_FILE = "prompt_variants.json"
+
+# Name of the unchanged prompt
+ORIGINAL_VARIANT = "original"
+
+SECTION_HEADER_PATTERN = re.compile(r"^(\d+)\.\s+([A-Z][A-Z ]+):(.*)$")
+INTENTION_LINE_PATTERN = re.compile(r"^(\d+)\.\s+(.+?)\s*$")
+LIST_HEADER = "LIST OF INTENTIONS:"
+
+# Guideline sections that may be dropped, by the key used in variant names.
+# The response format is always kept, since the answers are parsed from it.
+DROPPABLE_SECTIONS = {
+    "core": "CORE FUNCTION",
+    "analysis": "ANALYSIS APPROACH",
+    "ambiguity": "HANDLING AMBIGUITY",
+    "special": "SPECIAL CASES",
+}
+
+# Sections dropped one after another, least useful first, for the default search
+DROP_LEVELS = [
+    [],
+    ["special"],
+    ["special", "ambiguity"],
+    ["special", "ambiguity", "analysis"],
+    ["special", "ambiguity", "analysis", "core"],
+]
+
+# Abbreviated intention names (1-3 words)
+SHORT_INTENTION_NAMES = {
+    1: "Room availability", 2: "Book room", 3: "Modify booking", 4: "Cancel booking", 5: "Booking status",
+    6: "Early check-in", 7: "Late check-out", 8: "Online check-in", 9: "Online check-out", 10: "Luggage help",
+    11: "Room service", 12: "Restaurant table", 13: "Menu/dietary info", 14: "Breakfast hours", 15: "Minibar refill",
+    16: "Room cleaning", 17: "Towels/toiletries/pillows", 18: "Room issue", 19: "Laundry", 20: "In-room amenities",
+    21: "Local attractions", 22: "Wake-up call", 23: "Taxi/shuttle", 24: "Hotel policies", 25: "Spa/gym booking",
+    26: "Invoice/receipt", 27: "Bill charges query", 28: "Change payment", 29: "Split bill", 30: "Pre-authorize payment",
+    31: "Wi-Fi help", 32: "Facility hours", 33: "Parking info", 34: "Pet policy", 35: "Smoking policy",
+    36: "Review/feedback", 37: "Complaint", 38: "Speak to manager", 39: "Human agent", 40: "Chatbot help",
+}
+
+
+def parse_prompt(prompt):
+    """
+    Split the system prompt into its introduction, guideline sections and list of intentions.
+
+    Args:
+        prompt (str): System prompt in the layout of openai_eval.SYSTEM_PROMPT
+
+    Returns:
+        dict: intro (str), sections [(title, first line, body lines)] and intentions [(number, name)]
+    """
+    intro_lines = []
+    sections = []
+    intentions = []
+    in_list = False
+
+    for line in prompt.splitlines():
+        if line.strip() == LIST_HEADER:
+            in_list = True
+            continue
+        if in_list:
+            match = INTENTION_LINE_PATTERN.match(line.strip())
+            if match:
+                intentions.append((int(match.group(1)), match.group(2)))
+            continue
+
+        match = SECTION_HEADER_PATTERN.match(line)
+        if match:
+            sections.append((match.group(2).strip(), match.group(3).strip(), []))
+        elif sections:
+            if line.strip():
+                sections[-1][2].append(line.rstrip())
+        elif line.strip():
+            intro_lines.append(line.strip())
+
+    if not intentions:
+        raise ValueError(f"No '{LIST_HEADER}' section found in the prompt")
+    return {"intro": " ".join(intro_lines), "sections": sections, "intentions": intentions}
+
+
+def render_prompt(parsed, drop=(), short_names=False, list_first=False):
+    """
+    Render a prompt variant from a parsed prompt.
+
+    Args:
+        parsed (dict): Result of parse_prompt
+        drop (list): Keys of DROPPABLE_SECTIONS to leave out
+        short_names (bool): Whether to use SHORT_INTENTION_NAMES instead of the full names
+        list_first (bool): Whether to put the list of intentions before the guidelines
+
+    Returns:
+        str: The prompt
+    """
+    dropped_titles = {DROPPABLE_SECTIONS[key] for key in drop}
+    section_blocks = []
+    for title, first_line, body in parsed["sections"]:
+        if title in dropped_titles:
+            continue
+        if list_first:
+            first_line = first_line.replace("provided below", "provided above")
+        header = f"{len(section_blocks) + 1}. {title}:" + (f" {first_line}" if first_line else "")
+        section_blocks.append("\n".join([header] + body))
+
+    intention_lines = [
+        f"{number}. {SHORT_INTENTION_NAMES.get(number, name) if short_names else name}"
+        for number, name in parsed["intentions"]
+    ]
+    list_block = "\n".join([LIST_HEADER] + intention_lines)
+
+    blocks = [parsed["intro"]]
+    blocks += [list_block] + section_blocks if list_first else section_blocks + [list_block]
+    return "\n\n".join(blocks)
+
+
+def variant_name(drop=(), short_names=False, list_first=False):
+    """Name of a variant, e.g. "drop-special-ambiguity.names-short.list-first" """
+    dropped = "-".join(drop) if drop else "none"
+    return f"drop-{dropped}.names-{'short' if short_names else 'full'}.list-{'first' if list_first else 'last'}"
+
+
+def generate_variants(prompt, exhaustive=False):
+    """
+    Generate shortened variants of a prompt by dropping guideline sections, abbreviating the
+    intention names and reordering the sections.
+
+    Args:
+        prompt (str): System prompt in the layout of openai_eval.SYSTEM_PROMPT
+        exhaustive (bool): Whether to drop every subset of the sections instead of the DROP_LEVELS
+
+    Returns:
+        dict: Variant name -> prompt, starting with the original prompt
+    """
+    parsed = parse_prompt(prompt)
+    if exhaustive:
+        keys = list(DROPPABLE_SECTIONS)
+        drop_options = [list(combination) for size in range(len(keys) + 1)
+                        for combination in itertools.combinations(keys, size)]
+    else:
+        drop_options = DROP_LEVELS
+
+    variants = {ORIGINAL_VARIANT: prompt}
+    for drop, short_names, list_first in itertools.product(drop_options, [False, True], [False, True]):
+        variants[variant_name(drop, short_names, list_first)] = render_prompt(parsed, drop, short_names, list_first)
+    return variants
+
+
+def pareto_frontier(results):
+    """
+    Get the results no other result beats on prompt tokens, latency and accuracy at once.
+
+    Args:
+        results (list): Dicts with mean_prompt_tokens, latency (dict with p50) and accuracy
+
+    Returns:
+        list: The non-dominated results, fewest prompt tokens first
+    """
+    def objectives(result):
+        return (result["mean_prompt_tokens"], result["latency"]["p50"], -result["accuracy"])
+
+    candidates = [result for result in results
+                  if result["mean_prompt_tokens"] is not None and result["latency"]["p50"] is not None]
+    frontier = []
+    for result in candidates:
+        own = objectives(result)
+        dominated = any(
+            all(o <= s for o, s in zip(objectives(other), own)) and objectives(other) != own
+            for other in candidates
+        )
+        if not dominated:
+            frontier.append(result)
+    return sorted(frontier, key=lambda result: result["mean_prompt_tokens"])
+
+
+def load_prompt_variants(variants_file=PROMPT_VARIANTS_FILE):
+    """Load the stored variants (name -> entry with the prompt and its evaluation)"""
+    if not os.path.exists(variants_file):
+        return {}
+    with open(variants_file, "r") as f:
+        return json.load(f)
+
+
+def save_prompt_variant(name, prompt, evaluation=None, variants_file=PROMPT_VARIANTS_FILE):
+    """
+    Store a prompt variant under a name.
+
+    Args:
+        name (str): Name to select the variant by
+        prompt (str): The prompt
+        evaluation (dict): Accuracy, token and latency results of the variant, if evaluated
+        variants_file (str): File of the stored variants
+    """
+    variants = load_prompt_variants(variants_file)
+    variants[name] = {
+        "prompt": prompt,
+        "evaluation": evaluation,
+        "saved_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    with open(variants_file, "w") as f:
+        json.dump(variants, f, indent=2)
+
+
+def select_prompt(name, default_prompt, variants_file=PROMPT_VARIANTS_FILE):
+    """
+    Get the prompt of a stored variant.
+
+    Args:
+        name (str): Name of the variant, or None/"original" for the default prompt
+        default_prompt (str): The unchanged prompt
+        variants_file (str): File of the stored variants
+
+    Returns:
+        str: The prompt
+    """
+    if not name or name == ORIGINAL_VARIANT:
+        return default_prompt
+    variants = load_prompt_variants(variants_file)
+    if name not in variants:
+        raise ValueError(f"Unknown prompt variant {name!r}; stored variants: {', '.join(variants) or 'none'}")
+    return variants[name]["prompt"]
@@ -0,0 +1,378 @@
+import os
+import re
+import time
+import random
+import asyncio
+import threading
+import openai
+from prompt_cache import record_usage
+
+# Starting limits per model; they are replaced by the x-ratelimit-limit-* headers of the first response
+DEFAULT_REQUESTS_PER_MINUTE = int(os.environ.get("OPENAI_RPM", 500))
+DEFAULT_TOKENS_PER_MINUTE = int(os.environ.get("OPENAI_TPM", 200000))
+
+DEFAULT_MAX_RETRIES = 6
+BASE_RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 60.0
+
+# Status codes worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Durations in x-ratelimit-reset-* headers look like "1s", "6m0s" or "20ms"
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value):
+    """
+    Parse a rate limit reset duration.
+
+    Args:
+        value (str): Duration like "1s", "6m0s", "20ms" or a plain number of seconds
+
+    Returns:
+        float: The duration in seconds, or None if it cannot be parsed
+    """
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+
+def retry_after_seconds(headers):
+    """Get the delay requested by the retry-after-ms or retry-after header, in seconds"""
+    if headers is None:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms is not None:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    return parse_duration(headers.get("retry-after"))
+
+
+def estimate_tokens(request):
+    """
+    Estimate how many tokens a chat completion request counts against the tokens/min limit.
+
+    The API counts the prompt plus max_tokens, so the estimate is ~4 characters per prompt token
+    plus the requested max_tokens.
+
+    Args:
+        request (dict): Chat completion request
+
+    Returns:
+        int: Estimated number of tokens
+    """
+    prompt_chars = sum(len(str(message.get("content", ""))) for message in request.get("messages", []))
+    max_tokens = request.get("max_tokens") or request.get("max_completion_tokens") or 1000
+    return prompt_chars // 4 + max_tokens * request.get("n", 1)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at capacity per minute"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.available = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        elapsed = now - self.updated
+        self.available = min(self.capacity, self.available + elapsed * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until amount can be taken from the bucket (after refill)"""
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0
+        return (amount - self.available) * 60 / self.capacity
+
+
+class RateLimiter:
+    """
+    Client-side rate limiter tracking both requests/min and tokens/min of one model.
+
+    The buckets start from the configured limits and are corrected from the
+    x-ratelimit-* headers of every response. Throttled (429) and failed (5xx)
+    requests are retried with jittered exponential backoff, honouring retry-after.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 max_retries=DEFAULT_MAX_RETRIES):
+        """
+        Args:
+            requests_per_minute (int): Starting requests/min limit
+            tokens_per_minute (int): Starting tokens/min limit
+            max_retries (int): Maximum number of retries per request
+        """
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.blocked_until = 0
+        # Async requests waiting for the buckets
+        self.waiting = 0
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "errors": 0, "wait_seconds": 0.0}
+
+    def _reserve(self, tokens):
+        """Take one request and the tokens from the buckets if possible, else return the seconds to wait"""
+        with self.lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            wait = max(self.blocked_until - now, self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if wait <= 0:
+                self.requests.available -= 1
+                self.tokens.available -= min(tokens, self.tokens.capacity)
+                return 0
+            return wait
+
+    def acquire(self, tokens):
+        """Block until one request with the given number of tokens fits into the limits"""
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                return
+            self.stats["wait_seconds"] += wait
+            time.sleep(wait)
+
+    def try_acquire(self, tokens):
+        """
+        Take one request with the given number of tokens if it fits into the limits now, without waiting,
+        and no other request is waiting for the buckets (it would take their place in the queue)
+        """
+        return self.waiting == 0 and self._reserve(tokens) <= 0
+
+    async def acquire_async(self, tokens):
+        """Wait (without blocking the event loop) until one request with the given tokens fits into the limits"""
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                return
+            self.stats["wait_seconds"] += wait
+            self.waiting += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self.waiting -= 1
+
+    def update_from_headers(self, headers):
+        """
+        Correct the buckets from the x-ratelimit-* response headers.
+
+        Args:
+            headers: Response headers (httpx.Headers or dict with lower-case names)
+        """
+        if headers is None:
+            return
+        with self.lock:
+            now = time.monotonic()
+            for name, bucket in [("requests", self.requests), ("tokens", self.tokens)]:
+                limit = headers.get(f"x-ratelimit-limit-{name}")
+                remaining = headers.get(f"x-ratelimit-remaining-{name}")
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{name}"))
+
+                if limit is not None and limit.isdigit() and int(limit) > 0:
+                    bucket.capacity = int(limit)
+                if remaining is not None and remaining.isdigit():
+                    bucket.refill(now)
+                    bucket.available = min(bucket.available, int(remaining))
+                    if int(remaining) == 0 and reset:
+                        self.blocked_until = max(self.blocked_until, now + reset)
+
+    def retry_delay(self, attempt, headers=None):
+        """
+        Get the delay before the next retry: retry-after if the server sent one,
+        else exponential backoff with full jitter.
+        """
+        retry_after = retry_after_seconds(headers)
+        if retry_after is not None:
+            return min(retry_after, MAX_RETRY_DELAY)
+        return random.uniform(0, min(MAX_RETRY_DELAY, BASE_RETRY_DELAY * 2 ** attempt))
+
+    def _handle_error(self, error, attempt, max_retries=None):
+        """Record a failed attempt and return the delay before retrying, or None if it should not be retried"""
+        headers = None
+        if isinstance(error, openai.APIStatusError):
+            headers = error.response.headers
+            self.update_from_headers(headers)
+            if error.status_code not in RETRYABLE_STATUS_CODES:
+                self.stats["errors"] += 1
+                return None
+            if error.status_code == 429:
+                self.stats["throttled"] += 1
+        elif not isinstance(error, openai.APIConnectionError):
+            self.stats["errors"] += 1
+            return None
+
+        if attempt >= (self.max_retries if max_retries is None else max_retries):
+            self.stats["errors"] += 1
+            return None
+
+        delay = self.retry_delay(attempt, headers)
+        if isinstance(error, openai.RateLimitError):
+            # Hold back every caller of this model, not just the one that was throttled
+            with self.lock:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        self.stats["retries"] += 1
+        return delay
+
+    def call(self, create, request, max_retries=None):
+        """
+        Send a request through the limiter, retrying throttled and failed attempts.
+
+        Args:
+            create (callable): A with_raw_response create method, e.g. client.chat.completions.with_raw_response.create
+            request (dict): Keyword arguments for create
+            max_retries (int): Retries of this request, instead of the limiter's max_retries
+
+        Returns:
+            The parsed response
+        """
+        tokens = estimate_tokens(request)
+        attempt = 0
+        while True:
+            self.acquire(tokens)
+            self.stats["requests"] += 1
+            try:
+                raw_response = create(**request)
+            except Exception as e:
+                delay = self._handle_error(e, attempt, max_retries)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            self.update_from_headers(raw_response.headers)
+            return raw_response.parse()
+
+    async def call_async(self, create, request, max_retries=None, hedge_policy=None, is_valid=None, on_admit=None):
+        """
+        Send a request through the limiter from async code, retrying throttled and failed attempts.
+
+        Args:
+            create (callable): An async with_raw_response create method,
+                e.g. async_client.chat.completions.with_raw_response.create
+            request (dict): Keyword arguments for create
+            max_retries (int): Retries of this request, instead of the limiter's max_retries
+            hedge_policy (HedgePolicy): Hedges every attempt once the limiter has admitted it, so the hedge
+                delay is not spent waiting for the limiter; None to never hedge
+            is_valid (callable): Whether a parsed response answers the request, see HedgePolicy.call
+            on_admit (callable): Called without arguments when the limiter first admits the request, e.g. to
+                measure the latency without the wait for the limiter
+
+        Returns:
+            The parsed response
+        """
+        tokens = estimate_tokens(request)
+        attempt = 0
+
+        async def send():
+            self.stats["requests"] += 1
+            raw_response = await create(**request)
+            self.update_from_headers(raw_response.headers)
+            return raw_response.parse()
+
+        while True:
+            await self.acquire_async(tokens)
+            if on_admit is not None and attempt == 0:
+                on_admit()
+            try:
+                if hedge_policy is None:
+                    return await send()
+                # A duplicate only helps if the limits have room for it now; queueing it behind
+                # the limiter would not beat the slow attempt
+                return await hedge_policy.call(send, is_valid, lambda: self.try_acquire(tokens))
+            except Exception as e:
+                delay = self._handle_error(e, attempt, max_retries)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+
+# One limiter per model, since the API limits are per model
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def rate_limiter_for(model):
+    """Get the shared rate limiter of a model"""
+    with _rate_limiters_lock:
+        if model not in _rate_limiters:
+            _rate_limiters[model] = RateLimiter()
+        return _rate_limiters[model]
+
+
+def reset_rate_limiters():
+    """Forget the limiters of all models, so the next requests start from full buckets, e.g. between compared runs"""
+    with _rate_limiters_lock:
+        _rate_limiters.clear()
+
+
+def create_chat_completion(client, request, max_retries=None):
+    """
+    Create a chat completion through the rate limiter of the request's model.
+
+    The client's own retries are disabled, so retrying is left to the limiter.
+    The cached prompt tokens of the response are recorded for the prompt cache report.
+
+    Args:
+        client (openai.OpenAI): OpenAI client
+        request (dict): Keyword arguments for client.chat.completions.create
+        max_retries (int): Retries of this request (default: the limiter's DEFAULT_MAX_RETRIES)
+
+    Returns:
+        ChatCompletion: The response
+    """
+    create = client.with_options(max_retries=0).chat.completions.with_raw_response.create
+    start_time = time.perf_counter()
+    response = rate_limiter_for(request["model"]).call(create, request, max_retries)
+    record_usage(request["model"], getattr(response, "usage", None), time.perf_counter() - start_time)
+    return response
+
+
+async def create_chat_completion_async(async_client, request, max_retries=None, hedge_policy=None, is_valid=None,
+                                       on_admit=None):
+    """
+    Create a chat completion with the async client through the rate limiter of the request's model.
+
+    Args:
+        async_client (openai.AsyncOpenAI): Async OpenAI client
+        request (dict): Keyword arguments for async_client.chat.completions.create
+        max_retries (int): Retries of this request (default: the limiter's DEFAULT_MAX_RETRIES)
+        hedge_policy (HedgePolicy): Hedges the upstream call after the limiter admitted it (default: no hedging)
+        is_valid (callable): Whether a response answers the request, e.g. has a valid label
+        on_admit (callable): Called when the rate limiter first admits the request
+
+    Returns:
+        ChatCompletion: The response
+    """
+    create = async_client.with_options(max_retries=0).chat.completions.with_raw_response.create
+    start_time = time.perf_counter()
+    response = await rate_limiter_for(request["model"]).call_async(create, request, max_retries, hedge_policy,
+                                                                   is_valid, on_admit)
+    record_usage(request["model"], getattr(response, "usage", None), time.perf_counter() - start_time)
+    return response
+
+
+def print_rate_limit_stats():
+    """Print the request, retry and throttling counters of every model's rate limiter"""
+    with _rate_limiters_lock:
+        limiters = list(_rate_limiters.items())
+    for model, limiter in limiters:
+        stats = limiter.stats
+        print(f"Rate limiter {model}: {stats['requests']} requests, {stats['retries']} retries, "
+              f"{stats['throttled']} throttled, {stats['errors']} errors, "
+              f"waited {stats['wait_seconds']:.1f}s (limits {limiter.requests.capacity} RPM, "
+              f"{limiter.tokens.capacity} TPM)")
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# Default location of the on-disk cache
+CACHE_FILE = "response_cache.sqlite3"
+
+# Default maximum size of the cached values before the least recently used entries are evicted
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache of chat completion responses.
+
+    Entries are keyed by a hash of the full request (model, messages and sampling params),
+    so re-running an unchanged eval is served from disk instead of the API.
+    When the total size of the stored values exceeds max_bytes, the least recently
+    used entries are evicted.
+    """
+
+    def __init__(self, path=CACHE_FILE, max_bytes=DEFAULT_MAX_BYTES, bypass=False):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            path (str): Path of the SQLite database file
+            max_bytes (int): Maximum total size of the cached values in bytes
+            bypass (bool): If True, the cache is neither read nor written
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   key TEXT PRIMARY KEY,
+                   value TEXT NOT NULL,
+                   size INTEGER NOT NULL,
+                   created_at REAL NOT NULL,
+                   last_access REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(request):
+        """
+        Hash a request into a cache key.
+
+        Args:
+            request (dict): The full request, e.g. the keyword arguments of chat.completions.create
+
+        Returns:
+            str: Hex SHA-256 digest of the canonical JSON encoding of the request
+        """
+        canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, request):
+        """
+        Look up the cached value for a request.
+
+        Args:
+            request (dict): The full request
+
+        Returns:
+            The cached value, or None on a miss (or when the cache is bypassed)
+        """
+        if self.bypass:
+            return None
+
+        key = self.make_key(request)
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, request, value):
+        """
+        Store the value for a request and evict old entries if the cache is over its size limit.
+
+        Args:
+            request (dict): The full request
+            value: JSON-serializable value to store (e.g. the response text)
+        """
+        if self.bypass:
+            return
+
+        key = self.make_key(request)
+        encoded = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, len(encoded.encode("utf-8")), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Delete least recently used entries until the total size fits into max_bytes"""
+        total_size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if total_size <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total_size -= size
+
+    def clear(self):
+        """Delete all entries and reset the counters"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Get the cache statistics.
+
+        Returns:
+            dict: Hit/miss counters, hit rate, number of entries and total size in bytes
+        """
+        with self._lock:
+            entries, size_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0,
+            "entries": entries,
+            "size_bytes": size_bytes
+        }
+
+    def print_stats(self):
+        """Print the cache statistics"""
+        if self.bypass:
+            print("Response cache: bypassed")
+            return
+        stats = self.stats()
+        print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"(hit rate {stats['hit_rate']:.2%}), {stats['entries']} entries, "
+              f"{stats['size_bytes'] / 1024:.1f} KB in {os.path.abspath(self.path)}")
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,78 @@
+from collections import Counter
+from intent_extractor import extract_intention
+from rate_limiter import create_chat_completion
+
+
+def majority_vote(responses):
+    """
+    Get the majority label of several sampled responses.
+
+    Args:
+        responses (list): Response texts of the samples
+
+    Returns:
+        dict: label (None if no sample had a valid label), vote_share (votes of the label / samples)
+            and votes (label -> count). Ties go to the label that was sampled first.
+    """
+    labels = [extract_intention(response) for response in responses]
+    votes = Counter(label for label in labels if label is not None)
+    if not votes:
+        return {"label": None, "vote_share": 0.0, "votes": {}}
+
+    top = max(votes.values())
+    label = next(label for label in labels if votes.get(label) == top)
+    return {"label": label, "vote_share": top / len(responses), "votes": dict(votes.most_common())}
+
+
+def sample_texts(response):
+    """Get the text of every choice of a chat completion"""
+    return [choice.message.content or "" for choice in response.choices]
+
+
+def vote_classification(client, request, samples=5):
+    """
+    Classify a message by majority vote over samples drawn with the n parameter in one request.
+
+    The prompt is sent and billed once; only the output tokens grow with the number of samples.
+
+    Args:
+        client (openai.OpenAI): OpenAI client
+        request (dict): Chat completion request, sampled with a temperature above 0
+        samples (int): Number of samples (n)
+
+    Returns:
+        dict: label, vote_share, votes, responses (text of every sample), prompt_tokens and completion_tokens
+    """
+    response = create_chat_completion(client, dict(request, n=samples))
+    responses = sample_texts(response)
+    usage = response.usage
+    return dict(majority_vote(responses), responses=responses,
+                prompt_tokens=usage.prompt_tokens if usage else 0,
+                completion_tokens=usage.completion_tokens if usage else 0)
+
+
+def vote_with_separate_requests(client, request, samples=5):
+    """
+    Classify a message by majority vote over samples drawn with one request each.
+
+    Every request sends and bills the prompt again. Used as the baseline of vote_classification.
+
+    Args:
+        client (openai.OpenAI): OpenAI client
+        request (dict): Chat completion request, sampled with a temperature above 0 and without a seed
+        samples (int): Number of requests
+
+    Returns:
+        dict: label, vote_share, votes, responses, prompt_tokens and completion_tokens (summed over the requests)
+    """
+    responses = []
+    prompt_tokens = 0
+    completion_tokens = 0
+    for _ in range(samples):
+        response = create_chat_completion(client, request)
+        responses.append(response.choices[0].message.content or "")
+        if response.usage:
+            prompt_tokens += response.usage.prompt_tokens
+            completion_tokens += response.usage.completion_tokens
+    return dict(majority_vote(responses), responses=responses,
+                prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
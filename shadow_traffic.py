@@ -0,0 +1,157 @@
+import time
+import random
+import asyncio
+from collections import deque
+from intent_extractor import extract_intention
+from latency_stats import summarize_latencies, format_seconds
+from rate_limiter import create_chat_completion_async
+
+# Shadow traffic: a sampled share of the live classifications is copied to a candidate model (e.g. a new
+# fine-tune) in the background, to compare its labels and latency with the serving model on real traffic
+# before promoting it. Guests never wait for the candidate: offer() only puts the message on a bounded
+# queue and returns, a few workers with their own connections call the candidate, and when the queue
+# is full the sample is dropped instead of building up a backlog.
+
+DEFAULT_SAMPLE_RATE = 0.1
+DEFAULT_SHADOW_CONCURRENCY = 4
+DEFAULT_QUEUE_SIZE = 100
+
+# Shadow calls are not worth a long retry schedule; a failed one is counted and dropped
+SHADOW_MAX_RETRIES = 1
+
+# Latencies kept for the distributions, and most recent disagreements kept for inspection
+LATENCY_WINDOW = 1000
+DISAGREEMENT_WINDOW = 20
+
+
+class ShadowMirror:
+    """
+    Mirrors a sampled share of classifications to a candidate model and records label agreement and
+    the latency of both models side by side.
+
+    Call start() from the running event loop before offering samples and stop() when done.
+    """
+
+    def __init__(self, client, candidate, build_request, sample_rate=DEFAULT_SAMPLE_RATE,
+                 concurrency=DEFAULT_SHADOW_CONCURRENCY, queue_size=DEFAULT_QUEUE_SIZE, seed=None):
+        """
+        Args:
+            client (openai.AsyncOpenAI): Async client of the shadow calls; give it its own connection pool,
+                so shadow calls never hold a connection the live traffic needs
+            candidate (str): The candidate model
+            build_request (callable): build_request(message, model) returns the chat completion request
+            sample_rate (float): Share of the offered classifications mirrored to the candidate
+            concurrency (int): Most shadow calls in flight at the same time
+            queue_size (int): Most samples waiting for a worker; further samples are dropped
+            seed (int): Seed of the sampling, None for a random seed
+        """
+        self.client = client
+        self.candidate = candidate
+        self.build_request = build_request
+        self.sample_rate = sample_rate
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.random = random.Random(seed)
+        self.queue = None
+        self.workers = []
+
+        self.primary_latencies = deque(maxlen=LATENCY_WINDOW)
+        self.candidate_latencies = deque(maxlen=LATENCY_WINDOW)
+        self.disagreements = deque(maxlen=DISAGREEMENT_WINDOW)
+        self.stats = {"offered": 0, "sampled": 0, "dropped": 0, "mirrored": 0, "errors": 0, "agreed": 0,
+                      "disagreed": 0, "candidate_invalid": 0}
+
+    def start(self):
+        """Create the queue and the workers in the running event loop"""
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.workers = [asyncio.ensure_future(self._work()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        """Cancel the workers; samples still queued are not sent"""
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        await self.client.close()
+
+    def offer(self, message, primary_label, primary_latency):
+        """
+        Offer a served classification for mirroring; returns at once.
+
+        Args:
+            message (str): The guest message
+            primary_label (str): Label the serving model answered
+            primary_latency (float): Seconds the guest waited for it
+        """
+        self.stats["offered"] += 1
+        if self.queue is None or self.random.random() >= self.sample_rate:
+            return
+        self.stats["sampled"] += 1
+        try:
+            self.queue.put_nowait((message, primary_label, primary_latency))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+
+    async def _work(self):
+        while True:
+            message, primary_label, primary_latency = await self.queue.get()
+            try:
+                await self._mirror(message, primary_label, primary_latency)
+            finally:
+                self.queue.task_done()
+
+    async def _mirror(self, message, primary_label, primary_latency):
+        """Classify one sample with the candidate and record the pair"""
+        request = self.build_request(message, self.candidate)
+        start_time = time.perf_counter()
+        try:
+            response = await create_chat_completion_async(self.client, request, SHADOW_MAX_RETRIES)
+        except Exception:
+            self.stats["errors"] += 1
+            return
+        latency = time.perf_counter() - start_time
+        label = extract_intention(response.choices[0].message.content)
+
+        self.stats["mirrored"] += 1
+        self.primary_latencies.append(primary_latency)
+        self.candidate_latencies.append(latency)
+        if label is None:
+            self.stats["candidate_invalid"] += 1
+        if label == primary_label:
+            self.stats["agreed"] += 1
+        else:
+            self.stats["disagreed"] += 1
+            self.disagreements.append({"message": message, "primary": primary_label, "candidate": label})
+
+    def summary(self):
+        """
+        Summarize the shadow traffic.
+
+        Returns:
+            dict: counters, agreement (share of mirrored samples with the same label), queue length,
+                latency summaries (seconds) of the serving model and the candidate over the mirrored
+                samples, and the most recent disagreements
+        """
+        mirrored = self.stats["mirrored"]
+        return dict(
+            self.stats,
+            candidate=self.candidate,
+            sample_rate=self.sample_rate,
+            agreement=self.stats["agreed"] / mirrored if mirrored else None,
+            drop_rate=self.stats["dropped"] / self.stats["sampled"] if self.stats["sampled"] else 0,
+            queued=self.queue.qsize() if self.queue is not None else 0,
+            primary_latency=summarize_latencies(list(self.primary_latencies)),
+            candidate_latency=summarize_latencies(list(self.candidate_latencies)),
+            disagreements=list(self.disagreements)
+        )
+
+
+def format_shadow_summary(summary):
+    """Format the agreement, dropped samples and side-by-side latency of a shadow candidate for reports"""
+    agreement = f"{summary['agreement']:.1%}" if summary["agreement"] is not None else "n/a"
+    primary = summary["primary_latency"]
+    candidate = summary["candidate_latency"]
+    return (f"Shadow {summary['candidate']}: {summary['mirrored']} of {summary['offered']} classifications mirrored, "
+            f"agreement {agreement}, {summary['dropped']} dropped, {summary['errors']} failed; "
+            f"p50/p99 serving {format_seconds(primary['p50'])}/{format_seconds(primary['p99'])}, "
+            f"candidate {format_seconds(candidate['p50'])}/{format_seconds(candidate['p99'])}")
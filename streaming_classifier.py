@@ -0,0 +1,111 @@
+import time
+from intent_extractor import extract_intention, extract_leading_intention
+from rate_limiter import create_chat_completion, create_chat_completion_async
+
+
+class StreamState:
+    """Text, label and timings of one streamed classification"""
+
+    def __init__(self, early_stop):
+        self.early_stop = early_stop
+        self.start_time = time.perf_counter()
+        self.parts = []
+        self.label = None
+        self.ttfb = None
+        self.time_to_label = None
+
+    def feed(self, chunk):
+        """
+        Add a stream chunk and try to extract the label from the text received so far.
+
+        Returns:
+            bool: True when the label is known and the stream can be closed
+        """
+        now = time.perf_counter()
+        if self.ttfb is None:
+            self.ttfb = now - self.start_time
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            return False
+
+        self.parts.append(chunk.choices[0].delta.content)
+        if self.label is None:
+            self.label = extract_leading_intention("".join(self.parts))
+            if self.label is not None:
+                self.time_to_label = now - self.start_time
+        return self.early_stop and self.label is not None
+
+    def result(self, stopped_early):
+        """
+        Finish the classification.
+
+        Returns:
+            dict: response (text received), label, ttfb, time_to_label, total_time (seconds) and stopped_early
+        """
+        now = time.perf_counter()
+        response = "".join(self.parts)
+        if self.label is None:
+            # No label at the start of the response: fall back to the full extractor
+            self.label = extract_intention(response)
+            self.time_to_label = now - self.start_time
+        return {
+            "response": response,
+            "label": self.label,
+            "ttfb": self.ttfb,
+            "time_to_label": self.time_to_label,
+            "total_time": now - self.start_time,
+            "stopped_early": stopped_early
+        }
+
+
+def stream_request(request):
+    """Get the streaming variant of a chat completion request"""
+    return dict(request, stream=True)
+
+
+def stream_classification(client, request, early_stop=True):
+    """
+    Classify a message with a streamed chat completion, returning as soon as the label is known.
+
+    The stream is parsed incrementally and closed once a valid 1..40 label can be extracted,
+    so the rest of the answer (e.g. an explanation after "INTENTION: #16 - ...") is never waited for.
+
+    Args:
+        client (openai.OpenAI): OpenAI client
+        request (dict): Chat completion request (stream is set by this function)
+        early_stop (bool): Whether to close the stream once the label is known
+
+    Returns:
+        dict: response, label, ttfb, time_to_label, total_time and stopped_early
+    """
+    state = StreamState(early_stop)
+    stream = create_chat_completion(client, stream_request(request))
+    try:
+        for chunk in stream:
+            if state.feed(chunk):
+                return state.result(stopped_early=True)
+    finally:
+        stream.close()
+    return state.result(stopped_early=False)
+
+
+async def stream_classification_async(async_client, request, early_stop=True):
+    """
+    Classify a message with a streamed chat completion from async code, returning as soon as the label is known.
+
+    Args:
+        async_client (openai.AsyncOpenAI): Async OpenAI client
+        request (dict): Chat completion request (stream is set by this function)
+        early_stop (bool): Whether to close the stream once the label is known
+
+    Returns:
+        dict: response, label, ttfb, time_to_label, total_time and stopped_early
+    """
+    state = StreamState(early_stop)
+    stream = await create_chat_completion_async(async_client, stream_request(request))
+    try:
+        async for chunk in stream:
+            if state.feed(chunk):
+                return state.result(stopped_early=True)
+    finally:
+        await stream.close()
+    return state.result(stopped_early=False)
@@ -1,7 +1,28 @@
 import os
+import time
+import argparse
+import asyncio
 import openai
 import json
 from datetime import datetime
+from response_cache import ResponseCache
+from batch_api import run_batch
+from intent_extractor import extract_intention
+from classification_modes import CLASSIFICATION_MODES, classification_params
+from intent_distribution import LOGPROB_PARAMS, intent_distribution, format_distribution
+from rate_limiter import create_chat_completion, create_chat_completion_async, rate_limiter_for, print_rate_limit_stats
+from aimd_controller import AIMDController
+from streaming_classifier import stream_classification, stream_classification_async
+from latency_stats import summarize_latencies, format_seconds
+from create_jsonl import PROMPT_STYLES, MINIMAL_PROMPT
+from prompt_cache import get_prompt_prefix, prompt_cache_summaries, format_prompt_cache_summary, print_prompt_cache_stats
+from prompt_variants import select_prompt
+from message_packing import classify_packed, format_packing_summary
+from lexical_classifier import DEFAULT_MODEL_FILE, DEFAULT_TRAINING_FILES, LexicalClassifier
+from fewshot_index import FewShotIndex, with_examples
+from hedging import DEFAULT_MAX_EXTRA_RATE, HedgePolicy, format_hedging_summary, has_label
+from circuit_breaker import (BREAKER_CALL_TIMEOUT, BREAKER_MAX_RETRIES, DEFAULT_OPEN_SECONDS, DEFAULT_SLOW_CALL,
+                             CircuitBreaker, format_breaker_summary)
 # from messages_mappings200 import vague_messages, correct_mappings, intention_names
 # from messages_mappings200_2 import vague_messages, correct_mappings, intention_names
 from messages_mappings100 import vague_messages, correct_mappings, intention_names
@@ -10,7 +31,33 @@ openai_api_key = os.environ.get("OPENAI_API_KEY")
 if not openai_api_key:
     raise ValueError("OPENAI_API_KEY environment variable is not set")
 
-client = openai.OpenAI(api_key=openai_api_key)
+client = openai.OpenAI(api_key=openai_api_key, base_url=os.environ.get("OPENAI_BASE_URL"))
+async_client = openai.AsyncOpenAI(api_key=openai_api_key, base_url=os.environ.get("OPENAI_BASE_URL"))
+
+# On-disk cache of chat completion responses, keyed by the full request
+response_cache = ResponseCache()
+
+class SendOptions:
+    """Optional features of the send functions, set up from the command line; none of them is on by default"""
+
+    def __init__(self, few_shot_index=None, few_shot_k=0, hedge_policy=None, circuit_breaker=None,
+                 fallback_model=None, fallback_classifier=None):
+        """
+        Args:
+            few_shot_index (FewShotIndex): Retrieval index of the few-shot examples added to every request (--few-shot)
+            few_shot_k (int): Number of similar labelled examples added as few-shot turns
+            hedge_policy (HedgePolicy): Duplicates slow async requests after a percentile of recent latency (--hedge)
+            circuit_breaker (CircuitBreaker): Circuit breaker of the tested model (--circuit-breaker)
+            fallback_model (str): Model answering while the breaker is open
+            fallback_classifier (LexicalClassifier): Local classifier answering while the breaker is open,
+                if there is no fallback model
+        """
+        self.few_shot_index = few_shot_index
+        self.few_shot_k = few_shot_k
+        self.hedge_policy = hedge_policy
+        self.circuit_breaker = circuit_breaker
+        self.fallback_model = fallback_model
+        self.fallback_classifier = fallback_classifier
 
 # System prompt for the hospitality chatbot
 system_prompt = """You are an advanced hospitality chatbot for a premium hotel chain. Your primary function is to analyze user messages and accurately identify their main intention from a predefined list of 40 possible intentions. Follow these guidelines:
@@ -85,83 +132,506 @@ LIST OF INTENTIONS:
 39. Request human support or live agent  
 40. Ask for help using the chatbot"""
 
-def send_prompt_to_gpt(prompt, system_message=system_prompt, model="gpt-4o-mini"):
+def build_request(prompt, system_message=system_prompt, model="gpt-4o-mini", mode="free", logprobs=False,
+                  pad_prefix=False, options=None):
+    """
+    Build the chat completion request for a prompt.
+
+    The same request is used by the sync, async and batch modes, so all of them share the response cache.
+    The system message is a byte-identical prefix of every request, so the API can serve it from its prompt cache.
+
+    Args:
+        prompt (str): The prompt to send to the model
+        system_message (str): The system message to use, or None to send only the prompt
+            (for models fine-tuned without instructions)
+        model (str): The model to use (default: gpt-4o-mini)
+        mode (str): Classification mode limiting the output, see classification_modes (default: free)
+        logprobs (bool): Whether to request the top log probabilities of the output tokens
+        pad_prefix (bool): Whether to pad the system message to the prompt cache threshold
+        options (SendOptions): Optional features; its few-shot examples are added to the messages
+
+    Returns:
+        dict: Keyword arguments for client.chat.completions.create
+    """
+    if system_message is None:
+        messages = [{"role": "user", "content": prompt}]
+    else:
+        messages = get_prompt_prefix(system_message, pad=pad_prefix, model=model).messages(prompt)
+    if options is not None and options.few_shot_index is not None:
+        messages = with_examples(messages, options.few_shot_index, options.few_shot_k, mode)
+    request = {
+        "model": model,
+        "messages": messages,
+        # "temperature": 0.7,
+        # "top_p": 1.0,
+        # "frequency_penalty": 0.0,
+        # "presence_penalty": 0.0
+    }
+    request.update(classification_params(mode, model))
+    if logprobs:
+        request.update(LOGPROB_PARAMS)
+    return request
+
+def response_value(body, logprobs=False):
+    """
+    Turn a chat completion response body into the value returned by the send functions and cached.
+
+    Args:
+        body (dict): Chat completion response body
+        logprobs (bool): Whether the request asked for log probabilities
+
+    Returns:
+        str or dict: The response text, or with logprobs a dict with the response text
+            and the intent distribution of the label token
+    """
+    choice = body["choices"][0]
+    content = choice["message"]["content"]
+    if not logprobs:
+        return content
+
+    choice_logprobs = choice.get("logprobs") or {}
+    return {"response": content, "distribution": intent_distribution(choice_logprobs.get("content"))}
+
+def stream_value(result):
+    """
+    Turn a streamed classification into the value returned by the send functions.
+
+    Returns:
+        dict: The response text received, no distribution, and the stream timings
+    """
+    timing = {key: result[key] for key in ["ttfb", "time_to_label", "total_time", "stopped_early"]}
+    return {"response": result["response"], "distribution": None, "stream": timing}
+
+def split_response(value):
+    """
+    Split a value returned by the send functions into the response text and the intent distribution.
+
+    Returns:
+        tuple: (response text, distribution dict or None)
+    """
+    if isinstance(value, dict):
+        return value["response"], value["distribution"]
+    return value, None
+
+def fallback_value(label_or_response, source):
+    """
+    Turn an answer of the fallback into the value returned by the send functions.
+
+    Returns:
+        dict: The response text, no distribution (unless the fallback model returned one) and the fallback used
+    """
+    if isinstance(label_or_response, dict):
+        return dict(label_or_response, fallback=source)
+    return {"response": label_or_response, "distribution": None, "fallback": source}
+
+def send_to_fallback(prompt, system_message, mode, logprobs, pad_prefix, options):
+    """Answer a prompt with the fallback model or the local classifier of the options while the breaker is open"""
+    if options.fallback_model is not None:
+        request = build_request(prompt, system_message, options.fallback_model, mode, logprobs, pad_prefix, options)
+        response = create_chat_completion(client, request)
+        return fallback_value(response_value(response.model_dump(), logprobs), options.fallback_model)
+    if options.fallback_classifier is not None:
+        return fallback_value(options.fallback_classifier.predict(prompt)[0], "local")
+    return "Error: circuit breaker open and no fallback available"
+
+async def send_to_fallback_async(prompt, system_message, mode, logprobs, pad_prefix, options):
+    """Answer a prompt with the fallback model or the local classifier using the async client"""
+    if options.fallback_model is not None:
+        request = build_request(prompt, system_message, options.fallback_model, mode, logprobs, pad_prefix, options)
+        response = await create_chat_completion_async(async_client, request)
+        return fallback_value(response_value(response.model_dump(), logprobs), options.fallback_model)
+    return send_to_fallback(prompt, system_message, mode, logprobs, pad_prefix, options)
+
+def send_prompt_to_gpt(prompt, system_message=system_prompt, model="gpt-4o-mini", mode="free", logprobs=False,
+                       stream=False, pad_prefix=False, options=None):
     """
     Send a prompt to the GPT model and return the response.
 
     Args:
         prompt (str): The prompt to send to the model
-        system_message (str): The system message to use
+        system_message (str): The system message to use, or None to send only the prompt
         model (str): The model to use (default: gpt-3.5-turbo)
+        mode (str): Classification mode limiting the output (default: free)
+        logprobs (bool): Whether to also return the intent distribution from the token log probabilities
+        stream (bool): Whether to stream the response and stop reading once the label is known
+        pad_prefix (bool): Whether to pad the system message to the prompt cache threshold
+        options (SendOptions): Few-shot examples, circuit breaker and fallback (default: none)
 
     Returns:
-        str: The model's response
+        str: The model's response (a dict with the response and its distribution if logprobs is True,
+            with the stream timings if stream is True, and with the fallback that answered instead
+            while the circuit breaker is open)
     """
+    options = options or SendOptions()
+    request = build_request(prompt, system_message, model, mode, logprobs, pad_prefix, options)
+
+    # Streamed responses are cut off after the label and measure latency, so they bypass the cache
+    if stream:
+        try:
+            return stream_value(stream_classification(client, request))
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+    # Reuse the response of an identical earlier request
+    cached_response = response_cache.get(request)
+    if cached_response is not None:
+        return cached_response
+
     try:
+        if options.circuit_breaker is not None:
+            # Behind the breaker a failing model is given up on quickly; its messages go to the fallback
+            value = options.circuit_breaker.call(
+                lambda: response_value(create_chat_completion(client.with_options(timeout=BREAKER_CALL_TIMEOUT),
+                                                              request, BREAKER_MAX_RETRIES).model_dump(), logprobs),
+                lambda: send_to_fallback(prompt, system_message, mode, logprobs, pad_prefix, options))
+            if not (isinstance(value, dict) and value.get("fallback")):
+                response_cache.put(request, value)
+            return value
+
         # Create a chat completion request using the new API
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt}
-            ],
-            # temperature=0.7,
-            max_tokens=1000,
-            # top_p=1.0,
-            # frequency_penalty=0.0,
-            # presence_penalty=0.0
-        )
+        response = create_chat_completion(client, request)
 
         # Extract the response text
-        response_text = response.choices[0].message.content
+        response_text = response_value(response.model_dump(), logprobs)
+        response_cache.put(request, response_text)
         return response_text
 
     except Exception as e:
         return f"Error: {str(e)}"
 
-def extract_intention(response):
+async def send_prompt_to_gpt_async(prompt, semaphore, system_message=system_prompt, model="gpt-4o-mini", mode="free",
+                                   logprobs=False, stream=False, pad_prefix=False, options=None):
     """
-    Extract the intention number from the chatbot's response.
+    Send a prompt to the GPT model using the async client and return the response.
+
+    At most as many requests as the semaphore allows are in flight at the same time.
+
+    Args:
+        prompt (str): The prompt to send to the model
+        semaphore (asyncio.Semaphore): Semaphore limiting the number of in-flight requests
+        system_message (str): The system message to use, or None to send only the prompt
+        model (str): The model to use (default: gpt-4o-mini)
+        mode (str): Classification mode limiting the output (default: free)
+        logprobs (bool): Whether to also return the intent distribution from the token log probabilities
+        stream (bool): Whether to stream the response and stop reading once the label is known
+        pad_prefix (bool): Whether to pad the system message to the prompt cache threshold
+        options (SendOptions): Few-shot examples, hedge policy, circuit breaker and fallback (default: none)
+
+    Returns:
+        str: The model's response (a dict with the response and its distribution if logprobs is True,
+            with the stream timings if stream is True, and with the fallback that answered instead
+            while the circuit breaker is open)
+    """
+    options = options or SendOptions()
+    request = build_request(prompt, system_message, model, mode, logprobs, pad_prefix, options)
+
+    # Errors are turned into "Error: ..." responses outside the semaphore, so that an AIMDController
+    # used as the semaphore sees them and backs off
+    if stream:
+        try:
+            async with semaphore:
+                return stream_value(await stream_classification_async(async_client, request))
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+    # Cache hits do not take a slot from the semaphore
+    cached_response = response_cache.get(request)
+    if cached_response is not None:
+        return cached_response
+
+    try:
+        async with semaphore:
+            if options.circuit_breaker is not None:
+                breaker_client = async_client.with_options(timeout=BREAKER_CALL_TIMEOUT)
+
+                async def send():
+                    response = await create_chat_completion_async(breaker_client, request, BREAKER_MAX_RETRIES)
+                    return response_value(response.model_dump(), logprobs)
+
+                value = await options.circuit_breaker.call_async(
+                    send, lambda: send_to_fallback_async(prompt, system_message, mode, logprobs, pad_prefix, options))
+                if not (isinstance(value, dict) and value.get("fallback")):
+                    response_cache.put(request, value)
+                return value
+
+            # Only the upstream call is hedged, after the rate limiter admitted the request;
+            # the duplicate shares the semaphore slot of the slow request
+            response = await create_chat_completion_async(async_client, request, hedge_policy=options.hedge_policy,
+                                                          is_valid=has_label)
+
+        response_text = response_value(response.model_dump(), logprobs)
+        response_cache.put(request, response_text)
+        return response_text
+
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+async def send_prompts_async(prompts, concurrency=10, model="gpt-4o-mini", mode="free", logprobs=False,
+                             stream=False, pad_prefix=False, system_message=system_prompt, options=None):
+    """
+    Send all prompts concurrently with a bounded number of in-flight requests.
 
     Args:
-        response (str): The chatbot's response
+        prompts (list): The prompts to send to the model
+        concurrency (int or AIMDController): Maximum number of requests in flight at the same time,
+            or a controller adapting it while the requests run
+        model (str): The model to use (default: gpt-4o-mini)
+        mode (str): Classification mode limiting the output (default: free)
+        logprobs (bool): Whether to also return the intent distributions
+        stream (bool): Whether to stream the responses and stop reading once the label is known
+        pad_prefix (bool): Whether to pad the system message to the prompt cache threshold
+        system_message (str): The system message to use, or None to send only the prompts
+        options (SendOptions): Few-shot examples, hedge policy, circuit breaker and fallback (default: none)
 
     Returns:
-        str: The extracted intention number or None if not found
-    """
-    # Look for patterns like "INTENTION: #16 - Request room cleaning" or variations
-    lines = response.split('\n')
-    for line in lines:
-        if "INTENTION:" in line or "intention:" in line:
-            parts = line.split('#')
-            if len(parts) > 1:
-                # Extract the number and text after the #
-                intention_part = parts[1].strip()
-                # If there's a space or dash, get just the number
-                if ' ' in intention_part:
-                    intention_number = intention_part.split(' ')[0]
-                elif '-' in intention_part:
-                    intention_number = intention_part.split('-')[0]
-                else:
-                    intention_number = intention_part
-                return intention_number.strip()
-
-    # If the above doesn't work, try to find any number preceded by #
-    import re
-    match = re.search(r'#(\d+)', response)
-    if match:
-        return match.group(1)
-
-    return None
+        list: The model's responses, in the same order as the prompts
+    """
+    if isinstance(concurrency, AIMDController):
+        semaphore = concurrency
+    else:
+        semaphore = asyncio.Semaphore(concurrency)
+    completed = 0
+
+    async def send_one(prompt):
+        nonlocal completed
+        response = await send_prompt_to_gpt_async(prompt, semaphore, system_message, model=model, mode=mode,
+                                                  logprobs=logprobs, stream=stream, pad_prefix=pad_prefix,
+                                                  options=options)
+        completed += 1
+        print(f"Completed {completed}/{len(prompts)}")
+        return response
+
+    # gather returns results in the order of the awaitables, not in completion order
+    return await asyncio.gather(*(send_one(prompt) for prompt in prompts))
+
+def send_prompts_batch(prompts, poll_interval=30, batch_id=None, model="gpt-4o-mini", mode="free", logprobs=False,
+                       pad_prefix=False, system_message=system_prompt, options=None):
+    """
+    Send all prompts through the Batch API and wait for the results.
+
+    Prompts with a cached response are not included in the batch.
+
+    Args:
+        prompts (list): The prompts to send to the model
+        poll_interval (float): Seconds to wait between batch status checks
+        batch_id (str): ID of an already submitted batch to resume instead of submitting a new one
+        model (str): The model to use (default: gpt-4o-mini)
+        mode (str): Classification mode limiting the output (default: free)
+        logprobs (bool): Whether to also return the intent distributions
+        pad_prefix (bool): Whether to pad the system message to the prompt cache threshold
+        system_message (str): The system message to use, or None to send only the prompts
+        options (SendOptions): Optional features; only the few-shot examples apply to batches
+
+    Returns:
+        list: The model's responses, in the same order as the prompts
+    """
+    requests = [build_request(prompt, system_message, model, mode, logprobs, pad_prefix, options)
+                for prompt in prompts]
+    responses = [response_cache.get(request) for request in requests]
+    pending = [i for i, response in enumerate(responses) if response is None]
+
+    if not pending:
+        print("All responses found in the response cache, nothing to submit")
+        return responses
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    batch_responses = run_batch(
+        client,
+        [requests[i] for i in pending],
+        f"batch_input_{timestamp}.jsonl",
+        poll_interval=poll_interval,
+        batch_id=batch_id,
+        parse_body=lambda body: response_value(body, logprobs)
+    )
+
+    for i, response in zip(pending, batch_responses):
+        responses[i] = response
+        if not (isinstance(response, str) and response.startswith("Error:")):
+            response_cache.put(requests[i], response)
+
+    return responses
+
+def format_stream_summary(summary):
+    """Format the TTFB and time-to-label percentiles of a streamed run"""
+    ttfb = summary["ttfb"]
+    time_to_label = summary["time_to_label"]
+    return (f"Streaming: {summary['stopped_early']}/{summary['streamed']} stopped early; "
+            f"TTFB p50 {format_seconds(ttfb['p50'])}, p95 {format_seconds(ttfb['p95'])}; "
+            f"time to label p50 {format_seconds(time_to_label['p50'])}, p95 {format_seconds(time_to_label['p95'])}")
+
+def parse_concurrency(value):
+    """
+    Parse --concurrency: "auto" or a positive number of in-flight requests.
+
+    Returns:
+        str or int: "auto" or the number
+    """
+    if value == "auto":
+        return value
+    try:
+        concurrency = int(value)
+    except ValueError:
+        concurrency = 0
+    if concurrency < 1:
+        raise argparse.ArgumentTypeError(f'Expected "auto" or a number of at least 1: {value}')
+    return concurrency
 
 def main():
+    parser = argparse.ArgumentParser(description='Test hospitality chatbot intent classification')
+    parser.add_argument('--async', dest='run_async', action='store_true',
+                        help='Send requests concurrently with the async client')
+    parser.add_argument('--concurrency', type=parse_concurrency, default=10,
+                        help='Maximum number of in-flight requests in async mode, or "auto" to adapt it '
+                             'with an AIMD controller (default: 10)')
+    parser.add_argument('--batch', action='store_true',
+                        help='Send all requests through the Batch API and wait for the results')
+    parser.add_argument('--batch-id', type=str,
+                        help='Resume polling an already submitted batch instead of submitting a new one')
+    parser.add_argument('--poll-interval', type=float, default=30,
+                        help='Seconds between batch status checks (default: 30)')
+    parser.add_argument('--model', type=str, default='gpt-4o-mini', help='Model to test (default: gpt-4o-mini)')
+    parser.add_argument('--mode', type=str, default='free', choices=CLASSIFICATION_MODES,
+                        help='Classification mode limiting the output to the label space (default: free)')
+    parser.add_argument('--logprobs', action='store_true',
+                        help='Request token log probabilities and report the intent distribution of each message')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Bypass the on-disk response cache')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream responses, stop reading once the label is known and report TTFB and time-to-label')
+    parser.add_argument('--pad-prefix', action='store_true',
+                        help='Pad the system prompt to the 1024-token prompt cache threshold')
+    parser.add_argument('--prompt-style', type=str, default='full', choices=list(PROMPT_STYLES),
+                        help='Instructions sent with each message; use the style the model was fine-tuned with '
+                             '(default: full)')
+    parser.add_argument('--prompt-variant', type=str,
+                        help='Shortened system prompt stored by compress_prompt.py --save, used with --prompt-style full')
+    parser.add_argument('--pack', type=int, default=1,
+                        help='Classify this many numbered messages per request from a JSON array response, retrying '
+                             'missing or malformed slots one by one (default: 1, one message per request)')
+    parser.add_argument('--fast-path', type=float, metavar='THRESHOLD',
+                        help='Answer messages locally with the lexical classifier when its confidence is at least '
+                             'THRESHOLD, and only send the others to the API')
+    parser.add_argument('--fast-path-model', type=str, default=DEFAULT_MODEL_FILE,
+                        help=f'Model trained with lexical_classifier.py --train (default: {DEFAULT_MODEL_FILE})')
+    parser.add_argument('--few-shot', type=int, default=0, metavar='K',
+                        help='Add the K most similar labelled examples to every request as few-shot turns')
+    parser.add_argument('--few-shot-files', type=str, nargs='+', default=DEFAULT_TRAINING_FILES,
+                        help='Labelled messages to retrieve the examples from (default: tests400.jsonl); they must '
+                             'not contain the test messages')
+    parser.add_argument('--hedge', type=float, metavar='PERCENTILE',
+                        help='In async mode, send a duplicate of requests slower than this percentile of recent '
+                             'latency and keep the first valid answer (e.g. 95)')
+    parser.add_argument('--hedge-budget', type=float, default=DEFAULT_MAX_EXTRA_RATE,
+                        help=f'Most duplicate requests per request with --hedge (default: {DEFAULT_MAX_EXTRA_RATE})')
+    parser.add_argument('--circuit-breaker', action='store_true',
+                        help='Stop sending to the model while its error rate or latency is degraded and answer from '
+                             '--fallback-model, else from the local classifier if it was trained')
+    parser.add_argument('--fallback-model', type=str,
+                        help='Model answering while the circuit breaker is open (default: the local classifier)')
+    parser.add_argument('--breaker-slow-call', type=float, default=DEFAULT_SLOW_CALL,
+                        help=f'Seconds after which a call counts as slow (default: {DEFAULT_SLOW_CALL})')
+    parser.add_argument('--breaker-open-seconds', type=float, default=DEFAULT_OPEN_SECONDS,
+                        help=f'Seconds the breaker stays open before probing the model '
+                             f'(default: {DEFAULT_OPEN_SECONDS})')
+    args = parser.parse_args()
+
+    if args.pack < 1:
+        parser.error("--pack must be at least 1")
+    if args.circuit_breaker and (args.stream or args.batch or args.batch_id or args.pack > 1 or args.hedge is not None):
+        parser.error("--circuit-breaker cannot be combined with --stream, --batch, --batch-id, --pack or --hedge")
+    if args.hedge is not None and (not args.run_async or args.stream):
+        parser.error("--hedge needs --async and cannot be combined with --stream")
+    if args.stream and (args.batch or args.batch_id or args.logprobs):
+        parser.error("--stream cannot be combined with --batch, --batch-id or --logprobs")
+    if args.pack > 1 and (args.batch or args.batch_id or args.run_async or args.stream or args.logprobs
+                          or args.mode != "free" or args.prompt_style == "none" or args.few_shot):
+        parser.error("--pack cannot be combined with --batch, --batch-id, --async, --stream, --logprobs, "
+                     "other modes than free, --prompt-style none or --few-shot")
+
+    response_cache.bypass = args.no_cache
+    options = SendOptions()
+
+    if args.hedge is not None:
+        options.hedge_policy = HedgePolicy(args.hedge, max_extra_rate=args.hedge_budget)
+
+    if args.circuit_breaker:
+        options.circuit_breaker = CircuitBreaker(args.model, slow_call=args.breaker_slow_call,
+                                                 open_seconds=args.breaker_open_seconds)
+        options.fallback_model = args.fallback_model
+        if options.fallback_model is None and os.path.exists(args.fast_path_model):
+            options.fallback_classifier = LexicalClassifier.load(args.fast_path_model)
+        fallback = options.fallback_model or ("local classifier" if options.fallback_classifier else "none")
+        print(f"Circuit breaker on {args.model}, fallback: {fallback}")
+
+    if args.few_shot > 0:
+        options.few_shot_index = FewShotIndex.from_files(args.few_shot_files)
+        options.few_shot_k = args.few_shot
+        print(f"Few-shot: {options.few_shot_k} examples per message from an index of "
+              f"{len(options.few_shot_index.messages)} messages, "
+              f"built in {options.few_shot_index.build_time * 1000:.1f}ms")
+
     # Timestamp for the results file
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     results_file = f"hospitality_chatbot_test_results_{timestamp}.txt"
 
+    # Models fine-tuned without the list of intentions get the minimal instruction or only the message
+    full_prompt = select_prompt(args.prompt_variant, system_prompt)
+    system_message = {"full": full_prompt, "minimal": MINIMAL_PROMPT, "none": None}[args.prompt_style]
+    prefix = get_prompt_prefix(system_message, pad=args.pad_prefix, model=args.model) if system_message else None
+    variant_label = f", variant {args.prompt_variant}" if args.prompt_variant else ""
+    few_shot_label = f", {options.few_shot_k} retrieved examples" if options.few_shot_k else ""
+    prompt_description = (f"{prefix.describe() if prefix else 'no system prompt'} "
+                          f"(prompt style: {args.prompt_style}{variant_label}{few_shot_label})")
     print(f"Testing hospitality chatbot with {len(vague_messages)} vague messages...")
+    print(f"Using {prompt_description}")
     print(f"Results will be saved to {results_file}")
 
+    start_time = time.time()
+
+    # In async and batch mode all responses are collected up front, in input order
+    responses = None
+    controller = None
+    packing_summary = None
+
+    # Messages the lexical classifier is confident about are answered locally, without an API call
+    fast_path = {}
+    if args.fast_path is not None:
+        classifier = LexicalClassifier.load(args.fast_path_model)
+        for i, message in enumerate(vague_messages):
+            label, confidence = classifier.predict(message)
+            if confidence >= args.fast_path:
+                fast_path[i] = label
+        print(f"Fast path: {len(fast_path)} of {len(vague_messages)} messages answered locally "
+              f"(confidence >= {args.fast_path})")
+    remote_messages = [message for i, message in enumerate(vague_messages) if i not in fast_path]
+
+    if args.pack > 1:
+        print(f"Sending {args.pack} messages per request...")
+        responses, packing_summary = classify_packed(client, remote_messages, system_message, args.model, args.pack,
+                                                     args.pad_prefix)
+        print(format_packing_summary(packing_summary))
+    elif args.batch or args.batch_id:
+        print("Sending requests through the Batch API...")
+        responses = send_prompts_batch(remote_messages, args.poll_interval, args.batch_id, args.model, args.mode,
+                                       args.logprobs, args.pad_prefix, system_message, options)
+    elif args.run_async:
+        print(f"Sending requests asynchronously with concurrency {args.concurrency}...")
+        if args.concurrency == "auto":
+            controller = AIMDController(throttle_counter=lambda: rate_limiter_for(args.model).stats["throttled"])
+        concurrency = controller if controller else args.concurrency
+        responses = asyncio.run(send_prompts_async(remote_messages, concurrency, args.model, args.mode,
+                                                   args.logprobs, args.stream, args.pad_prefix, system_message,
+                                                   options))
+        if controller:
+            controller.print_summary()
+        if options.hedge_policy:
+            print(format_hedging_summary(options.hedge_policy.summary()))
+
+    # Put the API responses back in input order around the local answers
+    if responses is not None and fast_path:
+        remote_responses = iter(responses)
+        responses = [fast_path[i] if i in fast_path else next(remote_responses) for i in range(len(vague_messages))]
+
     # Dictionary to store results
     results = {
         "total_messages": len(vague_messages),
@@ -179,8 +649,18 @@ def main():
         correct_name = intention_names.get(int(correct_number), "Unknown")
         correct_mapping_str = f"{correct_number} - {correct_name}"
 
-        # Send the message to the chatbot
-        response = send_prompt_to_gpt(message)
+        # Send the message to the chatbot, unless it was already sent in async or batch mode
+        if i in fast_path:
+            response = fast_path[i]
+        elif responses is not None:
+            response = responses[i]
+        else:
+            response = send_prompt_to_gpt(message, system_message, model=args.model, mode=args.mode,
+                                          logprobs=args.logprobs, stream=args.stream, pad_prefix=args.pad_prefix,
+                                          options=options)
+        stream_timing = response.get("stream") if isinstance(response, dict) else None
+        fallback = response.get("fallback") if isinstance(response, dict) else None
+        response, distribution = split_response(response)
 
         # Extract the intention from the response
         extracted_intention = extract_intention(response)
@@ -194,6 +674,10 @@ def main():
             "correct_mapping": correct_mapping_str,
             "chatbot_response": response,
             "extracted_intention": extracted_intention,
+            "intent_distribution": distribution,
+            "stream": stream_timing,
+            "fast_path": i in fast_path,
+            "fallback": fallback,
             "is_correct": is_correct
         }
 
@@ -208,30 +692,101 @@ def main():
         print(f"Message: {message}")
         print(f"Correct mapping: {correct_mapping_str}")
         print(f"Extracted intention: {extracted_intention}")
+        if args.logprobs:
+            print(f"Intent distribution: {format_distribution(distribution)}")
+        if stream_timing:
+            print(f"TTFB: {format_seconds(stream_timing['ttfb'])}, "
+                  f"time to label: {format_seconds(stream_timing['time_to_label'])}")
         print(f"Is correct: {is_correct}")
 
     # Calculate accuracy
     accuracy = results["correct_mappings"] / results["total_messages"] if results["total_messages"] > 0 else 0
     results["accuracy"] = accuracy
+    elapsed = time.time() - start_time
+
+    stream_summary = None
+    if args.stream:
+        timings = [result["stream"] for result in results["detailed_results"] if result["stream"]]
+        stream_summary = {
+            "ttfb": summarize_latencies([timing["ttfb"] for timing in timings if timing["ttfb"] is not None]),
+            "time_to_label": summarize_latencies([timing["time_to_label"] for timing in timings]),
+            "stopped_early": sum(timing["stopped_early"] for timing in timings),
+            "streamed": len(timings)
+        }
 
     # Save results to file
     with open(results_file, 'w') as f:
         f.write(f"Hospitality Chatbot Test Results - {timestamp}\n")
+        f.write(f"Model: {args.model} (mode: {args.mode})\n")
         f.write(f"Total messages: {results['total_messages']}\n")
         f.write(f"Correct mappings: {results['correct_mappings']}\n")
         f.write(f"Incorrect mappings: {results['incorrect_mappings']}\n")
-        f.write(f"Accuracy: {accuracy:.2%}\n\n")
+        f.write(f"Accuracy: {accuracy:.2%}\n")
+        f.write(f"Elapsed time: {elapsed:.1f}s\n\n")
+
+        if stream_summary:
+            f.write(format_stream_summary(stream_summary) + "\n\n")
+
+        if packing_summary:
+            f.write(format_packing_summary(packing_summary) + "\n\n")
+
+        if options.hedge_policy:
+            f.write(format_hedging_summary(options.hedge_policy.summary()) + "\n\n")
+
+        if options.circuit_breaker:
+            f.write(format_breaker_summary(options.circuit_breaker.summary()) + "\n")
+            for transition in options.circuit_breaker.summary()["transitions"]:
+                f.write(f"  {datetime.fromtimestamp(transition['time']).strftime('%H:%M:%S')} "
+                        f"{transition['from']} -> {transition['to']} ({transition['reason']})\n")
+            f.write("\n")
+
+        if args.fast_path is not None:
+            local = [result for result in results["detailed_results"] if result["fast_path"]]
+            local_correct = sum(result["is_correct"] for result in local)
+            f.write(f"Fast path (confidence >= {args.fast_path}): {len(local)} of {len(vague_messages)} messages "
+                    f"answered locally, {local_correct / len(local) if local else 0:.2%} of them correct\n\n")
+
+        f.write(f"Using {prompt_description}\n")
+        for summary in prompt_cache_summaries():
+            f.write(format_prompt_cache_summary(summary) + "\n")
+        f.write("\n")
+
+        if controller:
+            summary = controller.summary()
+            f.write(f"AIMD: {summary['rps']:.2f} RPS, mean concurrency {summary['mean_concurrency']:.1f}, "
+                    f"final concurrency {summary['final_concurrency']}\n")
+            for entry in summary["history"]:
+                f.write(f"  t={entry['elapsed']:.1f}s concurrency {entry['concurrency']} -> {entry['next_concurrency']}, "
+                        f"{entry['rps']:.2f} RPS, p50 latency {entry['p50_latency']:.2f}s, "
+                        f"{entry['throttled']} throttled\n")
+            f.write("\n")
 
         for i, result in enumerate(results["detailed_results"]):
             f.write(f"=== Message {i+1} ===\n")
             f.write(f"Message: {result['message']}\n")
             f.write(f"Correct mapping: {result['correct_mapping']}\n")
             f.write(f"Extracted intention: {result['extracted_intention']}\n")
+            if args.logprobs:
+                f.write(f"Intent distribution: {format_distribution(result['intent_distribution'])}\n")
+            if result["stream"]:
+                f.write(f"TTFB: {format_seconds(result['stream']['ttfb'])}, "
+                        f"time to label: {format_seconds(result['stream']['time_to_label'])}, "
+                        f"stopped early: {result['stream']['stopped_early']}\n")
+            if result["fallback"]:
+                f.write(f"Answered by the fallback: {result['fallback']}\n")
             f.write(f"Is correct: {result['is_correct']}\n")
             f.write(f"Chatbot response:\n{result['chatbot_response']}\n\n")
 
     print(f"\nTesting completed!")
     print(f"Accuracy: {accuracy:.2%}")
+    print(f"Elapsed time: {elapsed:.1f}s")
+    if stream_summary:
+        print(format_stream_summary(stream_summary))
+    if options.circuit_breaker:
+        print(format_breaker_summary(options.circuit_breaker.summary()))
+    response_cache.print_stats()
+    print_rate_limit_stats()
+    print_prompt_cache_stats()
     print(f"Complete results saved to {results_file}")
 
 if __name__ == "__main__":
@@ -0,0 +1,180 @@
+import time
+import asyncio
+from collections import deque
+from latency_stats import summarize_latencies, format_seconds
+from rate_limiter import create_chat_completion_async
+
+# Warm-up and keep-alive of fine-tuned model deployments: the first calls to a fine-tuned model after a
+# quiet period are much slower than steady traffic (the deployment is cold, and the pooled connections
+# to the API have expired). A ModelWarmer sends a few synthetic classifications when it starts, then a
+# keep-alive round whenever a registered model had no call for the ping interval, so the first guest
+# after quiet hours gets warm latency. Real traffic counts as keep-alive, so pings only fill idle gaps.
+
+# Seconds without calls after which a keep-alive round is sent; below the keep-alive expiry of the
+# pooled client (60s), so its connections are never closed for being idle
+DEFAULT_PING_INTERVAL = 30.0
+
+# Seconds without calls after which a model counts as cold when its latency is recorded
+DEFAULT_COLD_AFTER = 300.0
+
+# Rounds sent to every model on start, and the concurrent calls per round; each concurrent call
+# needs its own connection, so this many pooled connections are kept warm
+DEFAULT_WARMUP_ROUNDS = 3
+DEFAULT_CONNECTIONS = 2
+
+# Latencies kept per model and kind of call
+LATENCY_WINDOW = 1000
+
+# Synthetic guest messages of the warm-up and keep-alive calls, used in turn
+WARMUP_MESSAGES = [
+    "What time is breakfast served?",
+    "Can I get extra towels please?",
+    "Is there parking at the hotel?",
+]
+
+
+class ModelWarmer:
+    """
+    Keeps registered models and the pooled connections to them warm with a synthetic request schedule,
+    and records the latency of calls after an idle period (cold) apart from the others (warm).
+
+    Calls wrapped in call() are measured and count as traffic. Without run() the warmer only measures,
+    which quantifies the cold-start spikes before keep-alive is turned on.
+    """
+
+    def __init__(self, client, build_request, interval=DEFAULT_PING_INTERVAL, cold_after=DEFAULT_COLD_AFTER,
+                 warmup_rounds=DEFAULT_WARMUP_ROUNDS, connections=DEFAULT_CONNECTIONS, messages=None):
+        """
+        Args:
+            client (openai.AsyncOpenAI): Pooled async client the traffic goes through, so its connections are warmed
+            build_request (callable): build_request(message, model) returns the chat completion request; use the
+                one of the real traffic, so the synthetic calls also warm its prompt prefix
+            interval (float): Seconds without calls to a model after which a keep-alive round is sent
+            cold_after (float): Seconds without calls after which the next call counts as cold
+            warmup_rounds (int): Rounds of calls sent to every model on start
+            connections (int): Concurrent calls per round
+            messages (list): Synthetic guest messages (default: WARMUP_MESSAGES)
+        """
+        self.client = client
+        self.build_request = build_request
+        self.interval = interval
+        self.cold_after = cold_after
+        self.warmup_rounds = warmup_rounds
+        self.connections = connections
+        self.messages = messages or WARMUP_MESSAGES
+        self.models = {}
+        self.sent = 0
+
+    def register(self, model):
+        """Register a model to measure and, while run() is running, keep warm"""
+        if model not in self.models:
+            self.models[model] = {
+                "last_used": None,
+                "cold": deque(maxlen=LATENCY_WINDOW),
+                "warm": deque(maxlen=LATENCY_WINDOW),
+                "synthetic": deque(maxlen=LATENCY_WINDOW),
+                "stats": {"calls": 0, "cold_calls": 0, "warmup_calls": 0, "pings": 0, "synthetic_errors": 0}
+            }
+
+    def is_cold(self, model):
+        """Whether a registered model had no call for cold_after seconds, or none yet"""
+        last_used = self.models[model]["last_used"]
+        return last_used is None or time.monotonic() - last_used >= self.cold_after
+
+    async def call(self, model, send, synthetic=False):
+        """
+        Run a call to a model, recording its latency as cold or warm.
+
+        Args:
+            model (str): The model called; calls to unregistered models are passed through
+            send (callable): Returns the awaitable of the call
+            synthetic (bool): Whether it is a warm-up or keep-alive call, recorded apart from the traffic
+
+        Returns:
+            The result of the call
+        """
+        entry = self.models.get(model)
+        if entry is None:
+            return await send()
+        cold = self.is_cold(model)
+        # Marked at the start, so the calls arriving while a cold call is running count as warm
+        entry["last_used"] = time.monotonic()
+        start_time = time.perf_counter()
+        result = await send()
+        latency = time.perf_counter() - start_time
+        entry["last_used"] = time.monotonic()
+
+        if synthetic:
+            entry["synthetic"].append(latency)
+        else:
+            entry["stats"]["calls"] += 1
+            entry["stats"]["cold_calls"] += cold
+            entry["cold" if cold else "warm"].append(latency)
+        return result
+
+    async def _send_round(self, model, kind):
+        """Send one round of concurrent synthetic calls to a model"""
+        entry = self.models[model]
+
+        async def send_one(index):
+            message = self.messages[(self.sent + index) % len(self.messages)]
+            request = self.build_request(message, model)
+            try:
+                # Not retried: the next round follows soon enough
+                await self.call(model, lambda: create_chat_completion_async(self.client, request, 0), True)
+            except Exception:
+                entry["stats"]["synthetic_errors"] += 1
+
+        entry["stats"][kind] += self.connections
+        await asyncio.gather(*(send_one(index) for index in range(self.connections)))
+        self.sent += self.connections
+
+    async def warm_up(self):
+        """Send the warm-up rounds to every registered model, e.g. before the service takes traffic"""
+        async def warm_up_model(model):
+            for _ in range(self.warmup_rounds):
+                await self._send_round(model, "warmup_calls")
+
+        await asyncio.gather(*(warm_up_model(model) for model in self.models))
+
+    async def run(self):
+        """Send a keep-alive round to every model idle for the ping interval, until cancelled"""
+        while self.models:
+            now = time.monotonic()
+            idle = [model for model, entry in self.models.items()
+                    if entry["last_used"] is None or now - entry["last_used"] >= self.interval]
+            await asyncio.gather(*(self._send_round(model, "pings") for model in idle))
+
+            next_ping = min((entry["last_used"] or now) + self.interval for entry in self.models.values())
+            await asyncio.sleep(max(next_ping - time.monotonic(), 0.1))
+
+    def summary(self):
+        """
+        Summarize the cold and warm latency of every model.
+
+        Returns:
+            dict: model -> counters, latency summaries (seconds) of the cold, warm and synthetic calls,
+                and cold_penalty, the p50 of the cold calls minus the p50 of the warm calls
+        """
+        summary = {}
+        for model, entry in self.models.items():
+            cold = summarize_latencies(list(entry["cold"]))
+            warm = summarize_latencies(list(entry["warm"]))
+            summary[model] = dict(
+                entry["stats"],
+                cold=cold,
+                warm=warm,
+                synthetic=summarize_latencies(list(entry["synthetic"])),
+                cold_penalty=cold["p50"] - warm["p50"] if cold["count"] and warm["count"] else None,
+                idle_seconds=time.monotonic() - entry["last_used"] if entry["last_used"] is not None else None
+            )
+        return summary
+
+
+def format_warmup_summary(model, summary):
+    """Format the cold and warm latency and the synthetic calls of a model for reports"""
+    return (f"{model}: {summary['cold_calls']} of {summary['calls']} calls cold "
+            f"(p50 {format_seconds(summary['cold']['p50'])}, max {format_seconds(summary['cold']['max'])}), "
+            f"warm p50 {format_seconds(summary['warm']['p50'])}, p99 {format_seconds(summary['warm']['p99'])}; "
+            f"{summary['warmup_calls']} warm-up and {summary['pings']} keep-alive calls "
+            f"({summary['synthetic_errors']} failed)")